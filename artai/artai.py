@@ -2,15 +2,27 @@ from krita import *
 from krita import Krita
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
-from PyQt5.QtGui import QImage, QColor
+from PyQt5.QtGui import QTextCursor
 from PyQt5.QtCore import QRect
-import json
-import ssl
-import urllib.request
-import base64
-import tempfile
-import io
 import os
+import time
+import hashlib
+from collections import OrderedDict
+from .backends import LocalBackend, backend_names, get_backend
+from .engine import EngineWorker
+from .result_cache import ResultCache, make_key
+from .scheduler import JobScheduler
+from .tiling import plan_tiles, paste_tile, TILE_SIZE
+from .metrics import MetricsLog, STAGES, new_record, add_http_timings
+from .layer_model import LayerTreeModel, node_key
+from .prefetch import DailyBudget, PrefetchSlot
+from .imaging import (build_mask_image, composite_layers, encode_png, decode_png, codec_stats,
+                      choose_api_size, crop_region, fit_image, layer_pixels, pixels_image,
+                      downscale, encode_for_critique, GENERATE_SIZES, EDIT_SIZES)
+
+# Upper bound for the "Candidates" control and for concurrent image requests
+MAX_CANDIDATES = 4
+PREPARED_CRITIQUE_IMAGES = 4    # downscaled/encoded renders kept for repeat critiques
 
 class ArtAI(Extension):
     def __init__(self, parent):
@@ -59,6 +71,26 @@ class ArtAIDocker(DockWidget):
         self.apiKeyEdit.setEchoMode(QLineEdit.Password)
         layout.addWidget(self.apiKeyEdit)
         
+        # Service the requests go to; the local stand-in needs no key or network
+        layout.addWidget(QLabel("Backend:"))
+        self.backendCombo = QComboBox()
+        self.backendCombo.addItems(backend_names())
+        self.backendCombo.currentTextChanged.connect(self.onBackendChanged)
+        layout.addWidget(self.backendCombo)
+        self.latencyFrame = QFrame()
+        latencyLayout = QHBoxLayout(self.latencyFrame)
+        latencyLayout.setContentsMargins(0, 0, 0, 0)
+        latencyLayout.addWidget(QLabel("Simulated latency:"))
+        self.latencySpin = QDoubleSpinBox()
+        self.latencySpin.setRange(0.0, 60.0)
+        self.latencySpin.setSingleStep(0.1)
+        self.latencySpin.setValue(0.5)
+        self.latencySpin.setSuffix(" s")
+        self.latencySpin.valueChanged.connect(self.onBackendChanged)
+        latencyLayout.addWidget(self.latencySpin)
+        layout.addWidget(self.latencyFrame)
+        self.latencyFrame.hide()
+        
         # Mode selection
         layout.addWidget(QLabel("Mode:"))
         self.modeCombo = QComboBox()
@@ -83,6 +115,11 @@ class ArtAIDocker(DockWidget):
         self.maskToggle.clicked.connect(self.onMaskToggle)
         maskLayout.addWidget(self.maskToggle)
         
+        # Send only the padded mask area instead of the whole canvas
+        self.cropToMaskCheck = QCheckBox("Crop to mask area")
+        self.cropToMaskCheck.setChecked(True)
+        maskLayout.addWidget(self.cropToMaskCheck)
+        
         layout.addWidget(self.maskFrame)
         self.maskFrame.hide()  # Hidden by default
         
@@ -98,18 +135,78 @@ class ArtAIDocker(DockWidget):
         refreshBtn.clicked.connect(self.updateLayerList)
         layerLayout.addWidget(refreshBtn)
         
-        self.layerScrollArea = QScrollArea()
-        self.layerScrollArea.setMaximumHeight(150)
-        self.layerScrollArea.setWidgetResizable(True)
-        self.layerWidget = QWidget()
-        self.layerLayout = QVBoxLayout(self.layerWidget)
-        self.layerScrollArea.setWidget(self.layerWidget)
-        layerLayout.addWidget(self.layerScrollArea)
+        # Model/view tree: groups load on expand, refreshes only touch changed rows
+        self.layerModel = LayerTreeModel(self)
+        self.layerView = QTreeView()
+        self.layerView.setModel(self.layerModel)
+        self.layerView.setHeaderHidden(True)
+        self.layerView.setUniformRowHeights(True)
+        self.layerView.setMaximumHeight(150)
+        layerLayout.addWidget(self.layerView)
         
         layout.addWidget(self.layerFrame)
         self.layerFrame.hide()  # Hidden by default
         
-        self.layerCheckboxes = []
+        
+        # Result cache: repeated prompts / unchanged canvases return instantly
+        self.resultCache = ResultCache(os.path.join(Krita.instance().getAppDataLocation(), "artai_cache"))
+        cacheLayout = QHBoxLayout()
+        self.bypassCacheCheck = QCheckBox("Bypass cache")
+        cacheLayout.addWidget(self.bypassCacheCheck)
+        self.cacheLabel = QLabel()
+        cacheLayout.addWidget(self.cacheLabel)
+        layout.addLayout(cacheLayout)
+        self.updateCacheLabel()
+        
+        # Number of candidates generated side by side (Generate/Vary/Edit)
+        candidatesLayout = QHBoxLayout()
+        candidatesLayout.addWidget(QLabel("Candidates:"))
+        self.candidatesSpin = QSpinBox()
+        self.candidatesSpin.setRange(1, MAX_CANDIDATES)
+        candidatesLayout.addWidget(self.candidatesSpin)
+        layout.addLayout(candidatesLayout)
+        
+        # Full-resolution Vary/Edit for canvases larger than the API size
+        self.tiledCheck = QCheckBox(f"Tiled ({TILE_SIZE}px tiles, full resolution)")
+        layout.addWidget(self.tiledCheck)
+        self.tiledCheck.hide()
+        
+        # Speculative Vary: request a variation while the canvas sits idle (opt-in)
+        self.prefetchFrame = QFrame()
+        prefetchLayout = QGridLayout(self.prefetchFrame)
+        prefetchLayout.setContentsMargins(0, 0, 0, 0)
+        self.prefetchCheck = QCheckBox("Prefetch a variation when idle for")
+        self.prefetchCheck.toggled.connect(self.onPrefetchToggled)
+        prefetchLayout.addWidget(self.prefetchCheck, 0, 0)
+        self.prefetchIdleSpin = QSpinBox()
+        self.prefetchIdleSpin.setRange(5, 600)
+        self.prefetchIdleSpin.setValue(30)
+        self.prefetchIdleSpin.setSuffix(" s")
+        prefetchLayout.addWidget(self.prefetchIdleSpin, 0, 1)
+        prefetchLayout.addWidget(QLabel("Daily budget:"), 1, 0)
+        self.prefetchBudgetSpin = QSpinBox()
+        self.prefetchBudgetSpin.setRange(1, 500)
+        self.prefetchBudgetSpin.setValue(20)
+        self.prefetchBudgetSpin.setSuffix(" requests")
+        prefetchLayout.addWidget(self.prefetchBudgetSpin, 1, 1)
+        self.prefetchLabel = QLabel()
+        prefetchLayout.addWidget(self.prefetchLabel, 2, 0, 1, 2)
+        layout.addWidget(self.prefetchFrame)
+        self.prefetchFrame.hide()
+        
+        self.prefetchBudget = DailyBudget(
+            os.path.join(Krita.instance().getAppDataLocation(), "artai_prefetch_budget.json"),
+            self.prefetchBudgetSpin.value())
+        self.prefetchBudgetSpin.valueChanged.connect(self.onPrefetchBudgetChanged)
+        self.prefetchSlot = PrefetchSlot()
+        self.prefetchJob = None
+        self.idleFingerprint = None     # cheap canvas fingerprint, to notice edits
+        self.idleSince = time.monotonic()
+        self.prefetchedFingerprint = None
+        self.prefetchTimer = QTimer(self)
+        self.prefetchTimer.setInterval(2000)
+        self.prefetchTimer.timeout.connect(self.checkIdleCanvas)
+        self.updatePrefetchLabel()
         
         # Generate button
         self.generateButton = QPushButton("Generate")
@@ -122,6 +219,40 @@ class ArtAIDocker(DockWidget):
         layout.addWidget(self.critiqueButton)
         self.critiqueButton.hide()
         
+        self.streamCritiqueCheck = QCheckBox("Stream critique as it is written")
+        self.streamCritiqueCheck.setChecked(True)
+        layout.addWidget(self.streamCritiqueCheck)
+        self.streamCritiqueCheck.hide()
+        
+        # How the canvas is shrunk and encoded before it is sent for critique
+        self.critiqueOptionsFrame = QFrame()
+        critiqueOptions = QGridLayout(self.critiqueOptionsFrame)
+        critiqueOptions.setContentsMargins(0, 0, 0, 0)
+        critiqueOptions.addWidget(QLabel("Max size:"), 0, 0)
+        self.critiqueMaxDimSpin = QSpinBox()
+        self.critiqueMaxDimSpin.setRange(256, 4096)
+        self.critiqueMaxDimSpin.setSingleStep(256)
+        self.critiqueMaxDimSpin.setValue(1024)
+        self.critiqueMaxDimSpin.setSuffix(" px")
+        critiqueOptions.addWidget(self.critiqueMaxDimSpin, 0, 1)
+        critiqueOptions.addWidget(QLabel("Detail:"), 0, 2)
+        self.critiqueDetailCombo = QComboBox()
+        self.critiqueDetailCombo.addItems(["auto", "low", "high"])
+        critiqueOptions.addWidget(self.critiqueDetailCombo, 0, 3)
+        critiqueOptions.addWidget(QLabel("Format:"), 1, 0)
+        self.critiqueFormatCombo = QComboBox()
+        self.critiqueFormatCombo.addItems(["JPEG", "WEBP", "PNG"])
+        critiqueOptions.addWidget(self.critiqueFormatCombo, 1, 1)
+        critiqueOptions.addWidget(QLabel("Quality:"), 1, 2)
+        self.critiqueQualitySpin = QSpinBox()
+        self.critiqueQualitySpin.setRange(1, 100)
+        self.critiqueQualitySpin.setValue(85)
+        critiqueOptions.addWidget(self.critiqueQualitySpin, 1, 3)
+        layout.addWidget(self.critiqueOptionsFrame)
+        self.critiqueOptionsFrame.hide()
+        self.preparedCritiqueImages = OrderedDict()     # (canvas state, settings) -> (bytes, mime, w, h)
+        self.critiqueRequest = None     # {"job": ...} of the critique shown in the result box
+        
         # Critique result area (hidden by default)
         self.critiqueFrame = QFrame()
         critiqueLayout = QVBoxLayout(self.critiqueFrame)
@@ -137,41 +268,51 @@ class ArtAIDocker(DockWidget):
         layout.addWidget(self.critiqueFrame)
         self.critiqueFrame.hide()  # Hidden by default
         
+        # Request queue: rate limited, retried and coalesced by the scheduler
+        self.scheduler = JobScheduler(ratePerMinute=20, burst=MAX_CANDIDATES,
+                                      maxConcurrent=MAX_CANDIDATES, parent=self)
+        self.scheduler.jobsChanged.connect(self.refreshQueueView)
+        queueHeader = QHBoxLayout()
+        queueHeader.addWidget(QLabel("Queue - max requests/min:"))
+        self.rateSpin = QSpinBox()
+        self.rateSpin.setRange(1, 120)
+        self.rateSpin.setValue(20)
+        self.rateSpin.valueChanged.connect(self.scheduler.setRatePerMinute)
+        queueHeader.addWidget(self.rateSpin)
+        layout.addLayout(queueHeader)
+        self.queueList = QListWidget()
+        self.queueList.setMaximumHeight(100)
+        layout.addWidget(self.queueList)
+        cancelJobButton = QPushButton("Cancel Job")
+        cancelJobButton.clicked.connect(self.cancelSelectedJob)
+        layout.addWidget(cancelJobButton)
+        
         # Status
         self.statusLabel = QLabel("Ready")
         layout.addWidget(self.statusLabel)
         
+        # Per-request timings (rolling file) and their p50/p95 per mode
+        self.metricsLog = MetricsLog(os.path.join(Krita.instance().getAppDataLocation(), "artai_metrics.jsonl"))
+        self.statsButton = QPushButton("Show Request Stats")
+        self.statsButton.setCheckable(True)
+        self.statsButton.toggled.connect(self.onStatsToggled)
+        layout.addWidget(self.statsButton)
+        self.statsView = QTextEdit()
+        self.statsView.setReadOnly(True)
+        self.statsView.setMaximumHeight(160)
+        layout.addWidget(self.statsView)
+        self.statsView.hide()
+        
         # Mask painting state
         self.maskPaintingActive = False
         self.maskLayer = None
         self.originalTool = None
+        self.codecStatsAtStart = dict(codec_stats)
     
     def updateLayerList(self):
-        """Update the layer checkbox list"""
-        # Clear existing checkboxes
-        for checkbox in self.layerCheckboxes:
-            checkbox.setParent(None)
-        self.layerCheckboxes.clear()
-        
+        """Sync the layer tree with the active document (only changed rows update)"""
         doc = Krita.instance().activeDocument()
-        if not doc:
-            return
-        
-        # Get all layers (excluding mask layer)
-        def addLayersRecursive(node, indent=0):
-            if node.type() == "paintlayer" and node != self.maskLayer:
-                checkbox = QCheckBox("  " * indent + node.name())
-                checkbox.setChecked(node.visible())
-                checkbox.layer = node
-                self.layerCheckboxes.append(checkbox)
-                self.layerLayout.addWidget(checkbox)
-            
-            # Add child nodes
-            for child in node.childNodes():
-                addLayersRecursive(child, indent + 1)
-        
-        # Start from root node
-        addLayersRecursive(doc.rootNode())
+        self.layerModel.setDocument(doc, excluded=[self.maskLayer])
 
     def onModeChanged(self, mode):
         if mode == "Vary":
@@ -209,6 +350,11 @@ class ArtAIDocker(DockWidget):
             self.critiqueButton.hide()
             self.critiqueFrame.hide()
         
+        self.streamCritiqueCheck.setVisible(mode == "Critique")
+        self.critiqueOptionsFrame.setVisible(mode == "Critique")
+        self.tiledCheck.setVisible(mode in ("Vary", "Edit"))
+        self.prefetchFrame.setVisible(mode == "Vary")
+        
         # Disable mask painting when switching away from Edit mode
         if mode != "Edit" and self.maskPaintingActive:
             self.disableMaskPainting()
@@ -244,99 +390,69 @@ class ArtAIDocker(DockWidget):
     def canvasChanged(self, canvas):
         pass
     
-    def getMaskImage(self, doc):
+    def getMaskImage(self, doc, region=None):
         """Create a proper mask: transparent where user painted, opaque everywhere else"""
         if not self.maskLayer:
             return None
         
-        # Get document dimensions
-        w, h = doc.width(), doc.height()
-        
-        # Get mask layer pixel data
-        pixel_data = self.maskLayer.pixelData(0, 0, w, h)
-        
-        # Create mask array - start with all opaque white (preserve everything)
-        mask_array = bytearray(w * h * 4)
-        for i in range(0, len(mask_array), 4):
-            mask_array[i:i+4] = [255, 255, 255, 255]  # White opaque
-        
-        # Convert BGRA pixel data and mark painted areas as transparent
-        pixel_array = bytearray(pixel_data)
-        
-        for i in range(0, len(pixel_array), 4):
-            # Get BGRA values from mask layer
-            b, g, r, a = pixel_array[i:i+4]
-            
-            # If there's any visible paint (any color with opacity), make it transparent in mask
-            if a > 10:  # Any visible paint on mask layer
-                # Make this area transparent (DALL-E will edit here)
-                mask_array[i:i+4] = [0, 0, 0, 0]
-        
-        # Create temporary file and save mask
-        temp_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-        temp_file.close()
-        
-        # Create QImage from mask data and save
-        qimage = QImage(bytes(mask_array), w, h, QImage.Format_ARGB32)
-        qimage.save(temp_file.name, "PNG")
-        
-        # Read the PNG data back
-        with open(temp_file.name, 'rb') as f:
-            png_data = f.read()
-        
-        # Clean up temp file
-        os.unlink(temp_file.name)
-        
-        return png_data
+        # Only the painted bounds of the mask layer are read and converted
+        return build_mask_image(self.maskLayer, doc.width(), doc.height(), region)
+    
+    def maskRegion(self, doc):
+        """Padded crop around the painted mask, or None if nothing is painted"""
+        if not self.maskLayer:
+            return None
+        bounds = self.maskLayer.bounds().intersected(QRect(0, 0, doc.width(), doc.height()))
+        if bounds.isEmpty():
+            return None
+        return crop_region(bounds, doc.width(), doc.height())
 
-    def getCurrentLayerImage(self, doc):
-        """Export selected layers (based on checkboxes) as PNG image data"""
-        # Create temporary file for export
-        temp_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-        temp_file.close()
-        
-        # Store original visibility states using layer names
-        original_states = []
-        
-        # If we're in Edit mode, use checkbox states
+    def selectedLayers(self, doc):
+        """Nodes to send with the request, bottom to top"""
+        # In Edit mode the layer tree's check boxes decide
         if self.modeCombo.currentText() == "Edit":
-            # Set layer visibility based on checkboxes
-            for checkbox in self.layerCheckboxes:
-                layer = checkbox.layer
-                original_states.append((layer, layer.visible()))
-                layer.setVisible(checkbox.isChecked())
-        
-        # Hide mask layer if it exists before export
-        mask_was_visible = False
-        if self.maskLayer:
-            mask_was_visible = self.maskLayer.visible()
-            self.maskLayer.setVisible(False)
-        
-        # Export the document as PNG
-        doc.exportImage(temp_file.name, InfoObject())
+            return self.layerModel.checkedLayers()
         
-        # Restore original layer visibility states
-        for layer, original_state in original_states:
-            layer.setVisible(original_state)
-        
-        # Restore mask layer visibility
-        if self.maskLayer:
-            self.maskLayer.setVisible(mask_was_visible)
+        # Otherwise every visible top-level node except the mask; each is blended whole
+        return [child for child in doc.rootNode().childNodes()
+                if child.visible() and child != self.maskLayer]
+    
+    def layerRenderer(self, doc):
+        """Function rendering the currently selected layers for a canvas rect.
         
-        # Read the PNG data back
-        with open(temp_file.name, 'rb') as f:
-            png_data = f.read()
+        The layer selection is taken now, so tiles rendered later (when
+        their job starts) still match what the user asked for.
+        """
+        w, h = doc.width(), doc.height()
         
-        # Clean up temp file
-        os.unlink(temp_file.name)
+        # Nothing to leave out: Krita's current projection is already the answer
+        editing = self.modeCombo.currentText() == "Edit"
+        maskShown = self.maskLayer is not None and self.maskLayer.visible()
+        if not editing and not maskShown:
+            return lambda rect: doc.projection(rect.x(), rect.y(), rect.width(), rect.height())
         
-        return png_data
+        # Blend the selected layers in memory; visibility is never toggled.
+        # Outside Edit mode these are the top-level nodes, read through their
+        # projections so groups, masks and non-paint layers come out as Krita draws them
+        rawPixels = doc.colorModel() == "RGBA" and doc.colorDepth() == "U8"
+        layers = self.selectedLayers(doc)
+        return lambda rect: composite_layers(layers, w, h, rawPixels, rect, projection=not editing)
+    
+    def renderCurrentLayers(self, doc, region=None):
+        """Selected layers (based on checkboxes) as a QImage of the canvas or `region`"""
+        return self.layerRenderer(doc)(region or QRect(0, 0, doc.width(), doc.height()))
+    
+    def getCurrentLayerImage(self, doc):
+        """Export selected layers (based on checkboxes) as PNG image data"""
+        return encode_png(self.renderCurrentLayers(doc))
     
     def generateImage(self):
+        self.codecStatsAtStart = dict(codec_stats)
         api_key = self.apiKeyEdit.text().strip()
         mode = self.modeCombo.currentText()
         
-        if not api_key:
+        backend = self.backend()
+        if not api_key and backend.needs_key:
             QMessageBox.warning(self, "Error", "Please enter your OpenAI API key.")
             return
         
@@ -345,75 +461,423 @@ class ArtAIDocker(DockWidget):
             QMessageBox.warning(self, "Error", "No active document found.")
             return
         
+        exportStarted = time.perf_counter()
+        region = prefetchKey = None
         if mode == "Generate":
             prompt = self.promptEdit.toPlainText().strip()
             if not prompt:
                 QMessageBox.warning(self, "Error", "Please enter a prompt.")
                 return
-            image_data = None
-            mask_data = None
+            image = None
+            mask = None
         elif mode == "Vary":
-            image_data = self.getCurrentLayerImage(doc)
-            if not image_data:
-                QMessageBox.warning(self, "Error", "No document content found to vary.")
+            if self.tiledCheck.isChecked():
+                self.generateTiled(doc, api_key, mode, None, QRect(0, 0, doc.width(), doc.height()))
                 return
             prompt = None
-            mask_data = None
+            mask = None
+            # A variation prefetched (or being prefetched) from this exact canvas needs no render
+            if self.candidatesSpin.value() == 1 and self.prefetchCheck.isChecked():
+                region = QRect(0, 0, doc.width(), doc.height())
+                prefetchKey = self.contentKey(doc, choose_api_size(region.width(), region.height(), EDIT_SIZES))
+                if self.joinPrefetch(doc, region, prefetchKey, exportStarted):
+                    return
+            image = self.renderCurrentLayers(doc)
+            if image.isNull():
+                QMessageBox.warning(self, "Error", "No document content found to vary.")
+                return
         else:  # Edit mode
             prompt = self.promptEdit.toPlainText().strip()
             if not prompt:
                 QMessageBox.warning(self, "Error", "Please enter a prompt for editing.")
                 return
-            image_data = self.getCurrentLayerImage(doc)
-            if not image_data:
+            # Only the area around the painted mask is sent and replaced
+            painted = self.maskRegion(doc)
+            region = painted if self.cropToMaskCheck.isChecked() else None
+            if self.tiledCheck.isChecked():
+                if painted is None:
+                    QMessageBox.warning(self, "Error", "No mask found. Please paint mask areas first.")
+                    return
+                self.generateTiled(doc, api_key, mode, prompt, region or QRect(0, 0, doc.width(), doc.height()))
+                return
+            image = self.renderCurrentLayers(doc, region)
+            if image.isNull():
                 QMessageBox.warning(self, "Error", "No document content found to edit.")
                 return
-            mask_data = self.getMaskImage(doc)
-            if not mask_data:
+            mask = self.getMaskImage(doc, region)
+            if mask is None:
                 QMessageBox.warning(self, "Error", "No mask found. Please paint mask areas first.")
                 return
         
-        self.statusLabel.setText("Generating...")
-        self.generateButton.setEnabled(False)
+        # Area of the canvas the result replaces
+        if region is None:
+            region = QRect(0, 0, doc.width(), doc.height())
+        export_ms = (time.perf_counter() - exportStarted) * 1000
+        
+        # Downscale to the closest supported API size before encoding;
+        # onComplete maps the result back onto the canvas
+        started = time.perf_counter()
+        api_size = choose_api_size(region.width(), region.height(),
+                                   GENERATE_SIZES if mode == "Generate" else EDIT_SIZES)
+        count = self.candidatesSpin.value()
+        image_data = mask_data = placement = None
+        if image is not None:
+            fitted, placement = fit_image(image, api_size)
+            image_data = encode_png(fitted)
+        if mask is not None:
+            fitted_mask, _ = fit_image(mask, api_size, fill=0xFFFFFFFF)
+            mask_data = encode_png(fitted_mask)
+        upload_bytes = len(image_data or b"") + len(mask_data or b"")
+        stages = {"export": export_ms, "encode": (time.perf_counter() - started) * 1000}
+        print(f"ArtAI: {mode} {region.width()}x{region.height()} -> {api_size[0]}x{api_size[1]}, "
+              f"{upload_bytes} bytes to upload, encoded in {stages['encode']:.0f} ms")
+        
+        # Candidates an identical earlier click already has in flight are inserted by that click
+        keys = [self.jobKey(doc, region, make_key(mode, backend.name, api_size, prompt, image_data, mask_data, index))
+                for index in range(count)]
+        if prefetchKey is not None:
+            keys[0] = self.jobKey(doc, region, prefetchKey)    # a prefetch of this canvas joins this job
+        running = [self.scheduler.find(key) for key in keys]
+        pending = [index for index in range(count) if running[index] is None or running[index].kind == "Prefetch"]
+        if not pending:
+            self.statusLabel.setText("This request is already queued...")
+            return
+        
+        self.statusLabel.setText("Queued..." if len(pending) == 1 else f"Queued {len(pending)} candidates...")
+        
+        # One job per candidate, run concurrently; results are inserted together
+        batch = {"mode": mode, "results": [None] * len(pending), "left": len(pending), "error": None,
+                 "region": region, "jobs": [], "metrics": [None] * len(pending)}
+        cache = self.activeCache()
+        for slot, index in enumerate(pending):
+            factory = lambda index=index: DallEWorker(api_key, prompt, region.width(), region.height(),
+                                                      image_data, mask_data, cache=cache, variant=index,
+                                                      size=f"{api_size[0]}x{api_size[1]}", placement=placement,
+                                                      metrics=new_record(mode, stages), backend=backend)
+            label = (prompt or "canvas")[:30]
+            batch["jobs"].append(self.scheduler.submit(
+                mode, label if count == 1 else f"{label} [{index + 1}/{count}]", keys[index], factory,
+                lambda data, slot=slot: self.onCandidateComplete(batch, slot, data),
+                lambda message: self.onCandidateError(batch, message)))
+        if prefetchKey is not None:
+            self.prefetchSlot.record(False)
+            self.updatePrefetchLabel()
+    
+    def joinPrefetch(self, doc, region, contentKey, exportStarted):
+        """Serve a one-candidate Vary from the prefetch slot, or join the prefetch in flight.
+        
+        Returns False if neither has this canvas, and the request has to be made.
+        """
+        pixels = self.prefetchSlot.take(contentKey)
+        key = self.jobKey(doc, region, contentKey)
+        job = self.scheduler.find(key)
+        if pixels is None and (job is None or job.kind != "Prefetch"):
+            return False
+        self.prefetchSlot.record(True)
+        self.updatePrefetchLabel()
+        if pixels is not None:
+            export_ms = (time.perf_counter() - exportStarted) * 1000
+            self.onComplete({"mode": "Vary", "results": [pixels], "region": region,
+                             "metrics": [new_record("Vary prefetched", {"export": export_ms})]}, [pixels])
+            return True
+        
+        # Joining a prefetch that is still in flight counts as a hit too
+        self.statusLabel.setText("Queued...")
+        batch = {"mode": "Vary", "results": [None], "left": 1, "error": None,
+                 "region": region, "jobs": [], "metrics": [None]}
+        batch["jobs"].append(self.scheduler.submit(
+            "Vary", "canvas", key, None,
+            lambda data: self.onCandidateComplete(batch, 0, data),
+            lambda message: self.onCandidateError(batch, message)))
+        return True
+    
+    def onCandidateComplete(self, batch, index, pixels):
+        batch["results"][index] = pixels
+        batch["metrics"][index] = batch["jobs"][index].worker.metrics
+        self.onCandidateDone(batch)
+    
+    def onCandidateError(self, batch, error_message):
+        batch["error"] = error_message
+        self.onCandidateDone(batch)
+    
+    def onCandidateDone(self, batch):
+        batch["left"] -= 1
+        total = len(batch["results"])
+        if batch["left"] > 0:
+            self.statusLabel.setText(f"Generating... {total - batch['left']}/{total} candidates done")
+            return
+        
+        images = [data for data in batch["results"] if data is not None]
+        if images:
+            self.onComplete(batch, images)
+        else:
+            self.onError(batch["error"])
+    
+    def generateTiled(self, doc, api_key, mode, prompt, region):
+        """Vary/Edit `region` as overlapping API-sized tiles, streamed onto one layer.
+        
+        Each tile is rendered and encoded only when its job starts and is
+        blended into the layer as soon as it comes back, so memory is
+        bounded by the tiles in flight rather than the canvas size.
+        """
+        render = self.layerRenderer(doc)
+        backend = self.backend()
+        maskLayer = self.maskLayer if mode == "Edit" else None
+        tiles = plan_tiles(region)
+        if maskLayer is not None:
+            # Tiles without any painted mask have nothing to edit
+            painted = maskLayer.bounds()
+            tiles = [rect for rect in tiles if rect.intersects(painted)]
+        if not tiles:
+            self.onError("Nothing to process")
+            return
+        
+        layer = doc.createNode(f"AI {mode} (tiled)", "paintlayer")
+        doc.rootNode().addChildNode(layer, None)
+        batch = {"mode": mode, "layer": layer, "placed": [], "left": len(tiles),
+                 "failed": 0, "error": None}
+        self.statusLabel.setText(f"Queued {len(tiles)} tiles...")
         
-        self.worker = DallEWorker(api_key, prompt, doc.width(), doc.height(), image_data, mask_data)
-        self.worker.finished.connect(self.onComplete)
-        self.worker.error.connect(self.onError)
-        self.worker.start()
+        cache = self.activeCache()
+        for index, rect in enumerate(tiles):
+            def factory(rect=rect):
+                started = time.perf_counter()
+                image = render(rect)
+                mask = build_mask_image(maskLayer, doc.width(), doc.height(), rect) if maskLayer else None
+                exported = time.perf_counter()
+                api_size = choose_api_size(rect.width(), rect.height(), EDIT_SIZES)
+                fitted, placement = fit_image(image, api_size)
+                image_data, mask_data = encode_png(fitted), None
+                if mask is not None:
+                    mask_data = encode_png(fit_image(mask, api_size, fill=0xFFFFFFFF)[0])
+                stages = {"export": (exported - started) * 1000, "encode": (time.perf_counter() - exported) * 1000}
+                return DallEWorker(api_key, prompt, rect.width(), rect.height(), image_data, mask_data,
+                                   cache=cache, size=f"{api_size[0]}x{api_size[1]}", placement=placement,
+                                   metrics=new_record(f"{mode} tile", stages), backend=backend)
+            
+            tile = {"rect": rect, "job": None}
+            label = f"{(prompt or 'canvas')[:20]} [tile {index + 1}/{len(tiles)}]"
+            tile["job"] = self.scheduler.submit(mode, label, None, factory,
+                                                lambda pixels, tile=tile: self.onTileComplete(batch, tile, pixels),
+                                                lambda message: self.onTileError(batch, message))
     
-    def onComplete(self, image_data):
+    def onTileComplete(self, batch, tile, pixels):
+        try:
+            started = time.perf_counter()
+            rect = tile["rect"]
+            result = pixels_image(pixels, rect.width(), rect.height())
+            paste_tile(batch["layer"], result, rect, batch["placed"])
+            batch["placed"].append(rect)
+            Krita.instance().activeDocument().refreshProjection()
+            metrics = tile["job"].worker.metrics
+            metrics["stages"]["insert"] = (time.perf_counter() - started) * 1000
+            self.recordMetrics(metrics)
+        except Exception as e:
+            batch["failed"] += 1
+            batch["error"] = str(e)
+        self.onTileDone(batch)
+    
+    def onTileError(self, batch, error_message):
+        batch["failed"] += 1
+        batch["error"] = error_message
+        self.onTileDone(batch)
+    
+    def onTileDone(self, batch):
+        batch["left"] -= 1
+        total = len(batch["placed"]) + batch["failed"] + batch["left"]
+        if batch["left"] > 0:
+            self.statusLabel.setText(f"Generating... {total - batch['left']}/{total} tiles done")
+            return
+        
+        doc = Krita.instance().activeDocument()
+        if not batch["placed"]:
+            batch["layer"].remove()
+            self.onError(batch["error"])
+            return
+        
+        if batch["mode"] == "Edit" and self.maskLayer:
+            doc.rootNode().removeChildNode(self.maskLayer)
+            self.maskLayer = None
+            if self.maskPaintingActive:
+                self.disableMaskPainting()
+        doc.refreshProjection()
+        
+        failed = batch["failed"]
+        self.statusLabel.setText("Complete!" if not failed else f"Complete! ({failed} tile(s) failed)")
+        self.updateCacheLabel()
+        self.logCodecStats()
+    
+    def backend(self):
+        return get_backend(self.backendCombo.currentText())
+    
+    def onBackendChanged(self, *_):
+        backend = self.backend()
+        isLocal = isinstance(backend, LocalBackend)
+        self.latencyFrame.setVisible(isLocal)
+        if isLocal:
+            backend.latency = self.latencySpin.value()
+    
+    def jobKey(self, doc, region, requestKey):
+        """Scheduler key: the request plus the document and canvas region its result goes into"""
+        return (requestKey, node_key(doc.rootNode()), region.getRect())
+    
+    def canvasFingerprint(self, doc):
+        """Cheap stand-in for hashing the canvas: a small thumbnail plus every
+        node's id, visibility, opacity, blending mode and bounds.
+        
+        Edits too small to show in the thumbnail go unnoticed; a variation
+        of a canvas that changed that little is still a fair answer.
+        """
+        thumb = doc.thumbnail(128, 128)
+        digest = hashlib.sha1(thumb.constBits().asstring(thumb.byteCount()))
+        stack = list(doc.rootNode().childNodes())
+        while stack:
+            node = stack.pop()
+            bounds = node.bounds()
+            digest.update(f"{node_key(node)} {node.visible()} {node.opacity()} {node.blendingMode()} "
+                          f"{bounds.x()},{bounds.y()},{bounds.width()},{bounds.height()}\n".encode())
+            stack.extend(node.childNodes())
+        return digest.hexdigest()
+    
+    def contentKey(self, doc, api_size):
+        """Key of the Vary request the canvas would make now, worked out without rendering it"""
+        return (f"{self.canvasFingerprint(doc)} {doc.width()}x{doc.height()}@{api_size[0]}x{api_size[1]} "
+                f"{self.backend().name}")
+    
+    def onPrefetchToggled(self, checked):
+        if checked:
+            self.idleFingerprint = None
+            self.prefetchTimer.start()
+        else:
+            self.prefetchTimer.stop()
+            self.prefetchSlot.clear()
+        self.updatePrefetchLabel()
+    
+    def onPrefetchBudgetChanged(self, value):
+        self.prefetchBudget.limit = value
+        self.updatePrefetchLabel()
+    
+    def updatePrefetchLabel(self):
+        slot = self.prefetchSlot
+        ready = " - variation ready" if slot.value is not None else ""
+        self.prefetchLabel.setText(
+            f"Prefetch: {slot.hits} hits / {slot.misses} misses ({slot.hit_rate():.0%}), "
+            f"{self.prefetchBudget.used()}/{self.prefetchBudget.limit} used today{ready}")
+    
+    def checkIdleCanvas(self):
+        """Timer tick: start a prefetch once the canvas has been unchanged long enough"""
+        doc = Krita.instance().activeDocument()
+        if doc is None or self.modeCombo.currentText() != "Vary":
+            return
+        if self.backend().needs_key and not self.apiKeyEdit.text().strip():
+            return
+        
+        # Enough to notice edits without rendering the whole canvas
+        fingerprint = self.canvasFingerprint(doc)
+        now = time.monotonic()
+        if fingerprint != self.idleFingerprint:
+            self.idleFingerprint, self.idleSince = fingerprint, now
+            return
+        if now - self.idleSince < self.prefetchIdleSpin.value() or fingerprint == self.prefetchedFingerprint:
+            return
+        if self.prefetchJob is not None and self.prefetchJob.state in ("queued", "running", "retrying"):
+            return
+        self.prefetchedFingerprint = fingerprint
+        self.startPrefetch(doc)
+    
+    def startPrefetch(self, doc):
+        """Queue a Vary request of the canvas whose result waits in the prefetch slot.
+        
+        Only the render happens here; the worker fits and encodes it on the
+        engine's offload pool.
+        """
+        region = QRect(0, 0, doc.width(), doc.height())
+        api_size = choose_api_size(region.width(), region.height(), EDIT_SIZES)
+        contentKey = self.contentKey(doc, api_size)
+        if self.prefetchSlot.has(contentKey):
+            return
+        started = time.perf_counter()
+        image = self.renderCurrentLayers(doc)
+        if image.isNull():
+            return
+        if not self.prefetchBudget.spend():
+            self.updatePrefetchLabel()
+            return
+        stages = {"export": (time.perf_counter() - started) * 1000}
+        
+        # Same key as a one-candidate Vary, so clicking Generate meanwhile joins this job
+        api_key = self.apiKeyEdit.text().strip()
+        backend = self.backend()
+        cache = self.activeCache()
+        self.prefetchJob = self.scheduler.submit(
+            "Prefetch", "idle canvas", self.jobKey(doc, region, contentKey),
+            lambda: DallEWorker(api_key, None, region.width(), region.height(), source=(image, api_size),
+                                cache=cache, size=f"{api_size[0]}x{api_size[1]}",
+                                metrics=new_record("Vary prefetch", stages), backend=backend),
+            lambda pixels: self.onPrefetchComplete(contentKey, pixels), self.onPrefetchError)
+        self.updatePrefetchLabel()
+    
+    def onPrefetchComplete(self, contentKey, pixels):
+        job = self.prefetchJob
+        if job is not None and len(job.listeners) > 1:
+            return  # a Generate click joined the job and has already inserted the result
+        self.prefetchSlot.put(contentKey, pixels)
+        if job is not None and job.worker is not None:
+            self.recordMetrics(job.worker.metrics)
+        self.updatePrefetchLabel()
+    
+    def onPrefetchError(self, error_message):
+        print(f"ArtAI: prefetch failed: {error_message}")
+        self.updatePrefetchLabel()
+    
+    def refreshQueueView(self):
+        selected = self.queueList.currentItem()
+        selectedId = selected.data(Qt.UserRole) if selected else None
+        self.queueList.clear()
+        for job in self.scheduler.jobs():
+            item = QListWidgetItem(job.describe())
+            item.setData(Qt.UserRole, job.id)
+            self.queueList.addItem(item)
+            if job.id == selectedId:
+                self.queueList.setCurrentItem(item)
+    
+    def cancelSelectedJob(self):
+        item = self.queueList.currentItem()
+        if item:
+            self.scheduler.cancel(item.data(Qt.UserRole))
+    
+    def onComplete(self, batch, images):
+        """Insert the generated images as layers in one node operation"""
         try:
             doc = Krita.instance().activeDocument()
+            mode = batch["mode"]
+            region = batch["region"]
+            failed = len(batch["results"]) - len(images)
             
-            # Save generated image to temporary file
-            temp_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-            temp_file.write(image_data)
-            temp_file.close()
-            
-            # Load and resize image to canvas size
-            qimage = QImage(temp_file.name)
-            resized = qimage.scaled(doc.width(), doc.height(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-            
-            # Create new layer
-            mode = self.modeCombo.currentText()
-            layer_name = f"AI {mode}"
-            new_layer = doc.createNode(layer_name, "paintlayer")
-            
-            # Convert to ARGB format
-            if resized.format() != QImage.Format_ARGB32:
-                resized = resized.convertToFormat(QImage.Format_ARGB32)
-            
-            # Get pixel data - QImage ARGB32 format is actually BGRA in memory
-            pixel_data = bytearray(resized.bits().asstring(resized.byteCount()))
-            # QImage ARGB32 stores as BGRA in memory, Krita expects BGRA, so no conversion needed
-            # The original swap was causing the color inversion
-            
-            # Set pixel data to layer
-            new_layer.setPixelData(bytes(pixel_data), 0, 0, doc.width(), doc.height())
+            started = time.perf_counter()
+            metrics = [record for record in batch["metrics"] if record is not None]
+            layers = []
+            for index, pixels in enumerate(images):
+                inserting = time.perf_counter()
+                # Create new layer
+                layer_name = f"AI {mode}" if len(images) == 1 else f"AI {mode} {index + 1}"
+                new_layer = doc.createNode(layer_name, "paintlayer")
+                
+                # The worker already decoded and mapped the result into a BGRA
+                # buffer; it goes to Krita as is, at the crop offset for cropped edits
+                new_layer.setPixelData(pixels, region.x(), region.y(), region.width(), region.height())
+                layers.append(new_layer)
+                metrics[index]["stages"]["insert"] = (time.perf_counter() - inserting) * 1000
             
-            # Add layer to document
-            doc.rootNode().addChildNode(new_layer, None)
+            # Several candidates go in as one group, so the document changes once
+            if len(layers) == 1:
+                node = layers[0]
+            else:
+                node = doc.createGroupLayer(f"AI {mode} candidates")
+                node.setChildNodes(layers)
+            doc.rootNode().addChildNode(node, None)
             doc.refreshProjection()
+            print(f"ArtAI: inserted {len(layers)} layer(s) in {(time.perf_counter() - started) * 1000:.0f} ms")
             
             # Clean up mask layer if this was an edit operation
             if mode == "Edit" and self.maskLayer:
@@ -422,22 +886,66 @@ class ArtAIDocker(DockWidget):
                 if self.maskPaintingActive:
                     self.disableMaskPainting()
             
-            self.statusLabel.setText("Complete!")
+            self.statusLabel.setText("Complete!" if not failed else f"Complete! ({failed} candidate(s) failed)")
+            for record in metrics:
+                self.recordMetrics(record)
+            self.updateCacheLabel()
+            self.logCodecStats()
             
         except Exception as e:
             self.statusLabel.setText(f"Error: {str(e)}")
-        
-        self.generateButton.setEnabled(True)
+    
+    def recordMetrics(self, record):
+        """Store a finished request's timings and refresh the stats panel"""
+        self.metricsLog.add(record)
+        stages = ", ".join(f"{stage} {record['stages'][stage]:.0f}" for stage in STAGES if stage in record["stages"])
+        print(f"ArtAI: {record['mode']} timings (ms): {stages}; "
+              f"{record['bytes_out']} bytes up, {record['bytes_in']} bytes down")
+        if self.statsView.isVisible():
+            self.updateStatsView()
+    
+    def onStatsToggled(self, checked):
+        self.statsButton.setText("Hide Request Stats" if checked else "Show Request Stats")
+        self.statsView.setVisible(checked)
+        if checked:
+            self.updateStatsView()
+    
+    def updateStatsView(self):
+        """p50 / p95 per stage and mode over the recorded requests"""
+        lines = []
+        for mode, entry in self.metricsLog.summary().items():
+            lines.append(f"{mode} – {entry['count']} requests ({entry['cached']} cached), "
+                         f"total {entry['total'][0]:.0f} / {entry['total'][1]:.0f} ms, "
+                         f"{entry['bytes_out'] / 1024:.0f} KB up / {entry['bytes_in'] / 1024:.0f} KB down")
+            lines.append("    " + ", ".join(f"{stage} {entry[stage][0]:.0f}/{entry[stage][1]:.0f}"
+                                             for stage in STAGES if stage in entry))
+        self.statsView.setPlainText("\n".join(lines) if lines else "No requests recorded yet")
+    
+    def activeCache(self):
+        """Result cache for the next request, or None when bypassed"""
+        return None if self.bypassCacheCheck.isChecked() else self.resultCache
+    
+    def updateCacheLabel(self):
+        stats = self.resultCache.stats()
+        self.cacheLabel.setText(f"Cache: {stats['hits']} hits / {stats['misses']} misses")
+    
+    def logCodecStats(self):
+        """Report the in-memory image encodes/decodes of the last request"""
+        done = {k: codec_stats[k] - self.codecStatsAtStart.get(k, 0) for k in codec_stats}
+        print(f"ArtAI: request encoded {done['encoded']} image(s) ({done['bytes_out']} bytes), "
+              f"decoded {done['decoded']} ({done['bytes_in']} bytes), all in memory")
     
     def onError(self, error_message):
         self.statusLabel.setText(f"Error: {error_message}")
-        self.generateButton.setEnabled(True)
+        self.updateCacheLabel()
     
     def critiqueImage(self):
+        self.codecStatsAtStart = dict(codec_stats)
         api_key = self.apiKeyEdit.text().strip()
         prompt = self.promptEdit.toPlainText().strip()
         
-        if not api_key:
+        backend = self.backend()
+        if not api_key and backend.needs_key:
             QMessageBox.warning(self, "Error", "Please enter your OpenAI API key.")
             return
         
@@ -450,36 +958,116 @@ class ArtAIDocker(DockWidget):
             QMessageBox.warning(self, "Error", "No active document found.")
             return
         
-        image_data = self.getCurrentLayerImage(doc)
-        if not image_data:
+        stages = {}
+        prepared = self.prepareCritiqueImage(doc, stages)
+        if prepared is None:
             QMessageBox.warning(self, "Error", "No document content found to critique.")
             return
+        image_data, mime, width, height = prepared
+        print(f"ArtAI: Critique image {width}x{height} {mime}, {len(image_data)} bytes")
         
         self.statusLabel.setText("Getting critique...")
-        self.critiqueButton.setEnabled(False)
         
-        self.critiqueWorker = CritiqueWorker(api_key, prompt, image_data)
-        self.critiqueWorker.finished.connect(self.onCritiqueComplete)
-        self.critiqueWorker.error.connect(self.onCritiqueError)
-        self.critiqueWorker.start()
+        cache = self.activeCache()
+        stream = self.streamCritiqueCheck.isChecked()
+        detail = self.critiqueDetailCombo.currentText()
+        key = make_key("Critique", backend.name, detail, prompt, image_data)
+        
+        # One critique fills the result box at a time; a different one still running is dropped
+        previous = self.critiqueRequest
+        if previous is not None:
+            if previous["job"].key == key:
+                self.statusLabel.setText("This critique is already running...")
+                return
+            self.critiqueRequest = None
+            self.scheduler.cancel(previous["job"].id)
+        
+        self.critiqueResult.clear()
+        request = {"job": None}
+        request["job"] = self.scheduler.submit(
+            "Critique", prompt[:30], key,
+            lambda: CritiqueWorker(api_key, prompt, image_data, cache=cache, stream=stream,
+                                   metrics=new_record("Critique", stages), mime=mime, detail=detail,
+                                   backend=backend),
+            lambda text: self.onCritiqueComplete(request, text),
+            lambda message: self.onCritiqueError(request, message),
+            lambda text: self.onCritiqueChunk(request, text))
+        self.critiqueRequest = request
     
-    def onCritiqueComplete(self, critique_text):
+    def prepareCritiqueImage(self, doc, stages=None):
+        """Downscaled, encoded critique image of `doc`: (bytes, mime, width, height), or None.
+        
+        Keyed by the canvas fingerprint, the layers being sent and the
+        critique settings, and looked up before anything is rendered, so
+        critiquing the same document state with another prompt skips the
+        render, the downscale and the encode. `stages` gets the export and
+        encode times.
+        """
+        stages = {} if stages is None else stages
+        started = time.perf_counter()
+        maxDim = self.critiqueMaxDimSpin.value()
+        fmt, quality = self.critiqueFormatCombo.currentText(), self.critiqueQualitySpin.value()
+        key = (self.canvasFingerprint(doc), doc.width(), doc.height(),
+               tuple(node_key(node) for node in self.selectedLayers(doc)), maxDim, fmt, quality)
+        if key in self.preparedCritiqueImages:
+            self.preparedCritiqueImages.move_to_end(key)
+            stages["export"], stages["encode"] = (time.perf_counter() - started) * 1000, 0.0
+            return self.preparedCritiqueImages[key]
+        image = downscale(self.renderCurrentLayers(doc), maxDim)
+        if image.isNull():
+            return None
+        exported = time.perf_counter()
+        image_data, mime = encode_for_critique(image, fmt, quality)
+        stages["export"] = (exported - started) * 1000
+        stages["encode"] = (time.perf_counter() - exported) * 1000
+        prepared = (image_data, mime, image.width(), image.height())
+        self.preparedCritiqueImages[key] = prepared
+        while len(self.preparedCritiqueImages) > PREPARED_CRITIQUE_IMAGES:
+            self.preparedCritiqueImages.popitem(last=False)
+        return prepared
+    
+    def onCritiqueChunk(self, request, text):
+        if request is not self.critiqueRequest:
+            return  # superseded by a newer critique, or a duplicate click on the same one
+        self.critiqueFrame.show()  # Show as soon as the first tokens arrive
+        self.critiqueResult.moveCursor(QTextCursor.End)
+        self.critiqueResult.insertPlainText(text)
+        ttft = request["job"].worker.first_token_ms
+        if ttft is not None:
+            self.statusLabel.setText(f"Receiving critique... (first token after {ttft:.0f} ms)")
+        else:
+            self.statusLabel.setText("Receiving critique...")
+    
+    def onCritiqueComplete(self, request, critique_text):
+        if request is not self.critiqueRequest:
+            return
+        self.critiqueRequest = None
         self.critiqueResult.setText(critique_text)
         self.critiqueFrame.show()  # Only show the critique frame once we have a response
-        self.statusLabel.setText("Critique complete!")
-        self.critiqueButton.setEnabled(True)
+        worker = request["job"].worker
+        ttft = worker.first_token_ms if worker else None
+        if ttft is not None:
+            self.statusLabel.setText(f"Critique complete! (first token after {ttft:.0f} ms)")
+        else:
+            self.statusLabel.setText("Critique complete!")
+        if worker:
+            self.recordMetrics(worker.metrics)
+        self.updateCacheLabel()
+        self.logCodecStats()
     
-    def onCritiqueError(self, error_message):
+    def onCritiqueError(self, request, error_message):
+        if request is not self.critiqueRequest:
+            return
+        self.critiqueRequest = None
         self.critiqueResult.setText(f"Error: {error_message}")
         self.critiqueFrame.show()  # Show frame even if there's an error
         self.statusLabel.setText(f"Error: {error_message}")
-        self.critiqueButton.setEnabled(True)
 
-class DallEWorker(QThread):
-    finished = pyqtSignal(bytes)
-    error = pyqtSignal(str)
+class DallEWorker(EngineWorker):
+    finished = pyqtSignal(QByteArray)   # width x height BGRA pixels, ready for setPixelData
     
-    def __init__(self, api_key, prompt, width, height, image_data=None, mask_data=None):
+    def __init__(self, api_key, prompt, width, height, image_data=None, mask_data=None, cache=None, variant=0,
+                 size="1024x1024", placement=None, metrics=None, backend=None, source=None):
         super().__init__()
         self.api_key = api_key
         self.prompt = prompt
@@ -487,244 +1075,137 @@ class DallEWorker(QThread):
         self.height = height
         self.image_data = image_data
         self.mask_data = mask_data
-        # Use 1024x1024 for DALL-E
-        self.size = "1024x1024"
+        self.cache = cache
+        self.variant = variant  # candidate index when several are requested at once
+        # One of the sizes DALL-E accepts, picked by choose_api_size
+        self.size = size
+        self.placement = placement  # where fit_image put the picture, for mapping the result back
+        self.source = source        # (QImage, api size) to fit and encode off the UI thread instead of image_data
+        # Timings/sizes of this attempt; the docker fills in export, encode and insert
+        self.metrics = metrics if metrics is not None else new_record("Image")
+        self.backend = backend or get_backend()
+    
+    def layerPixels(self, png):
+        """Decode the result and map it to width x height here, off the UI thread"""
+        started = time.perf_counter()
+        api_size = tuple(int(v) for v in self.size.split("x"))
+        pixels = layer_pixels(decode_png(png), self.width, self.height, self.placement, api_size)
+        self.metrics["stages"]["decode"] = (time.perf_counter() - started) * 1000
+        return pixels
     
-    def run(self):
+    def encodeSource(self):
+        """Fit and encode the source image here, off the UI thread"""
+        started = time.perf_counter()
+        image, api_size = self.source
+        fitted, placement = fit_image(image, api_size)
+        image_data = encode_png(fitted)
+        self.metrics["stages"]["encode"] = (time.perf_counter() - started) * 1000
+        return image_data, placement
+    
+    async def work(self):
+        if self.source is not None:
+            self.image_data, self.placement = await self.engine.offload(self.encodeSource)
+        mode = "Edit" if self.mask_data else "Vary" if self.image_data else "Generate"
+        
+        # Serve repeats of an identical request from the result cache
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_key(mode, self.backend.model(mode), self.size, self.prompt, self.image_data,
+                                 self.mask_data, self.variant)
+            cached = await self.engine.offload(self.cache.get, cache_key)
+            if cached is not None:
+                self.metrics["cached"] = True
+                self.finished.emit(await self.engine.offload(self.layerPixels, cached))
+                return
+        
+        timings = {}
         try:
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-            
-            if self.mask_data:  # Edit mode
-                url = "https://api.openai.com/v1/images/edits"
-                
-                # Create multipart form data for editing
-                boundary = '----WebKitFormBoundary' + str(id(self))
-                body = []
-                
-                # Add image
-                body.append(f'--{boundary}')
-                body.append('Content-Disposition: form-data; name="image"; filename="image.png"')
-                body.append('Content-Type: image/png')
-                body.append('')
-                body.append(self.image_data.decode('latin1'))
-                
-                # Add mask
-                body.append(f'--{boundary}')
-                body.append('Content-Disposition: form-data; name="mask"; filename="mask.png"')
-                body.append('Content-Type: image/png')
-                body.append('')
-                body.append(self.mask_data.decode('latin1'))
-                
-                # Add prompt
-                body.append(f'--{boundary}')
-                body.append('Content-Disposition: form-data; name="prompt"')
-                body.append('')
-                body.append(self.prompt)
-                
-                # Add other parameters
-                body.append(f'--{boundary}')
-                body.append('Content-Disposition: form-data; name="n"')
-                body.append('')
-                body.append('1')
-                
-                body.append(f'--{boundary}')
-                body.append('Content-Disposition: form-data; name="size"')
-                body.append('')
-                body.append(self.size)
-                
-                body.append(f'--{boundary}')
-                body.append('Content-Disposition: form-data; name="response_format"')
-                body.append('')
-                body.append('b64_json')
-                
-                body.append(f'--{boundary}--')
-                
-                form_data = '\r\n'.join(body).encode('latin1')
-                
-                request = urllib.request.Request(
-                    url,
-                    data=form_data,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": f"multipart/form-data; boundary={boundary}"
-                    }
-                )
-                
-            elif self.image_data:  # Vary mode
-                url = "https://api.openai.com/v1/images/variations"
-                
-                # Create multipart form data for variations
-                boundary = '----formdata-boundary-' + str(id(self))
-                body = []
-                body.append(f'--{boundary}'.encode())
-                body.append(b'Content-Disposition: form-data; name="image"; filename="image.png"')
-                body.append(b'Content-Type: image/png')
-                body.append(b'')
-                body.append(self.image_data)
-                body.append(f'--{boundary}'.encode())
-                body.append(b'Content-Disposition: form-data; name="n"')
-                body.append(b'')
-                body.append(b'1')
-                body.append(f'--{boundary}'.encode())
-                body.append(b'Content-Disposition: form-data; name="size"')
-                body.append(b'')
-                body.append(self.size.encode())
-                body.append(f'--{boundary}'.encode())
-                body.append(b'Content-Disposition: form-data; name="response_format"')
-                body.append(b'')
-                body.append(b'b64_json')
-                body.append(f'--{boundary}--'.encode())
-                
-                form_data = b'\r\n'.join(body)
-                
-                request = urllib.request.Request(
-                    url,
-                    data=form_data,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": f"multipart/form-data; boundary={boundary}"
-                    }
-                )
-                
-            else:  # Generate mode
-                url = "https://api.openai.com/v1/images/generations"
-                data = {
-                    "model": "dall-e-3",
-                    "prompt": self.prompt,
-                    "size": self.size,
-                    "quality": "standard",
-                    "n": 1,
-                    "response_format": "b64_json"
-                }
-                
-                json_data = json.dumps(data).encode('utf-8')
-                request = urllib.request.Request(
-                    url,
-                    data=json_data,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    }
-                )
-            
-            response = urllib.request.urlopen(request, timeout=60, context=ssl_context)
-            
-            if response.getcode() == 200:
-                response_data = response.read().decode('utf-8')
-                result = json.loads(response_data)
-                if 'data' in result and len(result['data']) > 0:
-                    image_b64 = result['data'][0]['b64_json']
-                    image_data = base64.b64decode(image_b64)
-                    self.finished.emit(image_data)
-                else:
-                    self.error.emit("No image data received")
+            if mode == "Edit":
+                image_data = await self.backend.edit(self.api_key, self.prompt, self.image_data, self.mask_data,
+                                                     self.size, timings)
+            elif mode == "Vary":
+                image_data = await self.backend.vary(self.api_key, self.image_data, self.size, timings)
             else:
-                # Try to get error details from response
-                try:
-                    error_data = response.read().decode('utf-8')
-                    self.error.emit(f"API Error {response.getcode()}: {error_data}")
-                except:
-                    self.error.emit(f"API Error {response.getcode()}")
-                
-        except urllib.error.HTTPError as e:
-            # Get detailed error message for HTTP errors
-            try:
-                error_data = e.read().decode('utf-8')
-                error_json = json.loads(error_data)
-                if 'error' in error_json and 'message' in error_json['error']:
-                    self.error.emit(f"HTTP {e.code}: {error_json['error']['message']}")
-                else:
-                    self.error.emit(f"HTTP {e.code}: {error_data}")
-            except:
-                self.error.emit(f"HTTP {e.code}: {str(e)}")
-        except Exception as e:
-            self.error.emit(str(e))
+                image_data = await self.backend.generate(self.api_key, self.prompt, self.size, timings)
+        finally:
+            add_http_timings(self.metrics, timings)
+        
+        if cache_key:
+            await self.engine.offload(self.cache.put, cache_key, image_data)
+        # Decoding is CPU work; keep it off the engine loop
+        self.finished.emit(await self.engine.offload(self.layerPixels, image_data))
 
-class CritiqueWorker(QThread):
+class CritiqueWorker(EngineWorker):
     finished = pyqtSignal(str)
-    error = pyqtSignal(str)
+    chunk = pyqtSignal(str)     # streamed text, batched every CHUNK_INTERVAL
+    
+    CHUNK_INTERVAL = 0.05
     
-    def __init__(self, api_key, prompt, image_data):
+    def __init__(self, api_key, prompt, image_data, cache=None, stream=False, metrics=None,
+                 mime="image/png", detail="auto", backend=None):
         super().__init__()
         self.api_key = api_key
         self.prompt = prompt
         self.image_data = image_data
+        self.cache = cache
+        self.stream = stream
+        self.first_token_ms = None
+        self.metrics = metrics if metrics is not None else new_record("Critique")
+        self.mime = mime
+        self.detail = detail    # vision detail level: auto / low / high
+        self.backend = backend or get_backend()
     
-    def run(self):
+    async def work(self):
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_key("Critique", self.backend.model("Critique"), self.detail, self.prompt,
+                                 self.image_data)
+            cached = await self.engine.offload(self.cache.get, cache_key)
+            if cached is not None:
+                self.metrics["cached"] = True
+                self.finished.emit(cached.decode("utf-8"))
+                return
+        
+        timings = {}
         try:
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-            
-            # Convert image to base64
-            image_b64 = base64.b64encode(self.image_data).decode('utf-8')
-            
-            url = "https://api.openai.com/v1/chat/completions"
-            data = {
-                "model": "gpt-4o",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"Please critique this artwork based on the following prompt: {self.prompt}"
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{image_b64}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                "max_tokens": 500
-            }
-            
-            json_data = json.dumps(data).encode('utf-8')
-            request = urllib.request.Request(
-                url,
-                data=json_data,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-            )
-            
-            response = urllib.request.urlopen(request, timeout=60, context=ssl_context)
-            
-            if response.getcode() == 200:
-                response_data = response.read().decode('utf-8')
-                result = json.loads(response_data)
-                if 'choices' in result and len(result['choices']) > 0:
-                    critique_text = result['choices'][0]['message']['content']
-                    self.finished.emit(critique_text)
-                else:
-                    self.error.emit("No critique received")
+            if self.stream:
+                critique_text = await self.streamCritique(timings)
             else:
-                # Try to get error details from response
-                try:
-                    error_data = response.read().decode('utf-8')
-                    self.error.emit(f"API Error {response.getcode()}: {error_data}")
-                except:
-                    self.error.emit(f"API Error {response.getcode()}")
-                
-        except urllib.error.HTTPError as e:
-            # Get detailed error message for HTTP errors
-            try:
-                error_data = e.read().decode('utf-8')
-                error_json = json.loads(error_data)
-                if 'error' in error_json and 'message' in error_json['error']:
-                    self.error.emit(f"HTTP {e.code}: {error_json['error']['message']}")
-                else:
-                    self.error.emit(f"HTTP {e.code}: {error_data}")
-            except:
-                self.error.emit(f"HTTP {e.code}: {str(e)}")
-        except Exception as e:
-            self.error.emit(str(e))
+                critique_text = await self.backend.critique(self.api_key, self.prompt, self.image_data,
+                                                            self.mime, self.detail, timings)
+        finally:
+            add_http_timings(self.metrics, timings)
+        
+        if not critique_text:
+            self.error.emit("No critique received")
+            return
+        if cache_key:
+            await self.engine.offload(self.cache.put, cache_key, critique_text.encode("utf-8"))
+        self.finished.emit(critique_text)
+
+    async def streamCritique(self, timings):
+        """Emit `chunk` as the backend streams text in, batched every CHUNK_INTERVAL"""
+        started = time.perf_counter()
+        last_emit = started
+        parts, pending = [], []
+        
+        async for text in self.backend.critique_stream(self.api_key, self.prompt, self.image_data,
+                                                       self.mime, self.detail, timings):
+            now = time.perf_counter()
+            if self.first_token_ms is None:
+                self.first_token_ms = (now - started) * 1000
+            pending.append(text)
+            # Batch tokens so the UI thread isn't flooded with tiny updates
+            if now - last_emit >= self.CHUNK_INTERVAL or len(parts) == 0:
+                parts.extend(pending)
+                self.chunk.emit("".join(pending))
+                pending.clear()
+                last_emit = now
+        
+        if pending:
+            parts.extend(pending)
+            self.chunk.emit("".join(pending))
+        return "".join(parts)
 
 # Register the extension and docker
 Krita.instance().addExtension(ArtAI(Krita.instance()))
@@ -0,0 +1,294 @@
+# async_http.py – asyncio keep-alive HTTP/1.1 client used on the request engine's loop
+import asyncio
+import contextlib
+import os
+import time
+
+from .http_client import DEFAULT_BASE_URL, HttpError, Response, host_header, request_target, unverified_ssl_context
+
+READ_SIZE = 64 * 1024
+
+# Errors that mean a pooled keep-alive connection went stale between requests
+_STALE_ERRORS = (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError)
+
+
+class _Connection:
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def usable(self):
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    def close(self):
+        self.writer.close()
+
+
+async def _read_head(reader):
+    """Status code and lower-cased headers of the next response"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("connection closed before the response")
+    status = int(status_line.split(None, 2)[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return status, headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+def _framed(status, headers):
+    """Whether the body length is known, so the connection can be reused afterwards"""
+    return (status in (204, 304) or "content-length" in headers
+            or headers.get("transfer-encoding", "").lower() == "chunked")
+
+
+async def _body_chunks(reader, status, headers, timeout):
+    """Raw body pieces as they arrive; chunked and Content-Length framing are undone"""
+    def read(coro):
+        return asyncio.wait_for(coro, timeout)
+
+    if status in (204, 304):
+        return
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await read(reader.readline())).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                while (await read(reader.readline())) not in (b"\r\n", b"\n", b""):
+                    pass    # trailers
+                return
+            yield await read(reader.readexactly(size))
+            await read(reader.readexactly(2))
+    elif "content-length" in headers:
+        remaining = int(headers["content-length"])
+        while remaining > 0:
+            chunk = await read(reader.read(min(READ_SIZE, remaining)))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await read(reader.read(READ_SIZE))
+            if not chunk:
+                return
+            yield chunk
+
+
+class AsyncStreamingResponse:
+    def __init__(self, status, headers, reader, timeout):
+        self.status = status
+        self.headers = headers
+        self.done = False       # body read to the end; the connection can be reused
+        self._reader = reader
+        self._timeout = timeout
+
+    async def chunks(self):
+        async for chunk in _body_chunks(self._reader, self.status, self.headers, self._timeout):
+            yield chunk
+        self.done = True
+
+    async def read(self):
+        return b"".join([chunk async for chunk in self.chunks()])
+
+    async def iter_lines(self):
+        """Body lines as they arrive, without line endings"""
+        pending = b""
+        async for chunk in self.chunks():
+            *lines, pending = (pending + chunk).split(b"\n")
+            for line in lines:
+                yield line.rstrip(b"\r")
+        if pending:
+            yield pending.rstrip(b"\r")
+
+
+async def async_sse_data(lines):
+    """Payloads of the `data:` fields of a server-sent event stream.
+
+    Stops at the OpenAI-style `[DONE]` sentinel, draining whatever follows
+    so the connection can go back to the pool.
+    """
+    async for line in lines:
+        if not line.startswith(b"data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == b"[DONE]":
+            async for _ in lines:
+                pass
+            return
+        yield payload
+
+
+class AsyncHttpClient:
+    """Keep-alive HTTP/1.1 client on asyncio streams.
+
+    Any number of requests can be in flight at once on one event loop;
+    idle keep-alive connections are pooled per (scheme, host, port). Must
+    only be used from the loop that created its connections (the request
+    engine's), so it needs no locking.
+    """
+
+    def __init__(self, base_url=None, max_idle_per_host=8, timeout=60):
+        self.base_url = (base_url or os.environ.get("ARTAI_API_BASE") or DEFAULT_BASE_URL).rstrip("/")
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.stats = {"requests": 0, "connections": 0, "reused": 0}
+        self._idle = {}
+        self._ssl_context = unverified_ssl_context()
+
+    def _acquire(self, key):
+        idle = self._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if conn.usable():
+                self.stats["reused"] += 1
+                return conn, True
+            conn.close()
+        self.stats["connections"] += 1
+        return None, False
+
+    def _release(self, key, conn, status, headers):
+        idle = self._idle.setdefault(key, [])
+        if (_framed(status, headers) and headers.get("connection", "").lower() != "close"
+                and len(idle) < self.max_idle_per_host):
+            idle.append(conn)
+        else:
+            conn.close()
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        if scheme == "https":
+            reader, writer = await asyncio.open_connection(host, port, ssl=self._ssl_context,
+                                                           server_hostname=host)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return _Connection(reader, writer)
+
+    async def _send(self, conn, key, method, target, body, headers):
+        headers = dict(headers or {})
+        if body is not None and not any(name.lower() == "content-length" for name in headers):
+            headers["Content-Length"] = str(len(body))
+        head = [f"{method} {target} HTTP/1.1", f"Host: {host_header(key)}"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        conn.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            conn.writer.write(body)
+        elif body is not None:
+            # Streamed bodies (MultipartEncoder) go out piece by piece
+            for chunk in body:
+                conn.writer.write(chunk)
+                await conn.writer.drain()
+        await conn.writer.drain()
+
+    async def _open(self, method, path, body, headers, timeout, timings):
+        """Send the request and read the response head; returns (key, conn, status, headers)
+
+        Seconds spent connecting, uploading and waiting for the response
+        head are stored in `timings` under "connect", "upload" and "wait",
+        and the request size under "bytes_out".
+        """
+        key, target = request_target(self.base_url, path)
+        for attempt in range(2):
+            conn, reused = self._acquire(key)
+            try:
+                started = time.perf_counter()
+                if conn is None:
+                    conn = await asyncio.wait_for(self._connect(key), timeout)
+                connected = time.perf_counter()
+                await asyncio.wait_for(self._send(conn, key, method, target, body, headers), timeout)
+                sent = time.perf_counter()
+                status, response_headers = await asyncio.wait_for(_read_head(conn.reader), timeout)
+            except _STALE_ERRORS:
+                if conn is not None:
+                    conn.close()
+                if reused and attempt == 0:
+                    continue    # server dropped an idle connection, retry on a fresh one
+                raise
+            except BaseException:
+                # includes cancellation: the connection is left mid-request
+                if conn is not None:
+                    conn.close()
+                raise
+            break
+
+        timings["connect"] = connected - started
+        timings["upload"] = sent - connected
+        timings["wait"] = time.perf_counter() - sent
+        timings["bytes_out"] = len(body) if body is not None else 0
+        self.stats["requests"] += 1
+        return key, conn, status, response_headers
+
+    async def request(self, method, path, body=None, headers=None, timeout=None, timings=None):
+        """Send a request and return a Response; raises HttpError on >= 400.
+
+        `path` is joined to base_url unless it is already an absolute URL.
+        `timings` (a dict) receives the stage timings described in _open,
+        plus "download" seconds and "bytes_in".
+        """
+        timings = {} if timings is None else timings
+        timeout = timeout or self.timeout
+        key, conn, status, response_headers = await self._open(method, path, body, headers, timeout, timings)
+        started = time.perf_counter()
+        response = AsyncStreamingResponse(status, response_headers, conn.reader, timeout)
+        try:
+            data = await response.read()
+        except BaseException:
+            conn.close()
+            raise
+        self._release(key, conn, status, response_headers)
+        timings["download"] = time.perf_counter() - started
+        timings["bytes_in"] = len(data)
+
+        if status >= 400:
+            raise HttpError(status, data, response_headers)
+        return Response(status, response_headers, data)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, path, body=None, headers=None, timeout=None, timings=None):
+        """Like request(), but yields an AsyncStreamingResponse to read incrementally.
+
+        Only the _open timings are recorded. The connection goes back to
+        the pool if the body was read to the end.
+        """
+        timings = {} if timings is None else timings
+        timeout = timeout or self.timeout
+        key, conn, status, response_headers = await self._open(method, path, body, headers, timeout, timings)
+        response = AsyncStreamingResponse(status, response_headers, conn.reader, timeout)
+        if status >= 400:
+            try:
+                data = await response.read()
+            except BaseException:
+                conn.close()
+                raise
+            self._release(key, conn, status, response_headers)
+            raise HttpError(status, data, response_headers)
+        try:
+            yield response
+        except BaseException:
+            conn.close()
+            raise
+        if response.done:
+            self._release(key, conn, status, response_headers)
+        else:
+            conn.close()
+
+    def close(self):
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+_shared_client = None
+
+
+def shared_client():
+    """Client shared by every request on the engine loop"""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = AsyncHttpClient()
+    return _shared_client
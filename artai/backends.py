@@ -0,0 +1,218 @@
+# backends.py – image/critique services behind one interface, selectable in the docker
+import base64
+import json
+import threading
+import time
+
+from .async_http import async_sse_data, shared_client
+from .multipart import MultipartEncoder
+
+
+class Backend:
+    """A service the workers send generate/vary/edit/critique requests to.
+
+    Operations are coroutines run on the request engine's loop. Images go
+    in and come out as PNG bytes, critiques come back as text. Every
+    operation fills `timings` like AsyncHttpClient.request does and lets
+    HttpError through, so metrics and the scheduler's retries work the same
+    for every backend. Subclasses set `name` and implement the operations.
+    """
+
+    name = ""
+    needs_key = True    # False if requests work without an API key
+
+    def model(self, mode):
+        """Model name for `mode`; part of the result-cache key"""
+        return self.name
+
+    async def generate(self, api_key, prompt, size, timings=None):
+        raise NotImplementedError
+
+    async def vary(self, api_key, image_data, size, timings=None):
+        raise NotImplementedError
+
+    async def edit(self, api_key, prompt, image_data, mask_data, size, timings=None):
+        raise NotImplementedError
+
+    async def critique(self, api_key, prompt, image_data, mime="image/png", detail="auto", timings=None):
+        raise NotImplementedError
+
+    async def critique_stream(self, api_key, prompt, image_data, mime="image/png", detail="auto", timings=None):
+        """Async iterator over the critique text as it arrives; default is one piece"""
+        yield await self.critique(api_key, prompt, image_data, mime, detail, timings)
+
+
+class OpenAIBackend(Backend):
+    """DALL-E for images and gpt-4o for critiques, or any server speaking the same API.
+
+    `base_url` None uses the shared client's base (api.openai.com, or
+    ARTAI_API_BASE when set).
+    """
+
+    name = "OpenAI"
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url
+
+    def url(self, path):
+        return (self.base_url or "") + path
+
+    def model(self, mode):
+        return {"Generate": "dall-e-3", "Critique": "gpt-4o"}.get(mode, "dall-e-2")
+
+    def headers(self, api_key, content_type):
+        return {"Authorization": f"Bearer {api_key}", "Content-Type": content_type}
+
+    async def post(self, path, api_key, body, content_type, timings):
+        headers = self.headers(api_key, content_type)
+        headers["Content-Length"] = str(len(body))
+        return await shared_client().request("POST", self.url(path), body=body, headers=headers,
+                                       timeout=60, timings=timings)
+
+    def image_result(self, response):
+        result = response.json()
+        if not result.get("data"):
+            raise ValueError("No image data received")
+        return base64.b64decode(result["data"][0]["b64_json"])
+
+    async def generate(self, api_key, prompt, size, timings=None):
+        data = {
+            "model": self.model("Generate"),
+            "prompt": prompt,
+            "size": size,
+            "quality": "standard",
+            "n": 1,
+            "response_format": "b64_json"
+        }
+        return self.image_result(await self.post("/v1/images/generations", api_key,
+                                                 json.dumps(data).encode("utf-8"), "application/json", timings))
+
+    async def vary(self, api_key, image_data, size, timings=None):
+        # Streamed multipart body; the PNG is referenced, not copied
+        form_data = MultipartEncoder()
+        form_data.add_file("image", "image.png", image_data, "image/png")
+        form_data.add_field("n", 1)
+        form_data.add_field("size", size)
+        form_data.add_field("response_format", "b64_json")
+        return self.image_result(await self.post("/v1/images/variations", api_key, form_data,
+                                                 form_data.content_type, timings))
+
+    async def edit(self, api_key, prompt, image_data, mask_data, size, timings=None):
+        form_data = MultipartEncoder()
+        form_data.add_file("image", "image.png", image_data, "image/png")
+        form_data.add_file("mask", "mask.png", mask_data, "image/png")
+        form_data.add_field("prompt", prompt)
+        form_data.add_field("n", 1)
+        form_data.add_field("size", size)
+        form_data.add_field("response_format", "b64_json")
+        return self.image_result(await self.post("/v1/images/edits", api_key, form_data,
+                                                 form_data.content_type, timings))
+
+    def critique_body(self, prompt, image_data, mime, detail, stream=False):
+        image_b64 = base64.b64encode(image_data).decode("utf-8")
+        data = {
+            "model": self.model("Critique"),
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": f"Please critique this artwork based on the following prompt: {prompt}"
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime};base64,{image_b64}",
+                                "detail": detail
+                            }
+                        }
+                    ]
+                }
+            ],
+            "max_tokens": 500
+        }
+        if stream:
+            data["stream"] = True
+        return json.dumps(data).encode("utf-8")
+
+    async def critique(self, api_key, prompt, image_data, mime="image/png", detail="auto", timings=None):
+        response = await self.post("/v1/chat/completions", api_key,
+                                   self.critique_body(prompt, image_data, mime, detail), "application/json", timings)
+        result = response.json()
+        if not result.get("choices"):
+            raise ValueError("No critique received")
+        return result["choices"][0]["message"]["content"]
+
+    async def critique_stream(self, api_key, prompt, image_data, mime="image/png", detail="auto", timings=None):
+        """Server-sent completion events; time from the response head to the end counts as download"""
+        timings = {} if timings is None else timings
+        body = self.critique_body(prompt, image_data, mime, detail, stream=True)
+        async with shared_client().stream("POST", self.url("/v1/chat/completions"), body=body,
+                                          headers=self.headers(api_key, "application/json"),
+                                          timeout=60, timings=timings) as response:
+            head = time.perf_counter()
+            async for payload in async_sse_data(response.iter_lines()):
+                timings["bytes_in"] = timings.get("bytes_in", 0) + len(payload)
+                choices = json.loads(payload).get("choices") or [{}]
+                text = choices[0].get("delta", {}).get("content")
+                if text:
+                    yield text
+        timings["download"] = time.perf_counter() - head
+
+
+class LocalBackend(OpenAIBackend):
+    """The bundled local_server, started on first use.
+
+    Answers are deterministic per request and arrive after `latency`
+    seconds, so the whole client can be exercised and load-tested without
+    network or API key.
+    """
+
+    name = "Local stand-in"
+    needs_key = False
+
+    def __init__(self, latency=0.5):
+        super().__init__()
+        self.latency = latency
+        self._server = None
+        self._lock = threading.Lock()
+
+    def model(self, mode):
+        return "local"
+
+    def url(self, path):
+        with self._lock:
+            if self._server is None:
+                from .local_server import start_server
+                self._server, self.base_url = start_server(latency=self.latency)
+            self._server.latency = self.latency
+        return super().url(path)
+
+    def stop(self):
+        with self._lock:
+            if self._server is not None:
+                self._server.shutdown()
+                self._server = None
+
+
+DEFAULT_BACKEND = OpenAIBackend.name
+
+_backends = {}
+
+
+def register_backend(backend):
+    """Make `backend` selectable in the docker (replaces one with the same name)"""
+    _backends[backend.name] = backend
+
+
+def backend_names():
+    return list(_backends)
+
+
+def get_backend(name=None):
+    return _backends.get(name or DEFAULT_BACKEND) or _backends[DEFAULT_BACKEND]
+
+
+register_backend(OpenAIBackend())
+register_backend(LocalBackend())
@@ -0,0 +1,113 @@
+# engine.py – one asyncio loop, on its own thread, running every ArtAI request
+import asyncio
+import concurrent.futures
+import threading
+
+from PyQt5.QtCore import QCoreApplication, QObject, pyqtSignal
+
+from .http_client import HttpError
+
+OFFLOAD_THREADS = 4     # decode/cache work, kept off the loop so it never stalls I/O
+
+
+class RequestEngine:
+    """An asyncio event loop on a daemon thread, next to Qt's own loop.
+
+    Coroutines are handed over with submit() and report back through Qt
+    signals, which Qt queues onto the receiving object's (UI) thread. One
+    loop carries any number of concurrent requests over the pooled
+    AsyncHttpClient; blocking work goes to a small shared thread pool via
+    offload().
+    """
+
+    def __init__(self, offloadThreads=OFFLOAD_THREADS):
+        self.loop = asyncio.new_event_loop()
+        self.pool = concurrent.futures.ThreadPoolExecutor(offloadThreads, thread_name_prefix="ArtAI offload")
+        self._thread = threading.Thread(target=self._run, name="ArtAI engine", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule `coro` on the loop; returns a concurrent.futures.Future (cancel() cancels it)"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def offload(self, fn, *args):
+        """Run blocking `fn(*args)` on the shared pool and await the result"""
+        return await self.loop.run_in_executor(self.pool, fn, *args)
+
+
+_shared_engine = None
+_shared_lock = threading.Lock()
+
+
+def shared_engine():
+    """Plugin-wide engine used by every worker"""
+    global _shared_engine
+    with _shared_lock:
+        if _shared_engine is None:
+            _shared_engine = RequestEngine()
+        return _shared_engine
+
+
+class EngineWorker(QObject):
+    """A request coroutine with the QThread-style surface the scheduler uses.
+
+    Subclasses define a `finished` signal and implement `async def work()`,
+    emitting `finished` with the result. start() hands work() to the engine;
+    HttpErrors are kept in `http_error` for the scheduler's retry logic and
+    every failure, cancellation included, is reported through `error`.
+    """
+    error = pyqtSignal(str)
+
+    def __init__(self, engine=None):
+        super().__init__()
+        self.engine = engine or shared_engine()
+        self.http_error = None  # last HttpError, read by the scheduler to decide on retries
+        self._future = None
+
+    async def work(self):
+        raise NotImplementedError
+
+    async def _main(self):
+        try:
+            await self.work()
+        except HttpError as e:
+            # Detailed error message for HTTP errors
+            self.http_error = e
+            self.error.emit(str(e))
+        except Exception as e:
+            self.error.emit(str(e))
+
+    def _onDone(self, future):
+        if future.cancelled():
+            self.error.emit("Cancelled")
+
+    def start(self):
+        self._future = self.engine.submit(self._main())
+        self._future.add_done_callback(self._onDone)
+
+    def run(self):
+        """Run to completion, blocking the calling thread (not the engine's).
+
+        Signals queued for this thread are delivered before it returns, so
+        callers see the same outcome as from QThread.run().
+        """
+        self.start()
+        self.wait()
+        QCoreApplication.sendPostedEvents()
+
+    def isRunning(self):
+        return self._future is not None and not self._future.done()
+
+    def wait(self, timeout=None):
+        if self._future is not None:
+            concurrent.futures.wait([self._future], timeout)
+        return not self.isRunning()
+
+    def cancel(self):
+        """Stop the request wherever it is; `error` then reports it as cancelled"""
+        if self._future is not None:
+            self._future.cancel()
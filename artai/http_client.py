@@ -0,0 +1,62 @@
+# http_client.py – response/error types and connection helpers for the request engine's HTTP client
+import json
+import ssl
+from urllib.parse import urlsplit
+
+# Point ARTAI_API_BASE at a local stand-in server to keep requests off the network
+DEFAULT_BASE_URL = "https://api.openai.com"
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class HttpError(Exception):
+    """Non-2xx response; keeps status, headers and body for callers"""
+
+    def __init__(self, code, body=b"", headers=None):
+        self.code = code
+        self.body = body
+        self.headers = headers or {}
+        super().__init__(f"HTTP {code}")
+
+    def message(self):
+        """API error message if the body is an OpenAI-style error, else the raw body"""
+        text = self.body.decode("utf-8", "replace")
+        try:
+            return json.loads(text)["error"]["message"]
+        except Exception:
+            return text
+
+    def __str__(self):
+        return f"HTTP {self.code}: {self.message()}"
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode("utf-8"))
+
+
+def request_target(base_url, path):
+    """((scheme, host, port), request target) for `path`, joined to base_url unless absolute"""
+    url = urlsplit(path if "://" in path else base_url + path)
+    key = (url.scheme, url.hostname, url.port or DEFAULT_PORTS.get(url.scheme, 80))
+    target = url.path + (f"?{url.query}" if url.query else "")
+    return key, target
+
+
+def host_header(key):
+    """Host header value for a (scheme, host, port) key; the port only if it isn't the default"""
+    scheme, host, port = key
+    return host if port == DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+
+
+def unverified_ssl_context():
+    """Same (unverified) TLS setup the workers have always used"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
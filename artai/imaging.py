@@ -0,0 +1,284 @@
+# imaging.py – pixel helpers shared by the ArtAI docker and its workers
+import math
+from PyQt5.QtCore import Qt, QRect, QRectF, QSize, QBuffer, QByteArray, QIODevice
+from PyQt5.QtGui import QImage, QImageWriter, QPainter
+try:
+    from PyQt5 import sip
+except ImportError:
+    import sip
+
+# ---------- in-memory PNG codec ---------------------------------------------
+# Instrumentation counters of the codec's own work
+codec_stats = {"encoded": 0, "decoded": 0, "bytes_out": 0, "bytes_in": 0}
+
+
+def encode_image(image, fmt="PNG", quality=-1):
+    """Encode a QImage to `fmt` bytes without touching the filesystem"""
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    ok = image.save(buffer, fmt, quality)
+    buffer.close()
+    if not ok:
+        raise ValueError(f"Could not encode image as {fmt}")
+    encoded = data.data()
+    codec_stats["encoded"] += 1
+    codec_stats["bytes_out"] += len(encoded)
+    return encoded
+
+
+def encode_png(image):
+    """Encode a QImage to PNG bytes without touching the filesystem"""
+    return encode_image(image, "PNG")
+
+
+def decode_png(png):
+    """Decode PNG (or any Qt-readable) bytes straight into a QImage"""
+    image = QImage.fromData(png)
+    if image.isNull():
+        raise ValueError("Could not decode image data")
+    codec_stats["decoded"] += 1
+    codec_stats["bytes_in"] += len(png)
+    return image
+
+# ---------- critique image preparation -------------------------------------
+# Formats the vision endpoint takes, with their MIME types
+CRITIQUE_FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def downscale(image, max_dim):
+    """`image` scaled so its longer side is at most max_dim (never enlarged)"""
+    if max(image.width(), image.height()) <= max_dim:
+        return image
+    return image.scaled(max_dim, max_dim, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+def encode_for_critique(image, fmt="JPEG", quality=85):
+    """Encode a (downscaled) render for the vision endpoint; returns (bytes, mime).
+
+    JPEG has no alpha, so the picture is flattened onto white first instead
+    of letting transparent areas turn black. Falls back to JPEG if this Qt
+    build can't write WebP.
+    """
+    fmt = fmt.upper()
+    if fmt == "WEBP" and b"webp" not in QImageWriter.supportedImageFormats():
+        fmt = "JPEG"
+    if fmt == "JPEG" and image.hasAlphaChannel():
+        flat = QImage(image.size(), QImage.Format_RGB32)
+        flat.fill(0xFFFFFFFF)
+        painter = QPainter(flat)
+        painter.drawImage(0, 0, image)
+        painter.end()
+        image = flat
+    return encode_image(image, fmt, quality if fmt != "PNG" else -1), CRITIQUE_FORMATS[fmt]
+
+# ---------- edit mask -------------------------------------------------------
+# Alpha above this on the mask layer counts as "painted"
+MASK_ALPHA_THRESHOLD = 10
+
+# alpha -> mask value: painted pixels become 0 (edit here), the rest 255 (keep)
+_MASK_TABLE = bytes(0 if a > MASK_ALPHA_THRESHOLD else 255 for a in range(256))
+
+
+def mask_pixels(bgra):
+    """Turn BGRA mask-layer pixels into BGRA edit-mask pixels.
+
+    Painted pixels become transparent black, everything else opaque white.
+    Runs as a few whole-channel slice/translate passes instead of a Python
+    loop per pixel.
+    """
+    alpha = bytes(memoryview(bgra)[3::4]).translate(_MASK_TABLE)
+    out = bytearray(len(alpha) * 4)
+    for channel in range(4):
+        out[channel::4] = alpha
+    return bytes(out)
+
+
+def build_mask_image(mask_layer, width, height, region=None):
+    """Build the DALL-E edit mask for a width x height canvas.
+
+    Only the painted bounds of `mask_layer` are read from Krita; the rest
+    of the canvas is a plain opaque fill. With `region` only that part of
+    the canvas is produced.
+    """
+    region = region or QRect(0, 0, width, height)
+    mask = QImage(region.width(), region.height(), QImage.Format_ARGB32)
+    mask.fill(0xFFFFFFFF)
+
+    rect = mask_layer.bounds().intersected(region)
+    if rect.isEmpty():
+        return mask
+
+    raw = mask_layer.pixelData(rect.x(), rect.y(), rect.width(), rect.height())
+    pixels = mask_pixels(bytes(raw))
+    painted = QImage(pixels, rect.width(), rect.height(),
+                     rect.width() * 4, QImage.Format_ARGB32)
+
+    painter = QPainter(mask)
+    painter.setCompositionMode(QPainter.CompositionMode_Source)
+    painter.drawImage(rect.topLeft() - region.topLeft(), painted)
+    painter.end()
+    return mask
+
+
+def crop_region(bounds, width, height, padding=0.25, min_padding=32):
+    """Padded, roughly square region around `bounds`, kept inside the canvas.
+
+    Square because the edit endpoint only takes square images, so no
+    upload is wasted on padding.
+    """
+    pad = max(min_padding, int(max(bounds.width(), bounds.height()) * padding))
+    side = max(bounds.width(), bounds.height()) + 2 * pad
+    w, h = min(side, width), min(side, height)
+    center = bounds.center()
+    x = min(max(0, center.x() - w // 2), width - w)
+    y = min(max(0, center.y() - h // 2), height - h)
+    return QRect(x, y, w, h)
+
+
+# ---------- layer compositor ------------------------------------------------
+# Krita blending mode id -> closest QPainter composition mode
+_BLEND_MODES = {
+    "normal":     QPainter.CompositionMode_SourceOver,
+    "multiply":   QPainter.CompositionMode_Multiply,
+    "screen":     QPainter.CompositionMode_Screen,
+    "overlay":    QPainter.CompositionMode_Overlay,
+    "darken":     QPainter.CompositionMode_Darken,
+    "lighten":    QPainter.CompositionMode_Lighten,
+    "dodge":      QPainter.CompositionMode_ColorDodge,
+    "burn":       QPainter.CompositionMode_ColorBurn,
+    "hard_light": QPainter.CompositionMode_HardLight,
+    "soft_light": QPainter.CompositionMode_SoftLight,
+    "diff":       QPainter.CompositionMode_Difference,
+    "exclusion":  QPainter.CompositionMode_Exclusion,
+    "add":        QPainter.CompositionMode_Plus,
+}
+
+
+def composite_layers(layers, width, height, raw_pixels=True, region=None, projection=False):
+    """Blend `layers` (bottom to top) into a width x height ARGB32 image.
+
+    Layer opacity and blending mode are respected (modes without a QPainter
+    equivalent fall back to normal). Work scales with the painted bounds of
+    the given layers, and the document itself is never touched. With
+    projection=True each node's own projection is read (a group with its
+    children, any layer type with its masks), so blending the top-level
+    nodes gives the whole image; otherwise only the layer's own pixels,
+    without group opacity or masks. With raw_pixels=False each layer is
+    read through Node.thumbnail instead, which Krita converts to 8-bit RGBA
+    for us. With `region` only that part of the canvas is composited.
+    """
+    region = region or QRect(0, 0, width, height)
+    canvas = QImage(region.width(), region.height(), QImage.Format_ARGB32_Premultiplied)
+    canvas.fill(0)
+
+    painter = QPainter(canvas)
+    for layer in layers:
+        if raw_pixels:
+            rect = layer.bounds().intersected(region)
+            if rect.isEmpty():
+                continue
+            # 8-bit RGBA pixelData is BGRA, i.e. QImage.Format_ARGB32 in memory
+            read = layer.projectionPixelData if projection else layer.pixelData
+            raw = bytes(read(rect.x(), rect.y(), rect.width(), rect.height()))
+            image = QImage(raw, rect.width(), rect.height(),
+                           rect.width() * 4, QImage.Format_ARGB32)
+        else:
+            rect, image = QRect(0, 0, width, height), layer.thumbnail(width, height)
+        painter.setOpacity(layer.opacity() / 255.0)
+        painter.setCompositionMode(
+            _BLEND_MODES.get(layer.blendingMode(), QPainter.CompositionMode_SourceOver))
+        painter.drawImage(rect.topLeft() - region.topLeft(), image)
+    painter.end()
+
+    return canvas.convertToFormat(QImage.Format_ARGB32)
+
+
+# ---------- API size fitting ------------------------------------------------
+# Sizes the image endpoints accept: dall-e-3 generations, dall-e-2 edits/variations
+GENERATE_SIZES = [(1024, 1024), (1792, 1024), (1024, 1792)]
+EDIT_SIZES = [(256, 256), (512, 512), (1024, 1024)]
+
+
+def choose_api_size(width, height, sizes):
+    """Supported size closest in aspect ratio to width x height.
+
+    Among equally close sizes, the smallest one that still holds the
+    canvas without upscaling wins, otherwise the largest.
+    """
+    aspect = math.log(width / height)
+    distance = lambda size: abs(math.log(size[0] / size[1]) - aspect)
+    best = min(distance(size) for size in sizes)
+    candidates = [size for size in sizes if distance(size) - best < 1e-9]
+    covering = [size for size in candidates if size[0] >= width and size[1] >= height]
+    if covering:
+        return min(covering, key=lambda size: size[0] * size[1])
+    return max(candidates, key=lambda size: size[0] * size[1])
+
+
+def fit_image(image, size, fill=0x00000000):
+    """Scale `image` into `size` without distortion, padding with `fill`.
+
+    Returns (ARGB32 image of exactly `size`, QRect where the picture sits).
+    """
+    target_w, target_h = size
+    scaled = image.scaled(target_w, target_h, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    placement = QRect((target_w - scaled.width()) // 2, (target_h - scaled.height()) // 2,
+                      scaled.width(), scaled.height())
+    if placement.size() == QSize(target_w, target_h):
+        return scaled.convertToFormat(QImage.Format_ARGB32), placement
+
+    fitted = QImage(target_w, target_h, QImage.Format_ARGB32)
+    fitted.fill(fill)
+    painter = QPainter(fitted)
+    painter.setCompositionMode(QPainter.CompositionMode_Source)
+    painter.drawImage(placement.topLeft(), scaled)
+    painter.end()
+    return fitted, placement
+
+
+def _result_source(result, width, height, placement, api_size):
+    """Part of `result` that layer_pixels stretches over width x height"""
+    if placement is not None:
+        sx, sy = result.width() / api_size[0], result.height() / api_size[1]
+        return QRectF(placement.x() * sx, placement.y() * sy,
+                      placement.width() * sx, placement.height() * sy)
+    scale = max(width / result.width(), height / result.height())
+    w, h = width / scale, height / scale
+    return QRectF((result.width() - w) / 2, (result.height() - h) / 2, w, h)
+
+
+def layer_pixels(result, width, height, placement=None, api_size=None):
+    """Bring an API result back to a width x height canvas without distortion,
+    drawn straight into the BGRA buffer Node.setPixelData takes.
+
+    With a `placement` from fit_image the padding is cropped off first;
+    without one (Generate) the result is scaled to cover the canvas and
+    centre-cropped. The pixels are scaled and converted into one
+    preallocated QByteArray (no full-size intermediate QImage), so handing
+    it to setPixelData is the only work left for the UI thread. Safe to
+    call off the UI thread.
+    """
+    source = _result_source(result, width, height, placement, api_size)
+    if source.width() > width and source.height() > height:
+        # shrinking: let QImage.scaled average the pixels; the output is only canvas-sized
+        result = result.copy(source.toAlignedRect()).scaled(
+            width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        source = QRectF(result.rect())
+
+    pixels = QByteArray(width * height * 4, "\0")
+    # QImage over the QByteArray's own memory: 8-bit RGBA pixelData is BGRA, i.e. ARGB32
+    target = QImage(sip.voidptr(int(sip.voidptr(pixels))), width, height, width * 4,
+                    QImage.Format_ARGB32)
+    painter = QPainter(target)
+    painter.setCompositionMode(QPainter.CompositionMode_Source)
+    painter.setRenderHint(QPainter.SmoothPixmapTransform)
+    painter.drawImage(QRectF(0, 0, width, height), result, source)
+    painter.end()
+    del target      # must not outlive `pixels`
+    return pixels
+
+
+def pixels_image(pixels, width, height):
+    """Read-only ARGB32 QImage view of a layer_pixels buffer (no copy)"""
+    return QImage(pixels, width, height, width * 4, QImage.Format_ARGB32)
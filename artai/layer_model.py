@@ -0,0 +1,221 @@
+# layer_model.py – lazily populated, incrementally refreshed tree of a document's layers
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex
+
+
+def node_key(node):
+    """Stable identity of a Krita node (Python wrappers are recreated per call)"""
+    return node.uniqueId().toString()
+
+
+class _Item:
+    __slots__ = ("node", "key", "name", "type", "parent", "children", "row")
+
+    def __init__(self, node, parent):
+        self.node = node
+        self.key = node_key(node)
+        self.name = node.name()
+        self.type = node.type()
+        self.parent = parent
+        self.children = None    # None until the group is first expanded
+        self.row = 0            # hint for parent(); checked before use
+
+    def rowInParent(self):
+        siblings = self.parent.children
+        if not (self.row < len(siblings) and siblings[self.row] is self):
+            self.row = siblings.index(self)
+        return self.row
+
+
+class LayerTreeModel(QAbstractItemModel):
+    """The document's node tree, with a check box on every paint layer.
+
+    Groups are populated only when expanded. refresh() diffs the populated
+    part of the tree against the document and emits row inserts, removes,
+    moves and data changes for just what changed, so views keep their
+    expansion/scroll state and unchanged rows cost nothing. Checked state
+    is stored by node id and survives refreshes and re-parenting; layers
+    nobody has toggled default to whether they are shown, i.e. visible
+    along with every group above them.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._root = None
+        self._rootKey = None
+        self._excluded = set()
+        self._checked = {}      # node key -> bool, only for layers the user toggled
+
+    # document -----------------------------------------------------------
+    def setDocument(self, doc, excluded=()):
+        """Show `doc` (None to clear), leaving out the nodes in `excluded`"""
+        self._excluded = {node_key(node) for node in excluded if node is not None}
+        root = doc.rootNode() if doc is not None else None
+        if root is None or node_key(root) != self._rootKey:
+            self.beginResetModel()
+            self._root = _Item(root, None) if root is not None else None
+            self._rootKey = self._root.key if self._root else None
+            self.endResetModel()
+        if self._root is not None:
+            self.refresh()
+
+    def refresh(self):
+        """Bring the populated part of the tree in line with the document"""
+        if self._root is not None:
+            if self._root.children is None:
+                self._populate(self._root, QModelIndex())
+            else:
+                self._sync(self._root, QModelIndex())
+
+    def _childNodes(self, item):
+        return [child for child in item.node.childNodes() if node_key(child) not in self._excluded]
+
+    def _populate(self, item, index):
+        nodes = self._childNodes(item)
+        if nodes:
+            self.beginInsertRows(index, 0, len(nodes) - 1)
+        item.children = [_Item(node, item) for node in nodes]
+        if nodes:
+            self.endInsertRows()
+
+    def _sync(self, item, index):
+        nodes = self._childNodes(item)
+        keys = [node_key(node) for node in nodes]
+        wanted = set(keys)
+
+        # drop rows whose nodes are gone (bottom up, so row numbers hold)
+        for row in range(len(item.children) - 1, -1, -1):
+            if item.children[row].key not in wanted:
+                self.beginRemoveRows(index, row, row)
+                del item.children[row]
+                self.endRemoveRows()
+
+        for row, (node, key) in enumerate(zip(nodes, keys)):
+            current = item.children[row] if row < len(item.children) else None
+            if current is None or current.key != key:
+                moved = next((r for r in range(row + 1, len(item.children))
+                              if item.children[r].key == key), None)
+                if moved is not None:
+                    self.beginMoveRows(index, moved, moved, index, row)
+                    item.children.insert(row, item.children.pop(moved))
+                    self.endMoveRows()
+                else:
+                    self.beginInsertRows(index, row, row)
+                    item.children.insert(row, _Item(node, item))
+                    self.endInsertRows()
+                    continue
+            child = item.children[row]
+            child.node = node
+            name, node_type = node.name(), node.type()
+            if (name, node_type) != (child.name, child.type):
+                child.name, child.type = name, node_type
+                changed = self.index(row, 0, index)
+                self.dataChanged.emit(changed, changed)
+            if child.children is not None:
+                self._sync(child, self.index(row, 0, index))
+
+    # checked layers -----------------------------------------------------
+    def isChecked(self, node, shown=None):
+        """Toggled state of `node`, else `shown` (worked out from its parents if not given)"""
+        key = node_key(node)
+        if key in self._checked:
+            return self._checked[key]
+        if shown is None:
+            shown = node.visible()
+            parent = node.parentNode()
+            while shown and parent is not None:
+                shown = parent.visible()
+                parent = parent.parentNode()
+        return shown
+
+    def checkedLayers(self):
+        """Checked paint layers of the whole document, bottom to top.
+
+        Walks the document itself, so layers inside never-expanded groups
+        count too.
+        """
+        layers = []
+
+        def collect(node, shown):
+            for child in node.childNodes():
+                if node_key(child) in self._excluded:
+                    continue
+                childShown = shown and child.visible()
+                if child.type() == "paintlayer" and self.isChecked(child, childShown):
+                    layers.append(child)
+                collect(child, childShown)
+        if self._root is not None:
+            collect(self._root.node, True)
+        return layers
+
+    # QAbstractItemModel -------------------------------------------------
+    def _item(self, index):
+        return index.internalPointer() if index.isValid() else self._root
+
+    def index(self, row, column, parent=QModelIndex()):
+        item = self._item(parent)
+        if item is None or item.children is None or not 0 <= row < len(item.children) or column != 0:
+            return QModelIndex()
+        child = item.children[row]
+        child.row = row
+        return self.createIndex(row, column, child)
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self._root:
+            return QModelIndex()
+        return self.createIndex(parent.rowInParent(), 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        item = self._item(parent)
+        if item is None or item.children is None:
+            return 0
+        return len(item.children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        item = self._item(parent)
+        if item is None:
+            return False
+        if item.children is not None:
+            return bool(item.children)
+        return item.type == "grouplayer" or item is self._root
+
+    def canFetchMore(self, parent):
+        item = self._item(parent)
+        return item is not None and item.children is None
+
+    def fetchMore(self, parent):
+        item = self._item(parent)
+        if item is not None and item.children is None:
+            self._populate(item, parent)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.internalPointer().type == "paintlayer":
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = index.internalPointer()
+        if role == Qt.DisplayRole:
+            return item.name
+        if role == Qt.ToolTipRole:
+            return item.type
+        if role == Qt.CheckStateRole and item.type == "paintlayer":
+            return Qt.Checked if self.isChecked(item.node) else Qt.Unchecked
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        self._checked[index.internalPointer().key] = value == Qt.Checked
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
@@ -0,0 +1,162 @@
+# local_server.py – bundled stand-in for the OpenAI image/chat endpoints
+#
+#   python artai/local_server.py [--port 8765] [--latency 0.5]
+#
+# Answers /v1/images/{generations,variations,edits} and /v1/chat/completions
+# (streamed or not) like the real API, with images and text derived from a
+# hash of the request: the same request always gets the same answer. Only
+# the standard library is used, so it also runs outside Krita; the
+# benchmarks use it as their stand-in server too.
+import argparse
+import base64
+import functools
+import hashlib
+import json
+import re
+import socket
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_SIZE_FIELD = re.compile(rb'name="size"\r\n\r\n(\d+)x(\d+)')
+
+_REMARKS = ("The composition leads the eye well, but the focal point needs more contrast.",
+            "Edges are uniformly hard; soften the background ones to push it back.",
+            "The palette is cohesive; a small complementary accent would add life.",
+            "Values in the midground are too close, so the forms flatten out.",
+            "Strong silhouette; the secondary shapes could use more variety in size.")
+
+
+@functools.lru_cache(maxsize=8)
+def render_png(width, height, seed):
+    """Deterministic RGBA PNG: a vertical gradient between two colours taken from `seed`"""
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+    top, bottom = seed[0:3], seed[3:6]
+    rows = []
+    for y in range(height):
+        t = y / max(1, height - 1)
+        rgb = bytes(round(a + (b - a) * t) for a, b in zip(top, bottom))
+        rows.append(b"\x00" + (rgb + b"\xff") * width)
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"".join(rows), 1))
+            + chunk(b"IEND", b""))
+
+
+def critique_text(seed):
+    """A few canned remarks, picked by `seed`"""
+    return " ".join(_REMARKS[(seed[i] + i) % len(_REMARKS)] for i in range(3))
+
+
+class LocalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate writes; don't let Nagle delay the body
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.stats["connections"] += 1
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_events(self, text):
+        """OpenAI-style chat completion stream, one word per event"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(text.split(" ")):
+            delta = {"choices": [{"delta": {"content": word if i == 0 else " " + word}}]}
+            self._write_chunk(f"data: {json.dumps(delta)}\n\n".encode())
+            time.sleep(self.server.token_delay)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    def _seed(self, body):
+        # Multipart boundaries are random per request; leave them out of the hash
+        boundary = re.search(r"boundary=(\S+)", self.headers.get("Content-Type", ""))
+        if boundary:
+            body = body.replace(boundary.group(1).encode(), b"")
+        return hashlib.sha256(self.path.encode() + body).digest()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        with self.server.lock:
+            self.server.stats["requests"] += 1
+            self.server.stats["bytes_in"] += length
+        time.sleep(self.server.latency)
+        seed = self._seed(body)
+
+        if self.path.startswith("/v1/images/"):
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                size = json.loads(body).get("size", "1024x1024")
+                width, height = (int(v) for v in size.split("x"))
+            else:
+                match = _SIZE_FIELD.search(body)
+                width, height = (int(match.group(1)), int(match.group(2))) if match else (1024, 1024)
+            png = render_png(width, height, seed)
+            self._send_json({"data": [{"b64_json": base64.b64encode(png).decode()}]})
+        elif self.path == "/v1/chat/completions":
+            text = critique_text(seed)
+            if json.loads(body or b"{}").get("stream"):
+                self._send_events(text)
+            else:
+                # same generation time as the stream, just delivered in one go
+                time.sleep(self.server.token_delay * len(text.split(" ")))
+                self._send_json({"choices": [{"message": {"content": text}}]})
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, 404)
+
+
+def start_server(port=0, latency=0.0, token_delay=0.0, ssl_context=None):
+    """Serve on 127.0.0.1 from a daemon thread; returns (server, base_url).
+
+    `server.latency` (seconds added to every response) can be changed while
+    it runs; `token_delay` paces the critique text word by word. With an
+    `ssl_context` it serves HTTPS. `server.stats` counts connections,
+    requests and request bytes.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), LocalHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.stats = {"connections": 0, "requests": 0, "bytes_in": 0}
+    server.latency = latency
+    server.token_delay = token_delay
+    scheme = "http"
+    if ssl_context is not None:
+        server.socket = ssl_context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    server, url = start_server(args.port, args.latency)
+    print(f"Local backend listening on {url} – set ARTAI_API_BASE={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,109 @@
+# metrics.py – per-request timings and payload sizes, kept in a rolling local file
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# Where a round trip spends its time, in pipeline order
+STAGES = ("export", "encode", "connect", "upload", "wait", "download", "decode", "insert")
+
+DEFAULT_MAX_RECORDS = 1000
+
+
+def new_record(mode, stages=None):
+    """Metrics record for one request; stage timings go into record["stages"] in ms"""
+    return {"mode": mode, "time": time.time(), "cached": False,
+            "stages": dict(stages or {}), "bytes_out": 0, "bytes_in": 0}
+
+
+def add_http_timings(record, timings):
+    """Copy an AsyncHttpClient `timings` dict (seconds) into a record (ms)"""
+    for stage in ("connect", "upload", "wait", "download"):
+        if stage in timings:
+            record["stages"][stage] = timings[stage] * 1000
+    record["bytes_out"] += timings.get("bytes_out", 0)
+    record["bytes_in"] += timings.get("bytes_in", 0)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class MetricsLog:
+    """The last `max_records` request records, mirrored to a JSON-lines file.
+
+    New records are appended to the file; once it holds twice the limit it
+    is rewritten with just the kept records, so it never grows unbounded.
+    """
+
+    def __init__(self, path, max_records=DEFAULT_MAX_RECORDS):
+        self.path = path
+        self.max_records = max_records
+        self.records = deque(maxlen=max_records)
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        self.records.append(json.loads(line))
+                    except ValueError:
+                        continue    # torn last line after a crash
+        except OSError:
+            pass
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+            try:
+                if self._lines >= 2 * self.max_records:
+                    self._rewrite()
+                else:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record) + "\n")
+                    self._lines += 1
+            except OSError as e:
+                print(f"ArtAI: could not write metrics: {e}")
+
+    def _rewrite(self):
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(self.path + ".tmp", self.path)
+        self._lines = len(self.records)
+
+    def summary(self):
+        """{mode: {"count", "cached", "total": (p50, p95), <stage>: (p50, p95), "bytes_out", "bytes_in"}}
+
+        Stage percentiles only cover records that have the stage, and byte
+        counts only requests that went out, so cache hits don't drag the
+        network numbers down.
+        """
+        with self._lock:
+            records = list(self.records)
+        by_mode = {}
+        for record in records:
+            by_mode.setdefault(record["mode"], []).append(record)
+
+        summary = {}
+        for mode, group in sorted(by_mode.items()):
+            totals = [sum(r["stages"].values()) for r in group]
+            sent = [r for r in group if not r.get("cached")] or group
+            entry = {"count": len(group), "cached": sum(1 for r in group if r.get("cached")),
+                     "total": (percentile(totals, 0.5), percentile(totals, 0.95)),
+                     "bytes_out": percentile([r["bytes_out"] for r in sent], 0.5),
+                     "bytes_in": percentile([r["bytes_in"] for r in sent], 0.5)}
+            for stage in STAGES:
+                values = [r["stages"][stage] for r in group if stage in r["stages"]]
+                if values:
+                    entry[stage] = (percentile(values, 0.5), percentile(values, 0.95))
+            summary[mode] = entry
+        return summary
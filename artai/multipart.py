@@ -0,0 +1,98 @@
+# multipart.py – streaming multipart/form-data encoder for image uploads
+import os
+import uuid
+
+CRLF = b"\r\n"
+CHUNK_SIZE = 64 * 1024
+
+
+class MultipartEncoder:
+    """multipart/form-data body that is streamed instead of joined.
+
+    Parts keep references to the caller's bytes/memoryviews/file objects;
+    the total length is known up front so the body can be sent with a
+    Content-Length. Iterating yields header bytes and zero-copy memoryview
+    slices of the payloads, and can be repeated (e.g. to resend on a fresh
+    connection).
+    """
+
+    def __init__(self, boundary=None):
+        self.boundary = boundary or f"----ArtAIBoundary{uuid.uuid4().hex}"
+        self._parts = []        # (header bytes, payload, payload size)
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def add_field(self, name, value):
+        data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+        header = f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+        self._add(header, memoryview(data), len(data))
+        return self
+
+    def add_file(self, name, filename, data, content_type="application/octet-stream"):
+        """`data` is bytes-like or a seekable binary file object"""
+        if hasattr(data, "read"):
+            start = data.tell()
+            size = data.seek(0, os.SEEK_END) - start
+            data.seek(start)
+            payload = (data, start)
+        else:
+            payload = memoryview(data).cast("B")
+            size = len(payload)
+        header = (f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                  f"Content-Type: {content_type}\r\n\r\n")
+        self._add(header, payload, size)
+        return self
+
+    def _add(self, header, payload, size):
+        self._parts.append((f"--{self.boundary}\r\n{header}".encode("utf-8"), payload, size))
+
+    def _closing(self):
+        return f"--{self.boundary}--\r\n".encode("utf-8")
+
+    def __len__(self):
+        parts = sum(len(header) + size + len(CRLF) for header, _, size in self._parts)
+        return parts + len(self._closing())
+
+    def __iter__(self):
+        for header, payload, size in self._parts:
+            yield header
+            if isinstance(payload, memoryview):
+                for offset in range(0, size, CHUNK_SIZE):
+                    yield payload[offset:offset + CHUNK_SIZE]
+            else:
+                fileobj, start = payload
+                fileobj.seek(start)
+                remaining = size
+                while remaining > 0:
+                    chunk = fileobj.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise IOError("multipart file part shrank while streaming")
+                    remaining -= len(chunk)
+                    yield chunk
+            yield CRLF
+        yield self._closing()
+
+    def reader(self):
+        """File-like read(n) view of the body, for APIs that pull data"""
+        return _MultipartReader(iter(self))
+
+
+class _MultipartReader:
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._pending = memoryview(b"")
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            out = bytes(self._pending) + b"".join(bytes(c) for c in self._chunks)
+            self._pending = memoryview(b"")
+            return out
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._pending = memoryview(chunk)
+        out, self._pending = self._pending[:size], self._pending[size:]
+        return bytes(out)
@@ -0,0 +1,85 @@
+# prefetch.py – budget and result slot for speculative Vary requests
+import datetime
+import json
+import os
+
+
+class DailyBudget:
+    """At most `limit` spends per calendar day, persisted across restarts"""
+
+    def __init__(self, path, limit):
+        self.path = path
+        self.limit = limit
+        self._date, self._used = self._today(), 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("date") == self._date:
+                self._used = int(saved.get("used", 0))
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _today():
+        return datetime.date.today().isoformat()
+
+    def used(self):
+        if self._date != self._today():
+            self._date, self._used = self._today(), 0
+        return self._used
+
+    def remaining(self):
+        return max(0, self.limit - self.used())
+
+    def spend(self):
+        """Use one request if the budget allows; returns whether it did"""
+        if self.remaining() <= 0:
+            return False
+        self._used += 1
+        try:
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"date": self._date, "used": self._used}, f)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            print(f"ArtAI: could not save prefetch budget: {e}")
+        return True
+
+
+class PrefetchSlot:
+    """Holds one prefetched result, keyed by the content hash it was made from.
+
+    A result is handed out once: take() with the matching key consumes it.
+    Only one result is ever kept, so memory is bounded by a single
+    canvas-sized buffer. Callers report hits/misses through record().
+    """
+
+    def __init__(self):
+        self.key = None
+        self.value = None
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, key, value):
+        self.key, self.value = key, value
+
+    def has(self, key):
+        return self.value is not None and self.key == key
+
+    def take(self, key):
+        if not self.has(key):
+            return None
+        value, self.key, self.value = self.value, None, None
+        return value
+
+    def record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def clear(self):
+        self.key = self.value = None
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
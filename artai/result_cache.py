@@ -0,0 +1,102 @@
+# result_cache.py – content-addressed on-disk cache of API results
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def make_key(mode, model, size, prompt, image_data=None, mask_data=None, variant=0):
+    """SHA-256 over the request parameters and the image/mask bytes.
+
+    `variant` tells apart candidates of one multi-candidate request, which
+    must not all come back as the same cached image.
+    """
+    digest = hashlib.sha256()
+    for part in (mode, model, size, prompt or ""):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    for blob in (image_data, mask_data):
+        digest.update(hashlib.sha256(blob).digest() if blob else b"-")
+    if variant:
+        digest.update(f"variant={variant}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Results stored as <dir>/<key[:2]>/<key>, evicted least-recently-used
+    first once the total size goes over max_bytes.
+
+    Recency is the file mtime, bumped on every hit, so the order survives
+    restarts. Safe to share between worker threads.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()     # key -> size, oldest first
+        self._total = 0
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load_index(self):
+        entries = []
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                st = os.stat(os.path.join(root, name))
+                entries.append((st.st_mtime, name, st.st_size))
+        for _mtime, key, size in sorted(entries):
+            self._index[key] = size
+            self._total += size
+
+    def get(self, key):
+        """Cached bytes for `key`, or None"""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                self._total -= self._index.pop(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written beside its final name and renamed, so a reader never sees half a result
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            self._total += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._index), "bytes": self._total}
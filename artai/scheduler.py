@@ -0,0 +1,244 @@
+# scheduler.py – queue, rate limit, retry and coalescing for ArtAI requests
+import itertools
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+# Status codes worth retrying: rate limited or a server-side hiccup
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate_per_minute` refill, up to `burst` saved up"""
+
+    def __init__(self, rate_per_minute, burst, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.clock = clock
+        self.updated = clock()
+
+    def set_rate(self, rate_per_minute):
+        self._refill()
+        self.rate = rate_per_minute / 60.0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Take a token; returns 0 on success, else seconds until one is free"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def retry_after_seconds(headers):
+    """Delay the server asked for via Retry-After / retry-after-ms, or None"""
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None, base=1.0, cap=60.0, rng=random):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+    delay = rng.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, kind, label, key, factory):
+        self.id = next(Job._ids)
+        self.kind = kind
+        self.label = label
+        self.key = key
+        self.factory = factory      # builds a fresh worker for every attempt
+        self.worker = None
+        self.state = "queued"       # queued / running / retrying / done / failed / cancelled
+        self.attempts = 0
+        self.retry_at = None
+        self.listeners = []         # (onResult, onError, onChunk) of every coalesced caller
+
+    def describe(self):
+        text = f"#{self.id} {self.kind}: {self.label}"
+        if len(self.listeners) > 1:
+            text += f" (x{len(self.listeners)})"
+        if self.state == "retrying" and self.retry_at is not None:
+            wait = max(0, self.retry_at - time.monotonic())
+            return f"{text} – retry {self.attempts} in {wait:.0f}s"
+        return f"{text} – {self.state}"
+
+
+class JobScheduler(QObject):
+    """Queues Generate/Vary/Edit/Critique jobs for the ArtAI docker.
+
+    Starts workers while the token bucket allows and fewer than
+    `maxConcurrent` are running, retries 429/5xx with jittered backoff, and
+    lets identical requests (same key) share one in-flight job.
+    """
+    jobsChanged = pyqtSignal()
+
+    def __init__(self, ratePerMinute=20, burst=4, maxConcurrent=4, maxRetries=4, parent=None):
+        super().__init__(parent)
+        self.bucket = TokenBucket(ratePerMinute, burst)
+        self.maxConcurrent = maxConcurrent
+        self.maxRetries = maxRetries
+        self.coalesced = 0
+        self._queue = deque()
+        self._running = {}          # worker -> job
+        self._byKey = {}            # key -> live job
+        self._jobs = {}             # id -> live job
+        self._pumpTimer = QTimer(self)
+        self._pumpTimer.setSingleShot(True)
+        self._pumpTimer.timeout.connect(self._pump)
+
+    # public -------------------------------------------------------------
+    def submit(self, kind, label, key, factory, onResult, onError, onChunk=None):
+        """Queue a job; returns it (an existing one if `key` is already in flight)"""
+        listener = (onResult, onError, onChunk)
+        if key is not None and key in self._byKey:
+            job = self._byKey[key]
+            job.listeners.append(listener)
+            self.coalesced += 1
+            self.jobsChanged.emit()
+            return job
+
+        job = Job(kind, label, key, factory)
+        job.listeners.append(listener)
+        self._jobs[job.id] = job
+        if key is not None:
+            self._byKey[key] = job
+        self._queue.append(job)
+        self.jobsChanged.emit()
+        self._pump()
+        return job
+
+    def cancel(self, jobId):
+        job = self._jobs.get(jobId)
+        if job is None:
+            return
+        if job in self._queue:
+            self._queue.remove(job)
+        running = job.state == "running"
+        self._finish(job, "cancelled")
+        # a running worker is stopped too; its own "Cancelled" error is dropped by _release
+        if running and hasattr(job.worker, "cancel"):
+            job.worker.cancel()
+        for _onResult, onError, _onChunk in job.listeners:
+            onError("Cancelled")
+
+    def find(self, key):
+        """The live job for `key`, or None"""
+        return self._byKey.get(key) if key is not None else None
+
+    def jobs(self):
+        return sorted(self._jobs.values(), key=lambda j: j.id)
+
+    def setRatePerMinute(self, rate):
+        self.bucket.set_rate(rate)
+        self._pump()
+
+    # internals ----------------------------------------------------------
+    def _pump(self):
+        while self._queue and len(self._running) < self.maxConcurrent:
+            wait = self.bucket.take()
+            if wait > 0:
+                self._pumpTimer.start(int(wait * 1000) + 1)
+                break
+            self._start(self._queue.popleft())
+        self.jobsChanged.emit()
+
+    def _start(self, job):
+        job.attempts += 1
+        job.state = "running"
+        try:
+            job.worker = worker = job.factory()
+        except Exception as e:
+            # the request couldn't even be built (e.g. a tile failed to render); _pump moves on
+            self._fail(job, str(e) or repr(e))
+            return
+        worker.finished.connect(self._onWorkerFinished)
+        worker.error.connect(self._onWorkerError)
+        if hasattr(worker, "chunk"):
+            worker.chunk.connect(self._onWorkerChunk)
+        self._running[worker] = job
+        worker.start()
+
+    def _release(self):
+        worker = self.sender()
+        job = self._running.pop(worker, None)
+        # finished/error are the last thing run() emits; join before dropping the thread
+        worker.wait()
+        self._pumpTimer.start(0)
+        return job if job is not None and job.state == "running" else None
+
+    def _onWorkerChunk(self, text):
+        job = self._running.get(self.sender())
+        if job is not None and job.state == "running":
+            for _onResult, _onError, onChunk in job.listeners:
+                if onChunk:
+                    onChunk(text)
+
+    def _onWorkerFinished(self, result):
+        job = self._release()
+        if job is None:
+            return
+        self._finish(job, "done")
+        for onResult, _onError, _onChunk in job.listeners:
+            onResult(result)
+
+    def _onWorkerError(self, message):
+        http_error = getattr(self.sender(), "http_error", None)
+        job = self._release()
+        if job is None:
+            return
+        if http_error is not None and http_error.code in RETRY_STATUSES and job.attempts <= self.maxRetries:
+            delay = backoff_delay(job.attempts - 1, retry_after_seconds(http_error.headers))
+            job.state = "retrying"
+            job.retry_at = time.monotonic() + delay
+            QTimer.singleShot(int(delay * 1000), lambda: self._requeue(job))
+            self.jobsChanged.emit()
+            return
+        self._fail(job, message)
+
+    def _fail(self, job, message):
+        self._finish(job, "failed")
+        for _onResult, onError, _onChunk in job.listeners:
+            onError(message)
+
+    def _requeue(self, job):
+        if job.state != "retrying":
+            return
+        job.state = "queued"
+        job.retry_at = None
+        self._queue.appendleft(job)
+        self._pump()
+
+    def _finish(self, job, state):
+        job.state = state
+        self._jobs.pop(job.id, None)
+        if job.key is not None and self._byKey.get(job.key) is job:
+            del self._byKey[job.key]
+        self.jobsChanged.emit()
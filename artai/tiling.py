@@ -0,0 +1,85 @@
+# tiling.py – overlapping API-sized tiles for canvases larger than the API resolution
+import math
+from PyQt5.QtCore import QRect, QPointF
+from PyQt5.QtGui import QImage, QPainter, QLinearGradient, QColor
+
+TILE_SIZE = 1024        # largest size the variations/edits endpoints accept
+TILE_OVERLAP = 128      # pixels shared by neighbouring tiles, blended across
+
+
+def _spans(start, length, tile, overlap):
+    """(offset, size) pairs covering start..start+length with at least `overlap`"""
+    if length <= tile:
+        return [(start, length)]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    return [(start + round(i * (length - tile) / (count - 1)), tile) for i in range(count)]
+
+
+def plan_tiles(region, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Tiles (QRects in canvas coordinates) covering `region`, row by row.
+
+    Tiles are at most tile x tile and spread evenly, so neighbours overlap
+    by `overlap` pixels or a little more; all tiles in a row share y and
+    height, all tiles in a column share x and width.
+    """
+    return [QRect(x, y, w, h)
+            for y, h in _spans(region.y(), region.height(), tile, overlap)
+            for x, w in _spans(region.x(), region.width(), tile, overlap)]
+
+
+def feather_tile(image, rect, placed):
+    """Fade `image` (the tile at `rect`) out towards tiles already on the canvas.
+
+    Only edges shared with a tile in `placed` get an alpha ramp across the
+    overlap, so painting the tile over the canvas cross-fades the seam and
+    the order tiles finish in doesn't matter. Diagonal neighbours are
+    covered by the ramps of the side neighbours.
+    """
+    image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+    painter = None
+    for other in placed:
+        overlap = rect.intersected(other)
+        if overlap.isEmpty():
+            continue
+        local = overlap.translated(-rect.x(), -rect.y())
+        if overlap.height() == rect.height():       # neighbour to the left or right
+            start, end = QPointF(local.left(), 0), QPointF(local.right() + 1, 0)
+            fade_in = other.x() < rect.x()
+        elif overlap.width() == rect.width():       # neighbour above or below
+            start, end = QPointF(0, local.top()), QPointF(0, local.bottom() + 1)
+            fade_in = other.y() < rect.y()
+        else:
+            continue
+        ramp = QLinearGradient(start, end)
+        ramp.setColorAt(0.0, QColor(0, 0, 0, 0 if fade_in else 255))
+        ramp.setColorAt(1.0, QColor(0, 0, 0, 255 if fade_in else 0))
+        if painter is None:
+            painter = QPainter(image)
+            painter.setCompositionMode(QPainter.CompositionMode_DestinationIn)
+        painter.fillRect(local, ramp)
+    if painter is not None:
+        painter.end()
+    return image
+
+
+def paste_tile(layer, image, rect, placed):
+    """Blend a finished tile into `layer` at `rect`.
+
+    Only the tile's own area of the layer is read and written, so memory
+    stays proportional to the tile, not the canvas.
+    """
+    tile = feather_tile(image, rect, placed)
+    x, y, w, h = rect.x(), rect.y(), rect.width(), rect.height()
+
+    if any(rect.intersects(other) for other in placed):
+        # 8-bit RGBA pixelData is BGRA, i.e. QImage.Format_ARGB32 in memory
+        raw = bytes(layer.pixelData(x, y, w, h))
+        canvas = QImage(raw, w, h, w * 4, QImage.Format_ARGB32).convertToFormat(
+            QImage.Format_ARGB32_Premultiplied)
+        painter = QPainter(canvas)
+        painter.drawImage(0, 0, tile)
+        painter.end()
+        tile = canvas
+
+    tile = tile.convertToFormat(QImage.Format_ARGB32)
+    layer.setPixelData(tile.bits().asstring(tile.byteCount()), x, y, w, h)
@@ -2,15 +2,20 @@ from krita import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import QImage, QPainter, QBrush, QIcon
-from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest, QNetworkReply
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest, QNetworkReply, QHttpMultiPart, QHttpPart
 import os
 import json
 import shutil
 import uuid
-import tempfile
 import mimetypes
+import time
 from datetime import datetime
 from .graph_view import CommitGraphView, GraphDialog
+from .object_store import ObjectStore
+from .commit_store import CommitStore
+from .commit_pipeline import CommitWorker, stage_document, STAGING_DIR
+from .layer_restore import kra_signatures, manifest_signatures, restore_layers
+from .version_cache import VersionCache, DEFAULT_MAX_BYTES
 
 class ArtAI(Extension):
     def __init__(self, parent):
@@ -38,6 +43,17 @@ class ArtAI(Extension):
     def createActions(self, window):
         pass
 
+def encode_png(image):
+    """PNG of a QImage as a QByteArray, encoded in memory"""
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    ok = image.save(buffer, "PNG")
+    buffer.close()
+    if not ok:
+        raise ValueError("Could not encode image as PNG")
+    return data
+
 class ArtGitDocker(DockWidget):
     def __init__(self):
         super().__init__()
@@ -72,6 +88,14 @@ class ArtGitDocker(DockWidget):
         self.commitButton.clicked.connect(self.commitCurrentVersion)
         commitLayout.addWidget(self.commitButton)
         
+        # Commits are stored in the background; progress and results show here
+        self.commitProgress = QProgressBar()
+        self.commitProgress.hide()
+        commitLayout.addWidget(self.commitProgress)
+        self.commitStatusLabel = QLabel()
+        self.commitStatusLabel.setWordWrap(True)
+        commitLayout.addWidget(self.commitStatusLabel)
+        
         mainWidget.layout().addWidget(commitGroupBox)
         
         # Version history list
@@ -119,6 +143,21 @@ class ArtGitDocker(DockWidget):
         
         historyLayout.addLayout(buttonLayout)
         
+        # Recently restored versions stay open, up to this much memory
+        cacheLayout = QHBoxLayout()
+        cacheLayout.addWidget(QLabel("Version cache (MB):"))
+        self.versionCacheSpin = QSpinBox()
+        self.versionCacheSpin.setRange(0, 65536)
+        self.versionCacheSpin.setSingleStep(256)
+        self.versionCacheSpin.setValue(DEFAULT_MAX_BYTES // (1024 * 1024))
+        self.versionCacheSpin.setToolTip("Memory for recently restored versions, so switching back is instant; 0 turns it off")
+        self.versionCacheSpin.valueChanged.connect(self.setVersionCacheSize)
+        cacheLayout.addWidget(self.versionCacheSpin)
+        historyLayout.addLayout(cacheLayout)
+        self.restoreStatusLabel = QLabel()
+        self.restoreStatusLabel.setWordWrap(True)
+        historyLayout.addWidget(self.restoreStatusLabel)
+        
         # Upload button on its own line
         uploadLayout = QHBoxLayout()
         uploadBtn = QPushButton("Upload")
@@ -128,7 +167,21 @@ class ArtGitDocker(DockWidget):
         
         mainWidget.layout().addWidget(historyGroupBox)
         
-        self.currentHead = self.loadVersionsData()["current_head"]
+        self.commitStores = {}      # versions dir -> CommitStore
+        self.pendingCommits = {}    # commit id -> (versions dir, message), oldest first
+        self.restoredHeads = {}     # document path -> (versions dir, commit id) restored but not yet saved
+        Krita.instance().notifier().imageSaved.connect(self.onImageSaved)
+        self.commitWorker = CommitWorker(self)
+        self.commitWorker.progress.connect(self.onCommitProgress)
+        self.commitWorker.committed.connect(self.onCommitStored)
+        self.commitWorker.skipped.connect(self.onCommitSkipped)
+        self.commitWorker.failed.connect(self.onCommitFailed)
+        QApplication.instance().aboutToQuit.connect(self.commitWorker.stop)
+        self.versionCache = VersionCache(self.versionCacheSpin.value() * 1024 * 1024)
+        QApplication.instance().aboutToQuit.connect(self.versionCache.clear)
+        self.shownHistory = None    # (versions dir, store version) the tree was built from
+        store = self.commitStore()
+        self.currentHead = store.head() if store else None
         
         # Load history on startup...
         self.refreshHistory()
@@ -149,19 +202,6 @@ class ArtGitDocker(DockWidget):
                 self.historyTree.scrollToItem(leaf)
                 break
 
-    # helper: drop malformed records that break refreshHistory()
-    def _sanitizeCommits(self, data):
-        """Drop malformed or duplicate commit entries."""
-        seen = set()
-        bad  = []
-        for k, v in data["commits"].items():
-            if not isinstance(v, dict) or "timestamp" not in v or k in seen:
-                bad.append(k)
-            seen.add(k)
-        for k in bad:
-            del data["commits"][k]
-        return data
-
     def canvasChanged(self, canvas):
         self.refreshHistory()
 
@@ -191,50 +231,17 @@ class ArtGitDocker(DockWidget):
         
         return versionsDir
     
-    def getVersionsJsonPath(self):
-        """Get the path to the versions.json file"""
-        versionsDir = self.getVersionsDir()
+    def commitStore(self, versionsDir=None):
+        """Commit index of `versionsDir` (default: the active document's), or None"""
+        versionsDir = versionsDir or self.getVersionsDir()
         if versionsDir is None:
             return None
-        return os.path.join(versionsDir, "versions.json")
-    
-    def loadVersionsData(self):
-        path = self.getVersionsJsonPath()
-        if not path or not os.path.exists(path):
-            return {"commits": {}, "current_head": None}
-        try:
-            data = json.load(open(path, "r"))
-        except Exception:
-            return {"commits": {}, "current_head": None}
-
-        # legacy list → dict migration  (keep if you still have old files)
-        if isinstance(data.get("commits"), list):
-            data = {
-                "commits": {c["id"]: c for c in data["commits"]},
-                "current_head": None
-            }
-        elif isinstance(next(iter(data["commits"].values()), {}), list):
-            flat = {}
-            for lst in data["commits"].values():
-                for c in lst:
-                    flat[c["id"]] = c
-            data = {"commits": flat, "current_head": data.get("current_head")}
-
-        return self._sanitizeCommits(data)   # ← now it’s defined
-
-
-    def saveVersionsData(self, data):
-        """Save versions data to JSON file"""
-        jsonPath = self.getVersionsJsonPath()
-        if jsonPath is None:
-            return False
-        
-        try:
-            with open(jsonPath, 'w') as f:
-                json.dump(data, f, indent=2)
-            return True
-        except:
-            return False
+        store = self.commitStores.get(versionsDir)
+        if store is None:
+            # staged files left over from a crash; nothing is queued for this dir yet
+            shutil.rmtree(os.path.join(versionsDir, STAGING_DIR), ignore_errors=True)
+            store = self.commitStores[versionsDir] = CommitStore(versionsDir)
+        return store
     
     def commitCurrentVersion(self):
         """Commit the current version of the document"""
@@ -262,70 +269,97 @@ class ArtGitDocker(DockWidget):
         timestampStr = timestamp.strftime("%Y%m%d_%H%M%S")
         versionId = f"v_{timestampStr}"
         
-        # Save the current document to versions directory
         docPath = doc.fileName()
         docName = os.path.splitext(os.path.basename(docPath))[0]
-        docExt = os.path.splitext(os.path.basename(docPath))[1]
-        versionFileName = f"{versionId}_{docName}{docExt}"
-        versionPath = os.path.join(versionsDir, versionFileName)
         
         try:
             # Save current document
             doc.save()
-
-            # Create preview image without dialog
-            previewFileName = f"{versionId}_{docName}.png"
-            previewPath = os.path.join(versionsDir, previewFileName)
-            
-            # Get document thumbnail directly (no dialog)
-            self.createPreviewThumbnail(doc, previewPath)
-            
-            # Copy to versions directory
-            shutil.copy2(docPath, versionPath)
-            
-            # Update versions data
-            data = self.loadVersionsData()
-
-            parent_id   = data.get("current_head")
-            commit_id =  str(uuid.uuid4())
-
-            versionInfo = {
-                "id":        commit_id,
-                "parent":    parent_id,
-                "message":   commitMessage,
-                "timestamp": timestamp.isoformat(),
-                "display_time": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                "filename":  versionFileName,
-                "preview":   previewFileName
-            }
+            self.onImageSaved(docPath)
             
-
-            data["commits"][commit_id]  = versionInfo
-            data["current_head"]        = commit_id
-            self.currentHead            = commit_id
-
-            # Save versions data
-            self.saveVersionsData(data)
+            # Chain onto the newest queued commit of this document, else the head
+            commits = self.commitStore(versionsDir)
+            queued = [cid for cid, (d, _) in self.pendingCommits.items() if d == versionsDir]
+            parent_id = queued[-1] if queued else commits.head()
+            parent = commits.get(parent_id) if parent_id else None
+            commit_id = str(uuid.uuid4())
             
-            # Clear commit message and refresh history
+            # Only the cheap part happens here: freeze the saved file and grab a thumbnail
+            self.commitWorker.enqueue({
+                "id": commit_id,
+                "parent": parent_id,
+                "parent_manifest": parent.get("manifest") if parent else None,
+                "message": commitMessage,
+                "timestamp": timestamp,
+                "versions_dir": versionsDir,
+                "staged": stage_document(docPath, versionsDir, commit_id),
+                "preview": f"{versionId}_{docName}.png",
+                "thumbnail": doc.thumbnail(256, 256)
+            })
+            self.pendingCommits[commit_id] = (versionsDir, commitMessage)
             self.commitMessageEdit.clear()
-            self.refreshHistory()
-            
-            QMessageBox.information(
-                self, "Success",
-                f"Committed {commit_id[:8]}…")
+            self.updateCommitStatus(f"Commit queued: {commitMessage}")
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to commit version: {str(e)}")
     
+    def updateCommitStatus(self, text):
+        waiting = len(self.pendingCommits)
+        if waiting > 1:
+            text += f" ({waiting} commits queued)"
+        self.commitStatusLabel.setText(text)
+        self.commitProgress.setVisible(waiting > 0)
+        if waiting == 0:
+            self.commitProgress.reset()
+    
+    def onImageSaved(self, fileName):
+        """A restored version becomes the head once the document holding it is saved"""
+        restored = self.restoredHeads.pop(fileName, None)
+        if restored is None:
+            return
+        versionsDir, commitId = restored
+        self.commitStore(versionsDir).set_head(commitId)
+        if versionsDir == self.getVersionsDir():
+            self.currentHead = commitId
+            self.refreshHistory()
+    
+    def onCommitProgress(self, commitId, done, total):
+        self.commitProgress.setMaximum(total)
+        self.commitProgress.setValue(done)
+        message = self.pendingCommits.get(commitId, ("", ""))[1]
+        self.commitProgress.setFormat(f"Storing '{message}': %v/%m parts")
+    
+    def onCommitStored(self, versionsDir, versionInfo):
+        # One journal line; the new commit becomes the head
+        self.pendingCommits.pop(versionInfo["id"], None)
+        self.commitStore(versionsDir).add_commit(versionInfo)
+        if versionsDir == self.getVersionsDir():
+            self.currentHead = versionInfo["id"]
+            self.refreshHistory()
+        self.updateCommitStatus(f"Committed {versionInfo['id'][:8]}… {versionInfo['message']}")
+    
+    def onCommitSkipped(self, versionsDir, commitId):
+        _, message = self.pendingCommits.pop(commitId, (None, ""))
+        self.updateCommitStatus(f"Nothing to commit for '{message}': "
+                                "the document hasn't changed since the previous version.")
+    
+    def onCommitFailed(self, versionsDir, commitId, error):
+        _, message = self.pendingCommits.pop(commitId, (None, ""))
+        self.updateCommitStatus(f"Commit '{message}' failed: {error}")
+        QMessageBox.critical(self, "Error", f"Failed to commit version: {error}")
+    
     def refreshHistory(self):
+        store = self.commitStore()
+        versionsDir = self.getVersionsDir()
+        commits = store.history() if store else []
+        shown = (versionsDir, store.version if store else None)
+        if shown == self.shownHistory:
+            return  # nothing changed since the tree was built
+        self.shownHistory = shown
+        
         self.historyTree.setUpdatesEnabled(False)
         self.historyTree.clear()
 
-        data = self.loadVersionsData()
-        commits = sorted(data["commits"].values(),
-                        key=lambda c: c["timestamp"], reverse=True)
-
         for c in commits:
             leaf = QTreeWidgetItem([
                 f"{c['id'][:8]}…",
@@ -333,7 +367,7 @@ class ArtGitDocker(DockWidget):
                 c["message"]
             ])
             leaf.setData(0, Qt.UserRole, c)
-            iconPath = os.path.join(self.getVersionsDir(), c.get("preview", ""))
+            iconPath = os.path.join(versionsDir, c.get("preview", ""))
             if os.path.exists(iconPath):
                 leaf.setIcon(0, QIcon(iconPath))
             self.historyTree.addTopLevelItem(leaf)
@@ -360,11 +394,25 @@ class ArtGitDocker(DockWidget):
             QMessageBox.warning(self, "Error", "Could not access versions directory.")
             return
         
-        versionPath = os.path.join(versionsDir, versionData["filename"])
-        if not os.path.exists(versionPath):
-            QMessageBox.warning(self, "Error", f"Version file not found: {versionData['filename']}")
+        if any(d == versionsDir for d, _ in self.pendingCommits.values()):
+            QMessageBox.warning(self, "Busy", "Please wait until the queued commits are stored.")
             return
         
+        # Commits made before the object store keep a full copy of the file
+        store = ObjectStore(versionsDir)
+        manifestId = versionData.get("manifest")
+        if manifestId:
+            if not store.has(manifestId):
+                QMessageBox.warning(self, "Error", f"Version data not found: {manifestId[:12]}")
+                return
+            ext = os.path.splitext(currentDoc.fileName())[1]
+            versionPath = os.path.join(versionsDir, f"checkout_{versionData['id'][:8]}{ext}")
+        else:
+            versionPath = os.path.join(versionsDir, versionData["filename"])
+            if not os.path.exists(versionPath):
+                QMessageBox.warning(self, "Error", f"Version file not found: {versionData['filename']}")
+                return
+        
         # Ask user if they want to restore to this version
         reply = QMessageBox.question(self, "Restore Version", 
                                    f"Do you want to restore the current document to:\n{versionData['message']}\n({versionData['display_time']})\n\nThis will replace the current state with the selected version.",
@@ -372,61 +420,75 @@ class ArtGitDocker(DockWidget):
         
         if reply == QMessageBox.Yes:
             try:
-                # Save current state before restoring (optional safety backup)
-                currentDoc.save()
-                
-                # Get current document path
-                currentDocPath = currentDoc.fileName()
-                
-                # Load the version document temporarily
-                versionDoc = Krita.instance().openDocument(versionPath)
-                if not versionDoc:
-                    QMessageBox.critical(self, "Error", "Failed to load the version file.")
-                    return
+                started = time.perf_counter()
                 
-                # Get all the nodes (layers) from the version document
-                versionRootNode = versionDoc.rootNode()
-                
-                # Clear all nodes from current document
-                currentRootNode = currentDoc.rootNode()
-                for child in currentRootNode.childNodes():
-                    child.remove()
-                
-                # Copy all nodes from version to current document
-                for child in versionRootNode.childNodes():
-                    # Clone the node and add it to current document
-                    clonedNode = child.clone()
-                    currentRootNode.addChildNode(clonedNode, None)
-                
-                currentDoc.setResolution(int(versionDoc.xRes()))
-                
-                currentDoc.resizeImage(0, 0, versionDoc.width(), versionDoc.height())
+                # A recently restored version is still open; otherwise check it out and open it
+                cacheKey = (versionsDir, manifestId or versionData["filename"])
+                cached = self.versionCache.get(cacheKey)
+                if cached:
+                    versionDoc, versionLayers = cached
+                else:
+                    # Rebuild the version's .kra from its blobs
+                    if manifestId:
+                        manifest = store.read_manifest(manifestId)
+                        store.checkout(manifest, versionPath)
+                        versionLayers = manifest_signatures(store, manifest)
+                    else:
+                        versionLayers = kra_signatures(versionPath)
                     
-               
+                    # Load the version document; Krita reads it completely
+                    versionDoc = Krita.instance().openDocument(versionPath)
+                    if not versionDoc:
+                        if manifestId:
+                            os.remove(versionPath)
+                        QMessageBox.critical(self, "Error", "Failed to load the version file.")
+                        return
                 
-                currentDoc.setColorSpace(versionDoc.colorModel(), versionDoc.colorDepth(), versionDoc.colorProfile())
+                # While the document matches its file, the file says what each layer holds
+                currentLayers = None if currentDoc.modified() else kra_signatures(currentDoc.fileName())
                 
-                # Close the temporary version document
-                versionDoc.close()
+                # Swap in only the layers that differ; the rest stay untouched
+                stats = restore_layers(currentDoc, versionDoc, currentLayers, versionLayers)
                 
-                # Refresh the current document view
-                currentDoc.refreshProjection()
+                # Keep the version document open for the next restore (closed if over budget)
+                if not cached:
+                    self.versionCache.put(cacheKey, versionDoc, versionLayers)
                 
-                # Save the restored document
-                currentDoc.save()
-
-                data = self.loadVersionsData()
-                data["current_head"] = versionData["id"]
-                self.currentHead     = versionData["id"]
-                self.saveVersionsData(data)
-
+                if stats["replaced"] or stats["removed"] or stats["image"]:
+                    currentDoc.refreshProjection()
                 
-                QMessageBox.information(self, "Success", 
-                                      f"Document restored to version:\n{versionData['message']}\n({versionData['display_time']})")
+                # The document is left modified: the layers match the version, but the
+                # file on disk is only rewritten when the user saves (guides, annotations
+                # and other document state are not part of the restore). Until then the
+                # file still holds the old head, so the restored version waits to become it
+                if manifestId and os.path.exists(versionPath):
+                    os.remove(versionPath)
+                elapsed = (time.perf_counter() - started) * 1000
+                print(f"ArtGit: restored {versionData['id'][:8]}, replaced {stats['replaced']} "
+                      f"and removed {stats['removed']} of {stats['nodes']} layers in {elapsed:.0f} ms")
+
+                self.restoredHeads[currentDoc.fileName()] = (versionsDir, versionData["id"])
+
+                cache = self.versionCache.stats()
+                self.showRestoreStatus(
+                    f"Restored '{versionData['message']}' {'from cache ' if cached else ''}in {elapsed:.0f} ms, "
+                    f"{stats['replaced']} of {stats['nodes']} layers replaced. Version cache: "
+                    f"{cache['hits']} hits / {cache['misses']} misses, {cache['entries']} open, "
+                    f"{cache['bytes'] / 2 ** 20:.0f} MB. Save to make it the current version.")
                     
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Failed to restore version: {str(e)}")
 
+    def showRestoreStatus(self, text):
+        """In the docker, and for a few seconds in Krita's status bar"""
+        self.restoreStatusLabel.setText(text)
+        window = Krita.instance().activeWindow()
+        if window is not None and window.qwindow() is not None:
+            window.qwindow().statusBar().showMessage(text, 5000)
+    
+    def setVersionCacheSize(self, megabytes):
+        self.versionCache.set_max_bytes(megabytes * 1024 * 1024)
+    
     def restoreSelectedVersion(self):
         sel = self.historyTree.currentItem()
         if not sel:
@@ -435,21 +497,13 @@ class ArtGitDocker(DockWidget):
 
         self.restoreTreeVersion(sel, 0)
     
-    def createPreviewThumbnail(self, doc, previewPath):
-        """Create a thumbnail preview without showing dialog"""
-        try:
-            # Use Krita's built-in thumbnail method - no dialog
-            thumbnail = doc.thumbnail(256, 256)
-            thumbnail.save(previewPath, "PNG")
-        except Exception as e:
-            # If thumbnail fails, skip preview
-            pass
-
     def showGraphWindow(self):
-        data    = self.loadVersionsData()
+        store = self.commitStore()
+        if store is None:
+            return
         versions_dir = self.getVersionsDir() 
-        commits = sorted(data["commits"].values(),
-                        key=lambda c: c["timestamp"], reverse=True)
+        # copies: preview_abs is added for the dialog only
+        commits = [dict(c) for c in store.history()]
         commits_by_id = {c["id"]: c for c in commits}
 
         for c in commits:
@@ -476,19 +530,11 @@ class ArtGitDocker(DockWidget):
             return
         
         try:
-            # Create a temporary file for export
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                temp_path = temp_file.name
-            
-            # Export the document as PNG - use save method with PNG format
             # First save current document
             doc.save()
             
-            # Create a copy and save as PNG
-            temp_doc = doc.clone()
-            temp_doc.flatten()
-            temp_doc.saveAs(temp_path)
-            temp_doc.close()
+            # Encode the flattened projection as PNG in memory
+            file_data = encode_png(doc.projection(0, 0, doc.width(), doc.height()))
             
             # Show upload progress
             progress = QProgressDialog("Uploading file...", "Cancel", 0, 0, self)
@@ -503,42 +549,27 @@ class ArtGitDocker(DockWidget):
             url = QUrl("http://localhost:3000/api/upload")
             request = QNetworkRequest(url)
             
-            # Read the exported file
-            with open(temp_path, 'rb') as f:
-                file_data = f.read()
-            
-            # Create multipart data manually
-            boundary = f"----WebKitFormBoundary{uuid.uuid4().hex}"
-            request.setHeader(QNetworkRequest.ContentTypeHeader, f"multipart/form-data; boundary={boundary}")
-            
             # Get original filename or use a default
             original_name = os.path.basename(doc.fileName())
             filename = os.path.splitext(original_name)[0] + '.png'
             
-            # Build multipart form data
-            form_data = []
-            form_data.append(f"--{boundary}".encode())
-            form_data.append(f'Content-Disposition: form-data; name="image"; filename="{filename}"'.encode())
-            form_data.append(b'Content-Type: image/png')
-            form_data.append(b'')
-            form_data.append(file_data)
-            form_data.append(f"--{boundary}--".encode())
+            # Qt streams the multipart body part by part; the PNG is not copied into it
+            form_data = QHttpMultiPart(QHttpMultiPart.FormDataType)
+            image_part = QHttpPart()
+            image_part.setHeader(QNetworkRequest.ContentTypeHeader, "image/png")
+            image_part.setHeader(QNetworkRequest.ContentDispositionHeader,
+                                 f'form-data; name="image"; filename="{filename}"')
+            image_part.setBody(file_data)
+            form_data.append(image_part)
             
-            body = b'\r\n'.join(form_data)
-            
-            # Send the request
-            reply = self.network_manager.post(request, body)
+            # Send the request; the body lives as long as the reply
+            reply = self.network_manager.post(request, form_data)
+            form_data.setParent(reply)
             
             # Handle response
             def on_upload_finished():
                 progress.close()
                 
-                # Clean up temp file
-                try:
-                    os.unlink(temp_path)
-                except:
-                    pass
-                
                 if reply.error() == QNetworkReply.NoError:
                     response_data = reply.readAll().data()
                     try:
@@ -575,21 +606,11 @@ class ArtGitDocker(DockWidget):
             # Handle cancel
             def cancel_upload():
                 reply.abort()
-                try:
-                    os.unlink(temp_path)
-                except:
-                    pass
             
             progress.canceled.connect(cancel_upload)
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to export/upload file: {str(e)}")
-            # Clean up temp file if it exists
-            try:
-                if 'temp_path' in locals():
-                    os.unlink(temp_path)
-            except:
-                pass
 
 
 class ArtGit(Extension):
@@ -0,0 +1,117 @@
+# commit_pipeline.py – stores ArtGit commits on a worker thread, in the order they were made
+import os
+import queue
+import shutil
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from .object_store import ObjectStore, manifest_key
+
+STAGING_DIR = "staging"
+
+
+def stage_document(docPath, versionsDir, commitId):
+    """Freeze the saved .kra for a queued commit; returns the staged path.
+
+    A hard link costs nothing and keeps the saved bytes even after Krita
+    saves again (it writes a new file and renames it over the old one).
+    Where links aren't possible the file is copied.
+    """
+    stagingDir = os.path.join(versionsDir, STAGING_DIR)
+    os.makedirs(stagingDir, exist_ok=True)
+    staged = os.path.join(stagingDir, commitId + os.path.splitext(docPath)[1])
+    try:
+        os.link(docPath, staged)
+    except OSError:
+        shutil.copy2(docPath, staged)
+    return staged
+
+
+class CommitWorker(QThread):
+    """Turns staged documents into stored commits, one at a time, in queue order.
+
+    A job is a dict with "id", "parent", "parent_manifest", "message",
+    "timestamp", "versions_dir", "staged", "preview" (file name) and
+    "thumbnail" (QImage). Hashing and storing the members, encoding the
+    preview and building the version info happen here; the docker appends
+    the finished commit to its CommitStore when `committed` arrives, so
+    the store itself is only ever touched from the UI thread.
+
+    Jobs queued behind each other chain up: a job's parent may be one that
+    is still queued, and if that one turns out to be unchanged and is
+    skipped, its parent is used instead.
+    """
+    progress = pyqtSignal(str, int, int)    # commit id, members done, members total
+    committed = pyqtSignal(str, dict)       # versions dir, version info
+    skipped = pyqtSignal(str, str)          # versions dir, commit id
+    failed = pyqtSignal(str, str, str)      # versions dir, commit id, error message
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._jobs = queue.Queue()
+        self._manifests = {}    # commit id -> manifest id, for commits made here
+        self._skipped = {}      # skipped commit id -> the parent it stood in for
+
+    def enqueue(self, job):
+        self._jobs.put(job)
+        if not self.isRunning():
+            self.start()
+
+    def stop(self):
+        """Finish the queued jobs, then end the thread"""
+        if self.isRunning():
+            self._jobs.put(None)
+            self.wait()
+
+    def run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                self.process(job)
+            except Exception as e:
+                self._skipped[job["id"]] = job["parent"]
+                self.failed.emit(job["versions_dir"], job["id"], str(e) or repr(e))
+            finally:
+                if os.path.exists(job["staged"]):
+                    os.remove(job["staged"])
+
+    def process(self, job):
+        started = time.perf_counter()
+        parent = job["parent"]
+        while parent in self._skipped:
+            parent = self._skipped[parent]
+        parentManifest = self._manifests.get(parent, job["parent_manifest"])
+
+        store = ObjectStore(job["versions_dir"])
+        previous = None
+        if parentManifest and store.has(parentManifest):
+            previous = store.read_manifest(parentManifest)
+        manifest = store.snapshot(job["staged"], previous,
+                                  lambda done, total: self.progress.emit(job["id"], done, total))
+        print(f"ArtGit: stored {store.stats['stored']} of {store.stats['members']} members "
+              f"({store.stats['bytes_stored']} bytes) in {(time.perf_counter() - started) * 1000:.0f} ms")
+        if previous is not None and manifest_key(manifest) == manifest_key(previous):
+            self._skipped[job["id"]] = parent
+            self.skipped.emit(job["versions_dir"], job["id"])
+            return
+        manifestId = store.put_manifest(manifest)
+
+        # Preview is written next to the commits, renamed into place once complete
+        previewPath = os.path.join(job["versions_dir"], job["preview"])
+        if not job["thumbnail"].isNull() and job["thumbnail"].save(previewPath + ".tmp", "PNG"):
+            os.replace(previewPath + ".tmp", previewPath)
+
+        timestamp = job["timestamp"]
+        self._manifests[job["id"]] = manifestId
+        self.committed.emit(job["versions_dir"], {
+            "id":        job["id"],
+            "parent":    parent,
+            "message":   job["message"],
+            "timestamp": timestamp.isoformat(),
+            "display_time": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            "manifest":  manifestId,
+            "preview":   job["preview"]
+        })
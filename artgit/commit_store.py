@@ -0,0 +1,185 @@
+# commit_store.py – ArtGit's commit index: append-only journal plus a compacted snapshot
+import json
+import os
+
+SNAPSHOT_FILE = "commits.json"
+JOURNAL_FILE = "commits.journal"
+LEGACY_FILE = "versions.json"
+
+# Journal entries after which they are folded into the snapshot
+COMPACT_AFTER = 1000
+
+
+def sanitize_commits(commits):
+    """Drop malformed commit entries (not a dict, or no timestamp)"""
+    return {k: v for k, v in commits.items() if isinstance(v, dict) and "timestamp" in v}
+
+
+def migrate_legacy(data):
+    """versions.json contents in any of its historical shapes -> {"commits", "current_head"}"""
+    if isinstance(data.get("commits"), list):
+        data = {
+            "commits": {c["id"]: c for c in data["commits"]},
+            "current_head": None
+        }
+    elif isinstance(next(iter(data.get("commits", {}).values()), {}), list):
+        flat = {}
+        for lst in data["commits"].values():
+            for c in lst:
+                flat[c["id"]] = c
+        data = {"commits": flat, "current_head": data.get("current_head")}
+    return {"commits": sanitize_commits(data.get("commits", {})), "current_head": data.get("current_head")}
+
+
+class CommitStore:
+    """Commits and current head of one versions directory.
+
+    A commit or head move appends one line to the journal; the whole
+    index is only rewritten when COMPACT_AFTER journal lines are folded
+    into the snapshot. Reads are served from memory, reloaded only when the
+    files' mtime/size change (e.g. another Krita window committed). An
+    old versions.json is migrated once, on first open.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.snapshotPath = os.path.join(root, SNAPSHOT_FILE)
+        self.journalPath = os.path.join(root, JOURNAL_FILE)
+        self.version = 0            # bumped on every change, for views caching what they show
+        self._commits = {}
+        self._head = None
+        self._history = None
+        self._journalLines = 0
+        self._tornTail = False      # journal ends mid-line after a crash
+        self._stamp = None
+        self._migrate()
+
+    # reading ------------------------------------------------------------
+    def commits(self):
+        """{id: commit}; treat as read-only"""
+        self._refresh()
+        return self._commits
+
+    def get(self, commitId):
+        return self.commits().get(commitId)
+
+    def head(self):
+        self._refresh()
+        return self._head
+
+    def history(self):
+        """Commits newest first; treat as read-only"""
+        self._refresh()
+        if self._history is None:
+            self._history = sorted(self._commits.values(), key=lambda c: c["timestamp"], reverse=True)
+        return self._history
+
+    # writing ------------------------------------------------------------
+    def add_commit(self, commit):
+        """Record `commit` and make it the current head"""
+        self._append({"op": "commit", "commit": commit})
+
+    def set_head(self, commitId):
+        self._append({"op": "head", "id": commitId})
+
+    def compact(self):
+        """Fold the journal into the snapshot"""
+        tmp = self.snapshotPath + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"commits": self._commits, "current_head": self._head}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshotPath)
+        # a crash before this truncate only replays entries the snapshot already has
+        open(self.journalPath, "w").close()
+        self._journalLines = 0
+        self._tornTail = False
+        self._stamp = self._currentStamp()
+
+    # internals ----------------------------------------------------------
+    def _currentStamp(self):
+        stamp = []
+        for path in (self.snapshotPath, self.journalPath):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _refresh(self):
+        stamp = self._currentStamp()
+        if stamp != self._stamp:
+            self._load()
+            self._stamp = stamp
+
+    def _load(self):
+        self._commits, self._head = {}, None
+        try:
+            with open(self.snapshotPath, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._commits = sanitize_commits(data.get("commits", {}))
+            self._head = data.get("current_head")
+        except (OSError, ValueError):
+            pass
+
+        self._journalLines, self._tornTail = 0, False
+        try:
+            with open(self.journalPath, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._journalLines += 1
+                    self._tornTail = not line.endswith("\n")
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue    # torn last line after a crash
+        except OSError:
+            pass
+        self._changed()
+
+    def _apply(self, entry):
+        if entry["op"] == "commit":
+            commit = entry["commit"]
+            if isinstance(commit, dict) and "timestamp" in commit:
+                self._commits[commit["id"]] = commit
+                self._head = commit["id"]
+        elif entry["op"] == "head":
+            self._head = entry["id"]
+
+    def _changed(self):
+        self._history = None
+        self.version += 1
+
+    def _append(self, entry):
+        self._refresh()
+        line = json.dumps(entry) + "\n"
+        if self._tornTail:
+            line = "\n" + line
+        with open(self.journalPath, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journalLines += 1
+        self._tornTail = False
+        self._apply(entry)
+        self._changed()
+        if self._journalLines >= COMPACT_AFTER:
+            self.compact()
+        else:
+            self._stamp = self._currentStamp()
+
+    def _migrate(self):
+        legacyPath = os.path.join(self.root, LEGACY_FILE)
+        if os.path.exists(self.snapshotPath) or os.path.exists(self.journalPath) or not os.path.exists(legacyPath):
+            return
+        try:
+            with open(legacyPath, "r", encoding="utf-8") as f:
+                data = migrate_legacy(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"ArtGit: could not migrate {legacyPath}: {e}")
+            return
+        self._commits, self._head = data["commits"], data["current_head"]
+        self.compact()
+        os.replace(legacyPath, legacyPath + ".migrated")
+        self._changed()
+        print(f"ArtGit: migrated {len(self._commits)} commits from {LEGACY_FILE}")
@@ -0,0 +1,157 @@
+# layer_restore.py – brings an open document to a stored version, replacing only the layers that differ
+import xml.etree.ElementTree as ET
+import zipfile
+
+MAINDOC = "maindoc.xml"
+
+# maindoc.xml attributes that say nothing about a node's content
+IGNORED_ATTRIBUTES = {"filename", "uuid", "selected", "collapsed"}
+
+
+def node_key(name, isMask, seen):
+    """A node's key among its siblings: name, mask or not, and how many earlier siblings share both"""
+    count = seen.get((name, isMask), 0)
+    seen[(name, isMask)] = count + 1
+    return (name, isMask, count)
+
+
+def layer_signatures(maindoc, members):
+    """{key path: signature} for the layers and masks listed in a .kra's maindoc.xml.
+
+    `members` maps the .kra's member names to (crc, size). A signature is
+    the node's attributes plus the crc/size of its data members, so two
+    saves of the same layer compare equal without reading any pixels.
+    Nodes are keyed by name path, not uuid (a cloned node gets a new one);
+    siblings sharing a name get None, and so does everything below them,
+    as their order can't be matched up with the open document's.
+    """
+    data = {}
+    for name, stamp in members.items():
+        if "/layers/" in name:
+            stem, _, suffix = name.rsplit("/layers/", 1)[1].partition(".")
+            data.setdefault(stem, []).append((suffix, stamp))
+    signatures = {}
+
+    def walk(element, path, ambiguous):
+        seen, nodes = {}, []
+        for container in element:
+            if container.tag in ("layers", "masks"):
+                for child in container:
+                    if child.tag in ("layer", "mask"):
+                        nodes.append((node_key(child.get("name", ""), child.tag == "mask", seen), child))
+        for key, child in nodes:
+            nodePath = path + (key,)
+            childAmbiguous = ambiguous or seen[key[:2]] > 1
+            if childAmbiguous:
+                signatures[nodePath] = None
+            else:
+                attributes = sorted((k, v) for k, v in child.attrib.items() if k not in IGNORED_ATTRIBUTES)
+                signatures[nodePath] = (attributes, sorted(data.get(child.get("filename"), [])))
+            walk(child, nodePath, childAmbiguous)
+
+    image = ET.fromstring(maindoc).find("IMAGE")
+    if image is not None:
+        walk(image, (), False)
+    return signatures
+
+
+def kra_signatures(path):
+    """layer_signatures of a .kra on disk, or None if it isn't one"""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            members = {info.filename: (info.CRC, info.file_size) for info in zf.infolist()}
+            return layer_signatures(zf.read(MAINDOC), members)
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError):
+        return None
+
+
+def manifest_signatures(store, manifest):
+    """layer_signatures of a committed .kra, read from its manifest and maindoc.xml blob"""
+    members = {m["name"]: (m["crc"], m["size"]) for m in manifest["members"]}
+    maindoc = next((m["sha256"] for m in manifest["members"] if m["name"] == MAINDOC), None)
+    if maindoc is None:
+        return None
+    try:
+        return layer_signatures(store.read_bytes(maindoc), members)
+    except ET.ParseError:
+        return None
+
+
+def nodes_equal(a, b):
+    """Compare two nodes through the Krita API; group layers by their own properties only"""
+    if (a.type(), a.name(), a.visible(), a.opacity(), a.blendingMode()) != \
+            (b.type(), b.name(), b.visible(), b.opacity(), b.blendingMode()):
+        return False
+    if a.type() == "grouplayer":
+        return True
+    bounds = a.bounds()
+    if bounds != b.bounds():
+        return False
+    rect = (bounds.x(), bounds.y(), bounds.width(), bounds.height())
+    return a.pixelData(*rect) == b.pixelData(*rect)
+
+
+def restore_layers(current, version, currentSignatures=None, versionSignatures=None):
+    """Make `current` (a Document) match `version`, cloning only the nodes that differ.
+
+    Nodes are matched by name path. A pair is judged by their signatures
+    when both are known (`currentSignatures` is only valid while `current`
+    is unmodified since it was saved), otherwise by nodes_equal. A node
+    that matches stays where it is, untouched; one that differs is swapped
+    for a clone in the same place. Returns counts of "nodes" visited,
+    "replaced", "removed", and whether the image itself ("image") changed.
+    """
+    stats = {"nodes": 0, "replaced": 0, "removed": 0, "image": False}
+    currentSignatures = currentSignatures or {}
+    versionSignatures = versionSignatures or {}
+
+    def same(path, node, target):
+        if node.type() != target.type():
+            return False
+        mine, theirs = currentSignatures.get(path), versionSignatures.get(path)
+        if mine is not None and theirs is not None:
+            return mine == theirs
+        return nodes_equal(node, target)
+
+    def keyed(nodes):
+        seen = {}
+        return [(node_key(node.name(), node.type().endswith("mask"), seen), node) for node in nodes]
+
+    def sync(parent, versionParent, path):
+        existing = dict(keyed(parent.childNodes()))
+        order, below = [], None
+        for key, target in keyed(versionParent.childNodes()):
+            nodePath = path + (key,)
+            stats["nodes"] += 1
+            node = existing.pop(key, None)
+            if node is not None and same(nodePath, node, target):
+                sync(node, target, nodePath)
+            else:
+                clone = target.clone()
+                parent.addChildNode(clone, node if node is not None else below)
+                if node is not None:
+                    node.remove()
+                node = clone
+                stats["replaced"] += 1
+            order.append(node)
+            below = node
+        for node in existing.values():
+            node.remove()
+            stats["removed"] += 1
+        # a new bottom node or a reordered stack; rare enough to just relink the children
+        if [n.uniqueId() for n in parent.childNodes()] != [n.uniqueId() for n in order]:
+            parent.setChildNodes(order)
+
+    sync(current.rootNode(), version.rootNode(), ())
+
+    if (current.width(), current.height()) != (version.width(), version.height()):
+        current.resizeImage(0, 0, version.width(), version.height())
+        stats["image"] = True
+    if int(current.xRes()) != int(version.xRes()):
+        current.setResolution(int(version.xRes()))
+        stats["image"] = True
+    colorSpace = (version.colorModel(), version.colorDepth(), version.colorProfile())
+    if (current.colorModel(), current.colorDepth(), current.colorProfile()) != colorSpace:
+        current.setColorSpace(*colorSpace)
+        stats["image"] = True
+    return stats
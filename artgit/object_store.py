@@ -0,0 +1,131 @@
+# object_store.py – content-addressed blobs and per-commit manifests for ArtGit
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+
+CHUNK_SIZE = 1024 * 1024
+
+# Rewritten by Krita on every save (dates, editing time): stored like any
+# member, but ignored when deciding whether a document changed
+VOLATILE_MEMBERS = {"documentinfo.xml"}
+
+
+def manifest_key(manifest):
+    """Identity of a manifest's content, leaving out VOLATILE_MEMBERS"""
+    members = [(m["name"], m["sha256"]) for m in manifest["members"] if m["name"] not in VOLATILE_MEMBERS]
+    return hashlib.sha256(json.dumps(members).encode("utf-8")).hexdigest()
+
+
+class ObjectStore:
+    """Blobs named by the SHA-256 of their content, under <root>/objects.
+
+    A committed .kra is one blob per zip member plus a manifest blob that
+    lists the members in order, so a layer that didn't change between
+    commits is stored once. Blobs hold the member's content as is (Krita
+    already compresses layer data) and are written to a temp file that is
+    renamed into place, so a crash never leaves a partial object behind.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objectsDir = os.path.join(root, "objects")
+        self.stats = {"members": 0, "stored": 0, "bytes_stored": 0}
+
+    def _path(self, digest):
+        return os.path.join(self.objectsDir, digest[:2], digest[2:])
+
+    def has(self, digest):
+        return os.path.exists(self._path(digest))
+
+    def put_stream(self, chunks):
+        """Store the concatenated `chunks`; returns the content's SHA-256"""
+        os.makedirs(self.objectsDir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.objectsDir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+            digest = digest.hexdigest()
+            path = self._path(digest)
+            if os.path.exists(path):
+                os.remove(tmp)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.stats["bytes_stored"] += os.path.getsize(tmp)
+                os.replace(tmp, path)
+            return digest
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def put_bytes(self, data):
+        return self.put_stream([data])
+
+    def iter_blob(self, digest):
+        """Content of a blob, chunk by chunk"""
+        with open(self._path(digest), "rb") as f:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+
+    def read_bytes(self, digest):
+        return b"".join(self.iter_blob(digest))
+
+    # .kra documents -------------------------------------------------------
+    def snapshot(self, kraPath, previous=None, progress=None):
+        """Store every member of a .kra; returns its manifest (not yet stored).
+
+        Members whose name, CRC-32 and size match an entry of `previous`
+        reuse that entry's blob without being read, so an unchanged layer
+        costs a zip directory lookup instead of a decompress and hash.
+        This trusts the zip's CRC-32 as the identity check: a changed
+        member that kept its size and collided on CRC-32 would be recorded
+        with its previous content. Pass no `previous` to hash every member.
+        `progress(done, total)` is called after each member.
+        """
+        known = {}
+        if previous is not None:
+            known = {(m["name"], m["crc"], m["size"]): m["sha256"] for m in previous["members"]}
+        members = []
+        with zipfile.ZipFile(kraPath) as zf:
+            infos = zf.infolist()
+            for done, info in enumerate(infos, 1):
+                self.stats["members"] += 1
+                digest = known.get((info.filename, info.CRC, info.file_size))
+                if digest is None or not self.has(digest):
+                    with zf.open(info) as f:
+                        digest = self.put_stream(iter(lambda: f.read(CHUNK_SIZE), b""))
+                    self.stats["stored"] += 1
+                members.append({"name": info.filename, "sha256": digest, "size": info.file_size,
+                                "crc": info.CRC, "compress": info.compress_type,
+                                "date_time": list(info.date_time)})
+                if progress is not None:
+                    progress(done, len(infos))
+        return {"members": members}
+
+    def put_manifest(self, manifest):
+        return self.put_bytes(json.dumps(manifest, sort_keys=True).encode("utf-8"))
+
+    def read_manifest(self, digest):
+        return json.loads(self.read_bytes(digest).decode("utf-8"))
+
+    def checkout(self, manifest, path, compress=False):
+        """Rebuild the .kra described by `manifest` at `path`, members in their original order.
+
+        Members are written uncompressed unless `compress` is set: a
+        checkout is a working file Krita reads once, and deflating the
+        layers again would cost more than the whole rest of the checkout.
+        """
+        tmp = path + ".tmp"
+        with zipfile.ZipFile(tmp, "w") as zf:
+            for member in manifest["members"]:
+                info = zipfile.ZipInfo(member["name"], date_time=tuple(member["date_time"]))
+                info.compress_type = member["compress"] if compress else zipfile.ZIP_STORED
+                with zf.open(info, "w", force_zip64=member["size"] >= zipfile.ZIP64_LIMIT) as out:
+                    for chunk in self.iter_blob(member["sha256"]):
+                        out.write(chunk)
+        os.replace(tmp, path)
+        return path
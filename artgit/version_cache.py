@@ -0,0 +1,80 @@
+# version_cache.py – recently opened version documents, kept in memory for quick restores
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+CHANNELS = {"A": 1, "GRAYA": 2, "RGBA": 4, "XYZA": 4, "LABA": 4, "CMYKA": 5, "YCbCrA": 4}
+DEPTH_BYTES = {"U8": 1, "U16": 2, "F16": 2, "F32": 4}
+
+
+def document_bytes(document):
+    """Rough in-memory size of a document: its projection plus every node's painted bounds"""
+    pixel = CHANNELS.get(document.colorModel(), 4) * DEPTH_BYTES.get(document.colorDepth(), 1)
+    total = document.width() * document.height()
+    stack = list(document.rootNode().childNodes())
+    while stack:
+        node = stack.pop()
+        bounds = node.bounds()
+        total += bounds.width() * bounds.height()
+        stack.extend(node.childNodes())
+    return total * pixel
+
+
+class VersionCache:
+    """Opened version documents and their layer signatures, evicted
+    least-recently-used first once their estimated size goes over max_bytes.
+
+    Evicted documents are closed. A document bigger than the whole budget
+    is not kept at all.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (document, signatures, size), oldest first
+        self._total = 0
+
+    def get(self, key):
+        """(document, signatures) for `key`, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, key, document, signatures):
+        """Keep `document` for `key`; returns False (and closes it) if it doesn't fit"""
+        self.discard(key)
+        size = document_bytes(document)
+        if size > self.max_bytes:
+            document.close()
+            return False
+        self._entries[key] = (document, signatures, size)
+        self._total += size
+        self._evict()
+        return True
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total -= entry[2]
+            entry[0].close()
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        for key in list(self._entries):
+            self.discard(key)
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._entries:
+            self.discard(next(iter(self._entries)))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self._entries), "bytes": self._total}
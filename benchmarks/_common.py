@@ -0,0 +1,96 @@
+# _common.py – shared setup for the benchmark scripts
+#
+# The plugin packages register themselves with Krita from __init__, so the
+# benchmarks import their helper modules through a bare package entry
+# instead of the real __init__.
+import importlib
+import os
+import resource
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_plugin_package(name):
+    """Make `import <name>.<module>` work without running <name>/__init__.py"""
+    if name not in sys.modules:
+        pkg = types.ModuleType(name)
+        pkg.__path__ = [os.path.join(ROOT, name)]
+        sys.modules[name] = pkg
+    return sys.modules[name]
+
+
+def import_plugin(name):
+    """Import the real <name> package; needs fake_krita.install() first"""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return importlib.import_module(name)
+
+
+def qt_app(widgets=False):
+    """Offscreen QGuiApplication (QApplication with `widgets`) for headless runs"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    if widgets:
+        from PyQt5.QtWidgets import QApplication
+        return QApplication.instance() or QApplication([])
+    from PyQt5.QtGui import QGuiApplication
+    return QGuiApplication.instance() or QGuiApplication([])
+
+
+def self_signed_context():
+    """Server-side SSLContext with a throwaway self-signed certificate (needs openssl)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = os.path.join(tmp, "cert.pem"), os.path.join(tmp, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                        "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=localhost"],
+                       check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+    return context
+
+
+def timed(fn, *args, repeat=3):
+    """Best-of-`repeat` wall time in seconds, plus the last result"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _proc_status_mb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def measured(fn, *args):
+    """Run fn once; returns (result, seconds, peak MB above the RSS before).
+
+    On Linux the peak-RSS counter is reset first, so the peak is this
+    call's own; elsewhere it falls back to the process-wide maximum.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    before = _proc_status_mb("VmRSS")
+    t0 = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - t0
+    peak = _proc_status_mb("VmHWM")
+    if before is None or peak is None:
+        before, peak = 0.0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return result, seconds, max(0.0, peak - before)
@@ -0,0 +1,78 @@
+# bench_backends.py – load test the image/critique client against the bundled local backend
+#
+#   python benchmarks/bench_backends.py [--requests 64] [--concurrency 1,4,8] [--latency 0.25]
+#
+# Runs the real DallEWorker/CritiqueWorker code (payload building, pooled
+# HTTP on the request engine, decode into layer pixels) against
+# artai/local_server.py, no network.
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fake_krita
+from _common import import_plugin, qt_app
+
+fake_krita.install()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", default="1,4,8")
+    parser.add_argument("--latency", type=float, default=0.25)
+    parser.add_argument("--size", default="1024x1024")
+    args = parser.parse_args()
+
+    app = qt_app()     # QImage decoding needs the app alive for the whole run
+    import_plugin("artai")
+    from artai.artai import CritiqueWorker, DallEWorker
+    from artai.backends import LocalBackend
+    from artai.async_http import shared_client
+    from artai.engine import shared_engine
+    from artai.metrics import percentile
+    from artai.local_server import render_png
+
+    backend = LocalBackend(latency=args.latency)
+    width, height = (int(v) for v in args.size.split("x"))
+    source = render_png(width, height, bytes(range(6)))
+
+    # Same request, same answer
+    def vary_once():
+        return shared_engine().submit(backend.vary("", source, args.size)).result()
+    assert vary_once() == vary_once(), "not deterministic"
+
+    def vary(index):
+        worker = DallEWorker("", None, width, height, source, cache=None, variant=index,
+                             size=args.size, backend=backend)
+        failed = []
+        worker.error.connect(failed.append)
+        started = time.perf_counter()
+        worker.run()
+        if failed:
+            raise RuntimeError(failed[0])
+        return time.perf_counter() - started
+
+    def critique(index):
+        worker = CritiqueWorker("", f"critique {index}", source, stream=True, backend=backend)
+        started = time.perf_counter()
+        worker.run()
+        return time.perf_counter() - started
+
+    print(f"{args.requests} requests per row, {args.latency * 1000:.0f} ms simulated latency, "
+          f"{args.size} images")
+    for operation, fn in (("vary", vary), ("critique (streamed)", critique)):
+        for concurrency in (int(v) for v in args.concurrency.split(",")):
+            connections = shared_client().stats["connections"]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                latencies = list(pool.map(fn, range(args.requests)))
+            elapsed = time.perf_counter() - started
+            print(f"  {operation:20s} x{concurrency:<3d} {args.requests / elapsed:7.1f} req/s  "
+                  f"p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  "
+                  f"p95 {percentile(latencies, 0.95) * 1000:7.1f} ms  "
+                  f"{shared_client().stats['connections'] - connections} new connections")
+    backend.stop()
+
+
+if __name__ == "__main__":
+    main()
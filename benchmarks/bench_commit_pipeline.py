@@ -0,0 +1,105 @@
+# bench_commit_pipeline.py – time a commit spends on the UI thread, inline vs. the CommitWorker
+#
+#   python benchmarks/bench_commit_pipeline.py [--layers 24] [--layer-mb 4] [--burst 5]
+#
+# Commits a synthetic .kra (see bench_object_store.py) the old way, inline,
+# then queues a burst of commits on the worker and checks that they land in
+# order with their parents chained, unchanged saves skipped.
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from _common import load_plugin_package, qt_app
+from bench_object_store import write_kra
+
+load_plugin_package("artgit")
+from artgit.commit_pipeline import CommitWorker, stage_document
+from artgit.object_store import ObjectStore
+
+from PyQt5.QtCore import QEventLoop
+from PyQt5.QtGui import QImage
+
+
+def save_kra(path, layers, rng, revision):
+    """Krita saves through QSaveFile: a new file renamed over the old one"""
+    write_kra(path + ".saving", layers, rng, revision)
+    os.replace(path + ".saving", path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layers", type=int, default=24)
+    parser.add_argument("--layer-mb", type=float, default=4)
+    parser.add_argument("--burst", type=int, default=5)
+    args = parser.parse_args()
+    if args.burst < 4:
+        parser.error("--burst must be at least 4 (the third save is a no-op, the fourth builds on it)")
+    app = qt_app()
+
+    rng = random.Random(7)
+    layer_size = int(args.layer_mb * 1024 * 1024)
+    layers = [rng.randbytes(layer_size) for _ in range(args.layers)]
+    work = tempfile.mkdtemp()
+    kra = os.path.join(work, "doc.kra")
+    thumbnail = QImage(256, 256, QImage.Format_ARGB32)
+    thumbnail.fill(0xff336699)
+
+    # Inline: the UI thread stores every member and encodes the preview itself
+    save_kra(kra, layers, rng, 0)
+    inline_dir = os.path.join(work, "inline")
+    started = time.perf_counter()
+    store = ObjectStore(inline_dir)
+    store.put_manifest(store.snapshot(kra))
+    thumbnail.save(os.path.join(inline_dir, "preview.png"), "PNG")
+    inline = time.perf_counter() - started
+
+    # Queued: the UI thread only stages the file; a burst doesn't wait on the one before
+    versions_dir = os.path.join(work, "queued")
+    os.makedirs(versions_dir)
+    worker = CommitWorker()
+    results, loop = [], QEventLoop()
+    worker.committed.connect(lambda d, info: results.append(("committed", info)))
+    worker.skipped.connect(lambda d, cid: results.append(("skipped", cid)))
+    worker.failed.connect(lambda d, cid, error: results.append(("failed", error)))
+    for signal in (worker.committed, worker.skipped, worker.failed):
+        signal.connect(lambda *_: len(results) == args.burst and loop.quit())
+
+    ui_time, parent, ids = 0.0, None, []
+    for revision in range(args.burst):
+        if revision != 2:   # the third save changes nothing and must be skipped
+            layers[rng.randrange(len(layers))] = rng.randbytes(layer_size)
+        save_kra(kra, layers, rng, revision)
+        commit_id = f"c{revision}"
+        started = time.perf_counter()
+        worker.enqueue({"id": commit_id, "parent": parent, "parent_manifest": None,
+                        "message": f"revision {revision}", "timestamp": datetime.now(),
+                        "versions_dir": versions_dir, "staged": stage_document(kra, versions_dir, commit_id),
+                        "preview": f"{commit_id}.png", "thumbnail": thumbnail})
+        ui_time += time.perf_counter() - started
+        parent = commit_id
+        ids.append(commit_id)
+    started = time.perf_counter()
+    loop.exec_()
+    drained = time.perf_counter() - started
+    worker.stop()
+
+    committed = [info for kind, info in results if kind == "committed"]
+    assert [kind for kind, _ in results].count("failed") == 0, results
+    assert [info["id"] for info in committed] == [i for i in ids if i != "c2"]
+    assert committed[2]["parent"] == "c1"   # c3 was made on top of the skipped c2
+    assert not os.listdir(os.path.join(versions_dir, "staging"))
+
+    print(f"{os.path.getsize(kra) / 2 ** 20:.0f} MB .kra")
+    print(f"  inline commit       {inline * 1000:8.1f} ms on the UI thread")
+    print(f"  queued commit       {ui_time * 1000 / args.burst:8.2f} ms on the UI thread "
+          f"(burst of {args.burst} stored {drained * 1000:.0f} ms later, in order)")
+    shutil.rmtree(work)
+    del app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# bench_commit_store.py – versions.json rewrite vs. the journaled CommitStore at 10k commits
+#
+#   python benchmarks/bench_commit_store.py [--commits 10000]
+#
+# Needs no Krita or Qt.
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from _common import load_plugin_package, timed
+
+load_plugin_package("artgit")
+from artgit.commit_store import COMPACT_AFTER, CommitStore, migrate_legacy
+
+
+def make_commit(parent, when):
+    return {"id": str(uuid.uuid4()), "parent": parent, "message": f"stroke at {when:%H:%M:%S}",
+            "timestamp": when.isoformat(), "display_time": when.strftime("%Y-%m-%d %H:%M:%S"),
+            "manifest": uuid.uuid4().hex * 2, "preview": f"v_{when:%Y%m%d_%H%M%S}_doc.png"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=10000)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    legacy_path = os.path.join(work, "versions.json")
+    start = datetime(2024, 1, 1)
+    commits, head = {}, None
+    for index in range(args.commits):
+        commit = make_commit(head, start + timedelta(seconds=index))
+        commits[commit["id"]] = commit
+        head = commit["id"]
+    with open(legacy_path, "w") as f:
+        json.dump({"commits": commits, "current_head": head}, f, indent=2)
+    print(f"{args.commits} commits, versions.json {os.path.getsize(legacy_path) / 2 ** 20:.1f} MB")
+
+    # The old docker: every read parses everything, every commit rewrites everything
+    def legacy_load():
+        with open(legacy_path) as f:
+            return migrate_legacy(json.load(f))
+
+    def legacy_commit():
+        data = legacy_load()
+        commit = make_commit(data["current_head"], datetime.now())
+        data["commits"][commit["id"]] = commit
+        data["current_head"] = commit["id"]
+        with open(legacy_path, "w") as f:
+            json.dump(data, f, indent=2)
+    legacy_read, _ = timed(legacy_load)
+    legacy_write, _ = timed(legacy_commit)
+
+    started = time.perf_counter()
+    store = CommitStore(work)
+    migrate = time.perf_counter() - started
+    assert len(store.commits()) == args.commits + 3 and not os.path.exists(legacy_path)
+
+    def append():
+        store.add_commit(make_commit(store.head(), datetime.now()))
+    appends = COMPACT_AFTER // 2
+    started = time.perf_counter()
+    for _ in range(appends):
+        append()
+    append_time = (time.perf_counter() - started) / appends
+
+    cached, _ = timed(store.history)
+    cold, _ = timed(lambda: CommitStore(work).history())
+    compact, _ = timed(store.compact, repeat=1)
+
+    # another process appending is picked up through the mtime check
+    other = CommitStore(work)
+    other.add_commit(make_commit(other.head(), datetime.now()))
+    assert store.head() == other.head()
+
+    print(f"  read history      versions.json {legacy_read * 1000:8.2f} ms   "
+          f"store {cached * 1000:8.3f} ms cached, {cold * 1000:.1f} ms cold")
+    print(f"  commit            versions.json {legacy_write * 1000:8.2f} ms   "
+          f"store {append_time * 1000:8.3f} ms (fsync'd journal line)")
+    print(f"  one-time migration {migrate * 1000:.0f} ms, compaction {compact * 1000:.0f} ms "
+          f"every {COMPACT_AFTER} commits")
+    shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# bench_critique_prep.py – Critique request size/latency: full-res PNG vs. prepared image
+#
+#   python benchmarks/bench_critique_prep.py [--size 4096x3072] [--latency 0.0]
+#
+# Runs the real docker's preparation and CritiqueWorker against artai/local_server.py.
+import argparse
+import math
+import os
+import random
+
+import fake_krita
+from _common import import_plugin, qt_app, timed
+
+fake_krita.install()
+from PyQt5.QtCore import QPointF
+from PyQt5.QtGui import QColor, QImage, QPainter, QRadialGradient
+
+
+def painted_document(width, height, seed=3):
+    """A document with one busy, photo-like layer (so PNG doesn't compress it away)"""
+    rng = random.Random(seed)
+    image = QImage(width, height, QImage.Format_ARGB32)
+    image.fill(0xFFFFFFFF)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    for _ in range(400):
+        center = QPointF(rng.uniform(0, width), rng.uniform(0, height))
+        radius = rng.uniform(20, width / 6)
+        gradient = QRadialGradient(center, radius)
+        gradient.setColorAt(0, QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256), 200))
+        gradient.setColorAt(1, QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256), 0))
+        painter.setBrush(gradient)
+        painter.setPen(QColor(0, 0, 0, 0))
+        painter.drawEllipse(center, radius, radius)
+    painter.end()
+
+    document = fake_krita.Document(width, height)
+    layer = document.createNode("Paint", "paintlayer")
+    layer.setPixelData(image.bits().asstring(image.byteCount()), 0, 0, width, height)
+    document.rootNode().addChildNode(layer, None)
+    fake_krita.Krita.instance().setActiveDocument(document)
+    return document
+
+
+def image_tokens(width, height, detail):
+    """Image token cost as documented for the gpt-4o vision input"""
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="4096x3072")
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    app = qt_app(widgets=True)     # widgets need the app alive for the whole run
+    artai = import_plugin("artai")
+    from artai.local_server import start_server
+    server, base_url = start_server(latency=args.latency)
+    os.environ["ARTAI_API_BASE"] = base_url
+    from artai.artai import CritiqueWorker
+    from artai.imaging import encode_png
+
+    document = painted_document(width, height)
+    docker = artai.ArtAIDocker()
+    docker.modeCombo.setCurrentText("Critique")
+
+    def send(image_data, mime, detail):
+        worker = CritiqueWorker("benchmark", "benchmark", image_data, mime=mime, detail=detail)
+        worker.run()
+        stages = worker.metrics["stages"]
+        return worker.metrics["bytes_out"], stages["upload"] + stages["wait"] + stages["download"]
+
+    print(f"critique a {width}x{height} canvas")
+    rows = []
+
+    def full_png():
+        return encode_png(docker.renderCurrentLayers(document)), "image/png"
+    prep, (data, mime) = timed(full_png, repeat=1)
+    rows.append(("full-res PNG (before)", prep, data, mime, "auto", width, height))
+
+    for fmt, max_dim, quality, detail in (("JPEG", 1024, 85, "auto"), ("WEBP", 1024, 80, "auto"),
+                                          ("JPEG", 512, 80, "low")):
+        docker.critiqueFormatCombo.setCurrentText(fmt)
+        docker.critiqueQualitySpin.setValue(quality)
+        docker.critiqueMaxDimSpin.setValue(max_dim)
+        docker.preparedCritiqueImages.clear()
+
+        def prepared():
+            return docker.prepareCritiqueImage(document)
+        prep, (data, mime, w, h) = timed(prepared, repeat=1)
+        rows.append((f"{fmt} q{quality} <= {max_dim}px, {detail}", prep, data, mime, detail, w, h))
+
+    # same document state again (e.g. another prompt): nothing is rendered or encoded
+    hit, _ = timed(prepared, repeat=3)
+
+    for label, prep, data, mime, detail, w, h in rows:
+        sent, round_trip = send(data, mime, detail)
+        print(f"  {label:28s} prep {prep * 1000:6.0f} ms  body {sent / 1024:8.0f} KB  "
+              f"round trip {round_trip:6.1f} ms  ~{image_tokens(w, h, detail)} image tokens")
+    print(f"  repeat critique, unchanged canvas: prep {hit * 1000:.0f} ms (render and encode skipped)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# bench_critique_stream.py – time to first token vs. full completion for Critique
+#
+#   python benchmarks/bench_critique_stream.py [--token-delay 0.03]
+#
+# Talks to artai/local_server.py through AsyncHttpClient, like the
+# critique backend does.
+import argparse
+import asyncio
+import json
+import time
+
+from _common import load_plugin_package
+
+load_plugin_package("artai")
+from artai.async_http import AsyncHttpClient, async_sse_data
+from artai.local_server import start_server
+
+HEADERS = {"Authorization": "Bearer test", "Content-Type": "application/json"}
+
+
+async def measure(base_url):
+    client = AsyncHttpClient(base_url)
+    try:
+        body = {"model": "gpt-4o", "messages": []}
+        t0 = time.perf_counter()
+        await client.request("POST", "/v1/chat/completions", body=json.dumps(body).encode(), headers=HEADERS)
+        blocking = time.perf_counter() - t0
+
+        body["stream"] = True
+        t0 = time.perf_counter()
+        first, words = None, []
+        async with client.stream("POST", "/v1/chat/completions", body=json.dumps(body).encode(),
+                                 headers=HEADERS) as response:
+            async for payload in async_sse_data(response.iter_lines()):
+                words.append(json.loads(payload)["choices"][0]["delta"]["content"])
+                first = first or time.perf_counter() - t0
+        streamed = time.perf_counter() - t0
+        return blocking, first, streamed, words
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--token-delay", type=float, default=0.03)
+    args = parser.parse_args()
+
+    server, base_url = start_server(token_delay=args.token_delay)
+    try:
+        blocking, first, streamed, words = asyncio.run(measure(base_url))
+        print(f"blocking : text after {blocking * 1000:7.1f} ms")
+        print(f"streaming: first token after {first * 1000:7.1f} ms, "
+              f"complete after {streamed * 1000:7.1f} ms ({len(words)} events)")
+        print("text:", "".join(words))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
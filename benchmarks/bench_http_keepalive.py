@@ -0,0 +1,71 @@
+# bench_http_keepalive.py – per-request urlopen vs. the pooled AsyncHttpClient
+#
+#   python benchmarks/bench_http_keepalive.py [--requests 50]
+#
+# Runs N sequential POSTs against the local server over HTTPS, once the old way
+# (fresh SSL context + urlopen each time) and once through AsyncHttpClient,
+# the client the request engine shares between all requests.
+import argparse
+import asyncio
+import json
+import ssl
+import time
+import urllib.request
+
+from _common import load_plugin_package, self_signed_context
+
+load_plugin_package("artai")
+from artai.async_http import AsyncHttpClient
+from artai.local_server import start_server
+
+PATH = "/v1/chat/completions"
+BODY = json.dumps({"model": "gpt-4o", "messages": []}).encode()
+HEADERS = {"Authorization": "Bearer test", "Content-Type": "application/json"}
+
+
+def legacy_requests(base_url, count):
+    for _ in range(count):
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        request = urllib.request.Request(base_url + PATH, data=BODY, headers=HEADERS)
+        urllib.request.urlopen(request, timeout=60, context=ssl_context).read()
+
+
+def pooled_requests(base_url, count):
+    async def send():
+        client = AsyncHttpClient(base_url)
+        for _ in range(count):
+            await client.request("POST", PATH, body=BODY, headers=HEADERS)
+        client.close()
+    asyncio.run(send())
+
+
+def run(label, server, fn, *args):
+    before = dict(server.stats)
+    t0 = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - t0
+    conns = server.stats["connections"] - before["connections"]
+    reqs = server.stats["requests"] - before["requests"]
+    print(f"{label:>10}: {elapsed:7.3f} s total, {elapsed / reqs * 1000:6.2f} ms/request, "
+          f"{conns} TLS handshakes")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    server, base_url = start_server(ssl_context=self_signed_context())
+    try:
+        old = run("urlopen", server, legacy_requests, base_url, args.requests)
+        new = run("pooled", server, pooled_requests, base_url, args.requests)
+        print(f"speedup: {old / new:.1f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# bench_insert.py – legacy onComplete insertion vs. imaging.layer_pixels
+#
+#   python benchmarks/bench_insert.py [--size 6000x4000] [--api 1024x1024]
+#
+# Each variant runs in its own process so the peak RSS is its own.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from _common import load_plugin_package, qt_app
+
+load_plugin_package("artai")
+
+
+class FakeLayer:
+    """Keeps what setPixelData was given, like Krita's paint device would"""
+
+    def setPixelData(self, data, x, y, w, h):
+        assert len(data) == w * h * 4
+        self.data = data
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def source_png(size):
+    """A gradient API-sized result, so decoding isn't trivially cheap"""
+    from PyQt5.QtGui import QColor, QImage, QLinearGradient, QPainter
+    from artai.imaging import encode_png
+    image = QImage(size[0], size[1], QImage.Format_ARGB32)
+    gradient = QLinearGradient(0, 0, size[0], size[1])
+    gradient.setColorAt(0, QColor(230, 40, 40))
+    gradient.setColorAt(1, QColor(30, 60, 220))
+    painter = QPainter(image)
+    painter.fillRect(image.rect(), gradient)
+    painter.end()
+    return encode_png(image)
+
+
+def legacy_insert(png, layer, w, h):
+    """The original onComplete path, kept for comparison (all on the UI thread)"""
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtGui import QImage
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_file:
+        temp_file.write(png)
+        temp_path = temp_file.name
+    qimage = QImage(temp_path)
+    os.unlink(temp_path)
+    resized = qimage.scaled(w, h, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    if resized.format() != QImage.Format_ARGB32:
+        resized = resized.convertToFormat(QImage.Format_ARGB32)
+    pixel_data = bytearray(resized.bits().asstring(resized.byteCount()))
+    layer.setPixelData(bytes(pixel_data), 0, 0, w, h)
+
+
+def buffer_insert(png, layer, w, h, api_size):
+    """Decode/map in a worker thread, only setPixelData on the 'UI' thread"""
+    from PyQt5.QtCore import QRect
+    from artai.imaging import decode_png, layer_pixels
+    out = {}
+    worker = threading.Thread(target=lambda: out.update(
+        pixels=layer_pixels(decode_png(png), w, h, QRect(0, 0, *api_size), api_size)))
+    worker.start()
+    worker.join()
+    started = time.perf_counter()
+    layer.setPixelData(out["pixels"], 0, 0, w, h)
+    return time.perf_counter() - started
+
+
+def run_variant(variant, w, h, api_size):
+    qt_app()
+    png = source_png(api_size)
+    layer = FakeLayer()
+    before = peak_mb()
+    started = time.perf_counter()
+    if variant == "legacy":
+        legacy_insert(png, layer, w, h)
+        ui = time.perf_counter() - started
+    else:
+        ui = buffer_insert(png, layer, w, h, api_size)
+    total = time.perf_counter() - started
+    print(json.dumps({"variant": variant, "total_ms": total * 1000, "ui_thread_ms": ui * 1000,
+                      "peak_extra_mb": peak_mb() - before}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="6000x4000")
+    parser.add_argument("--api", default="1024x1024")
+    parser.add_argument("--variant", choices=["legacy", "buffer"])
+    args = parser.parse_args()
+    w, h = (int(v) for v in args.size.split("x"))
+    api_size = tuple(int(v) for v in args.api.split("x"))
+
+    if args.variant:
+        run_variant(args.variant, w, h, api_size)
+        return
+
+    print(f"insert a {api_size[0]}x{api_size[1]} result into a {w}x{h} layer "
+          f"(canvas buffer {w * h * 4 / 2 ** 20:.0f} MB)")
+    for variant in ("legacy", "buffer"):
+        out = subprocess.run([sys.executable, __file__, "--variant", variant,
+                              "--size", args.size, "--api", args.api],
+                             capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"  {variant:7s} total {r['total_ms']:7.0f} ms   UI thread {r['ui_thread_ms']:7.1f} ms"
+              f"   peak +{r['peak_extra_mb']:6.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# bench_layer_tree.py – legacy QCheckBox layer list vs. LayerTreeModel on big documents
+#
+#   python benchmarks/bench_layer_tree.py [--groups 40] [--per-group 25] [--root-layers 200]
+#
+# Timings include laying out and painting the (offscreen) widgets. A second,
+# untimed pass runs the same edits under QAbstractItemModelTester, so any
+# inconsistent signal from the incremental refresh aborts the benchmark.
+import argparse
+
+import fake_krita
+from _common import import_plugin, qt_app, timed
+
+fake_krita.install()
+from PyQt5.QtCore import Qt
+from PyQt5.QtTest import QAbstractItemModelTester
+from PyQt5.QtWidgets import QCheckBox, QScrollArea, QTreeView, QVBoxLayout, QWidget
+
+
+def big_document(groups, per_group, root_layers):
+    document = fake_krita.Document(2048, 2048)
+    root = document.rootNode()
+    for index in range(root_layers):
+        root.addChildNode(document.createNode(f"Layer {index}", "paintlayer"), None)
+    for g in range(groups):
+        group = document.createGroupLayer(f"Group {g}")
+        for index in range(per_group):
+            group.addChildNode(document.createNode(f"Group {g} layer {index}", "paintlayer"), None)
+        root.addChildNode(group, None)
+    fake_krita.Krita.instance().setActiveDocument(document)
+    return document
+
+
+class LegacyLayerList:
+    """The original updateLayerList, kept for comparison"""
+
+    def __init__(self):
+        self.scroll = QScrollArea()
+        self.widget = QWidget()
+        self.layout = QVBoxLayout(self.widget)
+        self.scroll.setWidget(self.widget)
+        self.checkboxes = []
+
+    def update(self, document):
+        for checkbox in self.checkboxes:
+            checkbox.setParent(None)
+        self.checkboxes.clear()
+
+        def add(node, indent=0):
+            if node.type() == "paintlayer":
+                checkbox = QCheckBox("  " * indent + node.name())
+                checkbox.setChecked(node.visible())
+                checkbox.layer = node
+                self.checkboxes.append(checkbox)
+                self.layout.addWidget(checkbox)
+            for child in node.childNodes():
+                add(child, indent + 1)
+        add(document.rootNode())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, default=40)
+    parser.add_argument("--per-group", type=int, default=25)
+    parser.add_argument("--root-layers", type=int, default=200)
+    args = parser.parse_args()
+    if args.root_layers < 11 or args.groups < 1 or args.per_group < 1:
+        parser.error("the edits need at least 11 root layers and one non-empty group")
+
+    app = qt_app(widgets=True)     # widgets need the app alive for the whole run
+    import_plugin("artai")
+    from artai.layer_model import LayerTreeModel
+
+    document = big_document(args.groups, args.per_group, args.root_layers)
+    total = args.root_layers + args.groups * args.per_group
+    print(f"{total} paint layers ({args.root_layers} at the root, {args.groups} groups)")
+
+    def shown(widget, fn, *fn_args):
+        """fn, then whatever layout/paint work it caused"""
+        fn(*fn_args)
+        widget.repaint()
+        app.processEvents()
+
+    legacy = LegacyLayerList()
+    legacy.scroll.resize(300, 150)
+    legacy.scroll.show()
+    legacy_time, _ = timed(shown, legacy.scroll, legacy.update, document)
+    print(f"  legacy checkbox rebuild          {legacy_time * 1000:8.1f} ms (every refresh)")
+    legacy.scroll.hide()
+
+    for validate in (False, True):
+        model = LayerTreeModel()
+        tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal) \
+            if validate else None
+        view = QTreeView()
+        view.setModel(model)
+        view.setUniformRowHeights(True)
+        view.resize(300, 150)
+        view.show()
+        run_model(app, document, model, view, shown, report=not validate)
+        view.hide()
+        del tester
+    print("  QAbstractItemModelTester: no errors")
+
+
+def run_model(app, document, model, view, shown, report):
+    def show(label, seconds):
+        if report:
+            print(f"  {label:32s} {seconds * 1000:8.1f} ms")
+
+    first, _ = timed(shown, view, model.setDocument, document, repeat=1)
+    show("model, first load", first)
+    unchanged, _ = timed(shown, view, model.setDocument, document)
+    show("model, refresh (no changes)", unchanged)
+
+    # expand a few groups, then change the document a little
+    root = document.rootNode()
+    groups = [node for node in root.childNodes() if node.type() == "grouplayer"]
+    for row in range(model.rowCount()):
+        index = model.index(row, 0)
+        if model.hasChildren(index) and row % 10 == 0:
+            view.expand(index)
+            model.fetchMore(index)
+
+    def edit_document():
+        root.childNodes()[3].setName("renamed")
+        root.addChildNode(document.createNode("new layer", "paintlayer"), root.childNodes()[10])
+        groups[0].childNodes()[0].remove()
+        moved = root.childNodes()[5]
+        root.removeChildNode(moved)
+        root.addChildNode(moved, root.childNodes()[len(root.childNodes()) // 2])
+        model.setDocument(document)
+    changed, _ = timed(shown, view, edit_document, repeat=1)
+    show("model, refresh (4 edits)", changed)
+    names = [model.index(row, 0).data() for row in range(model.rowCount())]
+    assert names == [node.name() for node in root.childNodes()], "tree out of sync after refresh"
+
+    model.setData(model.index(0, 0), Qt.Unchecked, Qt.CheckStateRole)
+    checked, layers = timed(model.checkedLayers)
+    show(f"checkedLayers ({len(layers)} layers)", checked)
+    model.setDocument(document)
+    assert len(model.checkedLayers()) == len(layers), "checked state lost on refresh"
+
+
+if __name__ == "__main__":
+    main()
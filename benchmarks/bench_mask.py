@@ -0,0 +1,74 @@
+# bench_mask.py – legacy per-pixel mask loop vs. imaging.build_mask_image
+#
+#   python benchmarks/bench_mask.py [--sizes 1024x1024,2048x2048] [--paint 0.05]
+import argparse
+
+from _common import load_plugin_package, qt_app, timed
+
+load_plugin_package("artai")
+from PyQt5.QtCore import QRect
+from artai.imaging import build_mask_image
+
+
+class FakeMaskLayer:
+    """Stands in for a Krita paint layer with a painted square in the middle"""
+
+    def __init__(self, width, height, paint_fraction):
+        side = max(1, int((width * height * paint_fraction) ** 0.5))
+        self.rect = QRect((width - side) // 2, (height - side) // 2, side, side)
+        self.width, self.height = width, height
+
+    def bounds(self):
+        return QRect(self.rect)
+
+    def pixelData(self, x, y, w, h):
+        # opaque red inside the painted rect, transparent elsewhere
+        painted = self.rect.intersected(QRect(x, y, w, h))
+        row = bytearray(w * 4)
+        out = bytearray()
+        for yy in range(y, y + h):
+            line = bytearray(row)
+            if painted.top() <= yy <= painted.bottom():
+                start = (painted.left() - x) * 4
+                line[start:start + painted.width() * 4] = b"\x00\x00\xff\xff" * painted.width()
+            out += line
+        return bytes(out)
+
+
+def legacy_mask(layer, w, h):
+    """The original getMaskImage loop, kept verbatim for comparison"""
+    pixel_data = layer.pixelData(0, 0, w, h)
+    mask_array = bytearray(w * h * 4)
+    for i in range(0, len(mask_array), 4):
+        mask_array[i:i+4] = [255, 255, 255, 255]
+    pixel_array = bytearray(pixel_data)
+    for i in range(0, len(pixel_array), 4):
+        b, g, r, a = pixel_array[i:i+4]
+        if a > 10:
+            mask_array[i:i+4] = [0, 0, 0, 0]
+    return mask_array
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="512x512,1024x1024,2048x2048")
+    parser.add_argument("--paint", type=float, default=0.05,
+                        help="fraction of the canvas covered by the mask")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    qt_app()
+    print(f"{'canvas':>12} {'legacy s':>10} {'new s':>10} {'speedup':>9}")
+    for size in args.sizes.split(","):
+        w, h = (int(v) for v in size.split("x"))
+        layer = FakeMaskLayer(w, h, args.paint)
+        new_t, _ = timed(build_mask_image, layer, w, h)
+        if args.skip_legacy:
+            print(f"{size:>12} {'-':>10} {new_t:>10.4f} {'-':>9}")
+            continue
+        old_t, _ = timed(legacy_mask, layer, w, h, repeat=1)
+        print(f"{size:>12} {old_t:>10.3f} {new_t:>10.4f} {old_t / new_t:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
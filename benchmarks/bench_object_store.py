@@ -0,0 +1,98 @@
+# bench_object_store.py – ArtGit commits: full .kra copies vs. the content-addressed store
+#
+#   python benchmarks/bench_object_store.py [--layers 24] [--layer-mb 4] [--commits 10]
+#
+# Builds a synthetic .kra (zip of incompressible layer members, like
+# Krita's LZF tiles), then commits it repeatedly with one layer changed
+# each time. Needs no Krita or Qt.
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+
+from _common import load_plugin_package
+
+load_plugin_package("artgit")
+from artgit.object_store import ObjectStore, manifest_key
+
+
+def write_kra(path, layers, rng, revision):
+    """mimetype first and stored, like Krita; documentinfo.xml changes on every save"""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(zipfile.ZipInfo("mimetype"), "application/x-krita", zipfile.ZIP_STORED)
+        zf.writestr("maindoc.xml", "<DOC>" + "".join(f"<layer n='{i}'/>" for i in range(len(layers))) + "</DOC>")
+        zf.writestr("documentinfo.xml", f"<document-info><date>{time.time()}</date>"
+                                        f"<editing-cycles>{revision}</editing-cycles></document-info>")
+        for index, data in enumerate(layers):
+            zf.writestr(f"Unnamed/layers/layer{index}", data)
+
+
+def disk_usage(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layers", type=int, default=24)
+    parser.add_argument("--layer-mb", type=float, default=4)
+    parser.add_argument("--commits", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    layer_size = int(args.layer_mb * 1024 * 1024)
+    layers = [rng.randbytes(layer_size) for _ in range(args.layers)]
+    work = tempfile.mkdtemp()
+    kra = os.path.join(work, "doc.kra")
+    copies, objects = os.path.join(work, "copies"), os.path.join(work, "store")
+    os.makedirs(copies)
+
+    copy_time = store_time = 0.0
+    previous = None
+    manifests = []
+    for revision in range(args.commits):
+        if revision:
+            layers[rng.randrange(len(layers))] = rng.randbytes(layer_size)
+        write_kra(kra, layers, rng, revision)
+
+        started = time.perf_counter()
+        shutil.copy2(kra, os.path.join(copies, f"v{revision}.kra"))
+        copy_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        store = ObjectStore(objects)
+        manifest = store.snapshot(kra, previous)
+        store.put_manifest(manifest)
+        store_time += time.perf_counter() - started
+        manifests.append((manifest, list(layers)))
+        previous = manifest
+
+    document_mb = os.path.getsize(kra) / 2 ** 20
+    print(f"{args.commits} commits of a {document_mb:.0f} MB .kra, one layer changed per commit")
+    print(f"  shutil.copy2    {copy_time * 1000 / args.commits:8.1f} ms/commit  "
+          f"{disk_usage(copies) / 2 ** 20:8.1f} MB on disk")
+    print(f"  object store    {store_time * 1000 / args.commits:8.1f} ms/commit  "
+          f"{disk_usage(objects) / 2 ** 20:8.1f} MB on disk")
+
+    # Saving again without changes: only documentinfo.xml differs, so nothing to commit
+    write_kra(kra, layers, rng, args.commits)
+    started = time.perf_counter()
+    unchanged = manifest_key(ObjectStore(objects).snapshot(kra, previous)) == manifest_key(previous)
+    print(f"  unchanged save detected: {unchanged} ({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+    # Every commit checks out to the layers it was made from
+    started = time.perf_counter()
+    for revision, (manifest, expected) in enumerate(manifests):
+        out = ObjectStore(objects).checkout(manifest, os.path.join(work, "checkout.kra"))
+        with zipfile.ZipFile(out) as zf:
+            assert zf.namelist()[0] == "mimetype"
+            assert all(zf.read(f"Unnamed/layers/layer{i}") == data for i, data in enumerate(expected)), revision
+    each = (time.perf_counter() - started) * 1000 / args.commits
+    print(f"  checkout verified for all commits ({each:.0f} ms each)")
+    shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# bench_pipeline.py – the ArtAI docker's request pipeline, stage by stage, headless
+#
+#   python benchmarks/bench_pipeline.py [--size 4096x4096] [--layers 8] [--out result.json]
+#
+# Drives the real ArtAIDocker against fake_krita, the offscreen Qt platform
+# and artai/local_server.py, and prints per-stage wall time, peak memory and temp
+# files created (should be 0) as JSON.
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import fake_krita
+from _common import import_plugin, measured, qt_app
+
+fake_krita.install()
+from PyQt5.QtCore import QEventLoop, QRect, PYQT_VERSION_STR, QT_VERSION_STR
+
+
+temp_files = [0]
+
+
+def count_temp_files(event, _args):
+    """Audit hook for this benchmark process: every tempfile anything creates"""
+    if event in ("tempfile.mkstemp", "tempfile.mkdtemp"):
+        temp_files[0] += 1
+
+
+def wait_until_done(app, docker, timeout=120):
+    """Spin the event loop until the docker reports Complete/Error"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        app.processEvents(QEventLoop.AllEvents, 20)
+        status = docker.statusLabel.text()
+        if status.startswith("Complete") or status.startswith("Error"):
+            return status
+    raise TimeoutError(f"still '{docker.statusLabel.text()}' after {timeout}s")
+
+
+def add_mask(docker, document, fraction):
+    """Paint an edit mask over `fraction` of the canvas, centred"""
+    w, h = document.width(), document.height()
+    side_w, side_h = int(w * fraction ** 0.5), int(h * fraction ** 0.5)
+    docker.maskLayer = document.createNode("AI_Edit_Mask", "paintlayer")
+    docker.maskLayer.paint(QRect((w - side_w) // 2, (h - side_h) // 2, side_w, side_h), 0xFFFF0000)
+    document.rootNode().addChildNode(docker.maskLayer, None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="4096x4096")
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--fill", type=float, default=0.3, help="canvas fraction each layer covers")
+    parser.add_argument("--mask", type=float, default=0.05, help="canvas fraction the edit mask covers")
+    parser.add_argument("--latency", type=float, default=0.0, help="local server latency per request")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="also write the JSON here")
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    app = qt_app(widgets=True)
+    artai = import_plugin("artai")
+    from artai.local_server import start_server
+    server, base_url = start_server(latency=args.latency)
+    os.environ["ARTAI_API_BASE"] = base_url
+    from artai.artai import DallEWorker
+    from artai.imaging import EDIT_SIZES, choose_api_size, encode_png, fit_image
+    from artai.multipart import MultipartEncoder
+
+    document = fake_krita.synthetic_document(width, height, args.layers, args.fill)
+    docker = artai.ArtAIDocker()
+    docker.apiKeyEdit.setText("benchmark")
+    docker.bypassCacheCheck.setChecked(True)    # every request goes to the local server
+    docker.rateSpin.setValue(docker.rateSpin.maximum())
+
+    stages = {}
+    sys.addaudithook(count_temp_files)
+
+    def stage(name, fn, *fn_args):
+        best, peak, result = None, 0.0, None
+        created = temp_files[0]
+        for _ in range(args.repeat):
+            result, seconds, extra = measured(fn, *fn_args)
+            best = seconds if best is None else min(best, seconds)
+            peak = max(peak, extra)
+        stages[name] = {"ms": round(best * 1000, 2), "peak_mb": round(peak, 1),
+                        "temp_files": (temp_files[0] - created) // args.repeat}
+        return result
+
+    # Vary: projection export
+    docker.modeCombo.setCurrentText("Vary")
+    stage("vary.render", docker.renderCurrentLayers, document)
+    stage("vary.export_png", docker.getCurrentLayerImage, document)
+
+    # Edit: layer compositing and mask
+    docker.modeCombo.setCurrentText("Edit")
+    docker.cropToMaskCheck.setChecked(False)
+    add_mask(docker, document, args.mask)
+    image = stage("edit.composite", docker.renderCurrentLayers, document)
+    mask = stage("edit.mask", docker.getMaskImage, document)
+
+    api_size = choose_api_size(width, height, EDIT_SIZES)
+    def fit_and_encode():
+        fitted, placement = fit_image(image, api_size)
+        fitted_mask, _ = fit_image(mask, api_size, fill=0xFFFFFFFF)
+        return encode_png(fitted), encode_png(fitted_mask), placement
+    image_data, mask_data, placement = stage("edit.fit_encode", fit_and_encode)
+
+    def build_multipart():
+        form = MultipartEncoder()
+        form.add_file("image", "image.png", image_data, "image/png")
+        form.add_file("mask", "mask.png", mask_data, "image/png")
+        form.add_field("prompt", "benchmark")
+        return sum(len(chunk) for chunk in form)
+    stage("edit.multipart", build_multipart)
+
+    # One request, run synchronously: upload, local server, download, decode into layer pixels
+    size = f"{api_size[0]}x{api_size[1]}"
+    def request():
+        worker = DallEWorker("benchmark", "benchmark", width, height, image_data, mask_data,
+                             size=size, placement=placement)
+        out = {}
+        worker.finished.connect(lambda pixels: out.update(pixels=pixels))
+        worker.error.connect(lambda message: out.update(error=message))
+        worker.run()
+        if "error" in out:
+            raise RuntimeError(out["error"])
+        return out["pixels"]
+    pixels = stage("edit.request", request)
+
+    def insert():
+        batch = {"mode": "Vary", "results": [pixels], "left": 0, "error": None,
+                 "region": QRect(0, 0, width, height)}
+        docker.onComplete(batch, [pixels])
+        for node in document.rootNode().childNodes():
+            if node.name().startswith("AI "):
+                node.remove()
+    stage("insert", insert)
+
+    # Whole button press through the scheduler and worker threads
+    def end_to_end(mode):
+        docker.modeCombo.setCurrentText(mode)
+        if mode == "Edit":
+            add_mask(docker, document, args.mask)
+        else:
+            docker.promptEdit.setPlainText("benchmark")
+        docker.generateImage()
+        status = wait_until_done(app, docker)
+        if not status.startswith("Complete"):
+            raise RuntimeError(status)
+        for node in document.rootNode().childNodes():
+            if node.name().startswith("AI "):
+                node.remove()
+    for mode in ("Generate", "Vary", "Edit"):
+        docker.promptEdit.setPlainText("benchmark")
+        stage(f"end_to_end.{mode.lower()}", end_to_end, mode)
+
+    server.shutdown()
+    report = {
+        "config": {"size": [width, height], "layers": args.layers, "fill": args.fill, "mask": args.mask,
+                   "latency": args.latency, "repeat": args.repeat},
+        "env": {"python": platform.python_version(), "qt": QT_VERSION_STR, "pyqt": PYQT_VERSION_STR,
+                "platform": platform.platform()},
+        "stages": stages,
+        "server": server.stats,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# bench_restore.py – ArtGit restore: full document rebuild vs. replacing only the layers that differ
+#
+#   python benchmarks/bench_restore.py [--size 4096x4096] [--layers 24] [--flips 4]
+#
+# Drives the real ArtGitDocker against fake_krita: commits two versions of
+# a document that differ in one layer, then flips between them with the
+# old restore (clear the stack, clone every layer, save before and after),
+# with the docker's incremental one, and with the version cache warm,
+# checking the pixels each time. A restore leaves the document modified
+# (it is not saved), so from the second flip on the layers are compared by
+# their pixels rather than by the saved file.
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import fake_krita
+from _common import import_plugin, qt_app
+
+fake_krita.install()
+from PyQt5.QtCore import QEventLoop, QRect
+from PyQt5.QtWidgets import QMessageBox
+
+
+def full_restore(store, current, version):
+    """The restore ArtGit shipped before: every node is replaced, the document saved twice"""
+    current.save()
+    path = os.path.join(store.root, "checkout_full.kra")
+    store.checkout(store.read_manifest(version["manifest"]), path)
+    versionDoc = fake_krita.Krita.instance().openDocument(path)
+    for child in current.rootNode().childNodes():
+        child.remove()
+    for child in versionDoc.rootNode().childNodes():
+        current.rootNode().addChildNode(child.clone(), None)
+    current.setResolution(int(versionDoc.xRes()))
+    current.resizeImage(0, 0, versionDoc.width(), versionDoc.height())
+    current.setColorSpace(versionDoc.colorModel(), versionDoc.colorDepth(), versionDoc.colorProfile())
+    versionDoc.close()
+    os.remove(path)
+    current.refreshProjection()
+    current.save()
+
+
+def pixels(document):
+    image = document.projection(0, 0, document.width(), document.height())
+    return hashlib.sha1(image.bits().asstring(image.byteCount())).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="4096x4096")
+    parser.add_argument("--layers", type=int, default=24)
+    parser.add_argument("--fill", type=float, default=0.3, help="canvas fraction each layer covers")
+    parser.add_argument("--flips", type=int, default=4)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    app = qt_app(widgets=True)
+    artgit = import_plugin("artgit")
+    from artgit.object_store import ObjectStore
+    QMessageBox.question = staticmethod(lambda *a, **k: QMessageBox.Yes)
+    QMessageBox.information = staticmethod(lambda *a, **k: QMessageBox.Ok)
+    QMessageBox.critical = staticmethod(lambda parent, title, text, *a: print(f"  error: {text}"))
+
+    work = tempfile.mkdtemp()
+    document = fake_krita.synthetic_document(width, height, args.layers, args.fill)
+    document.setFileName(os.path.join(work, "doc.kra"))
+    document.save()
+    docker = artgit.ArtGitDocker()
+
+    def commit(message):
+        docker.commitMessageEdit.setText(message)
+        docker.commitCurrentVersion()
+        while docker.pendingCommits:
+            app.processEvents(QEventLoop.AllEvents, 20)
+        return docker.commitStore().get(docker.currentHead)
+
+    versions = [commit("before")]
+    expected = [pixels(document)]
+    layer = document.rootNode().childNodes()[args.layers // 2]
+    layer.paint(QRect(0, 0, width // 4, height // 4), 0xff20c040)
+    versions.append(commit("one layer repainted"))
+    expected.append(pixels(document))
+    store = ObjectStore(docker.getVersionsDir())
+    print(f"{width}x{height}, {args.layers} layers, {os.path.getsize(document.fileName()) / 2 ** 20:.1f} MB .kra; "
+          f"the versions differ in one layer")
+
+    def flip(restore):
+        times = []
+        for index in range(args.flips):
+            target = (index + 1) % 2     # start from version 1, flip to 0 and back
+            started = time.perf_counter()
+            restore(versions[target])
+            times.append(time.perf_counter() - started)
+            assert pixels(document) == expected[target], (restore, index)
+        return sum(times) / len(times)
+
+    saves = document.saves
+    full = flip(lambda version: full_restore(store, document, version))
+    full_saves, saves = document.saves - saves, document.saves
+    docker.versionCacheSpin.setValue(0)
+    incremental = flip(docker.restoreVersionFromDict)
+    incremental_saves = document.saves - saves
+
+    # A/B toggling: both versions stay open after their first restore
+    docker.versionCacheSpin.setValue(docker.versionCacheSpin.maximum())
+    flip(docker.restoreVersionFromDict)
+    open_before = len(fake_krita.Krita.instance().documents)
+    hits = docker.versionCache.hits
+    cached = flip(docker.restoreVersionFromDict)
+    assert docker.versionCache.hits - hits == args.flips
+    assert len(fake_krita.Krita.instance().documents) == open_before
+
+    # unsaved edits on top of a restore
+    layer = document.rootNode().childNodes()[0]
+    layer.paint(QRect(0, 0, 16, 16), 0xff000000)
+    started = time.perf_counter()
+    docker.restoreVersionFromDict(versions[1])
+    modified = time.perf_counter() - started
+    assert pixels(document) == expected[1]
+
+    print(f"  full restore          {full * 1000:8.0f} ms per flip, {full_saves / args.flips:.0f} saves")
+    print(f"  incremental restore   {incremental * 1000:8.0f} ms per flip, {incremental_saves / args.flips:.0f} saves")
+    print(f"  incremental, cached   {cached * 1000:8.0f} ms per flip "
+          f"({docker.versionCache.stats()['bytes'] / 2 ** 20:.0f} MB for {docker.versionCache.stats()['entries']} "
+          f"open versions)")
+    print(f"  incremental, unsaved edits {modified * 1000:5.0f} ms")
+    assert document.modified(), "a restore must leave the document for the user to save"
+    print(f"  status: {docker.restoreStatusLabel.text()}")
+    docker.commitWorker.stop()
+    shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
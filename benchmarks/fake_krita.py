@@ -0,0 +1,465 @@
+# fake_krita.py – just enough of Krita's Python API to run the plugins headless
+#
+# install() puts this module in sys.modules as `krita`, after which the real
+# `artai` / `artgit` packages import normally. Documents are 8-bit RGBA;
+# each node keeps only its painted bounds in memory, like Krita does.
+# Documents save to and open from a simplified .kra: maindoc.xml listing
+# the layers top first, and one deflated member of raw pixels per layer.
+import os
+import random
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+
+from PyQt5.QtCore import QByteArray, QObject, QRect, QUuid, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter
+from PyQt5.QtWidgets import QDockWidget
+
+
+class Node:
+    def __init__(self, name, node_type="paintlayer"):
+        self._name = name
+        self._type = node_type
+        self._visible = True
+        self._opacity = 255
+        self._blending = "normal"
+        self._children = []
+        self._parent = None
+        self._bounds = QRect()
+        self._image = None      # ARGB32 of _bounds
+        self._uuid = QUuid.createUuid()
+
+    # tree ---------------------------------------------------------------
+    def uniqueId(self):
+        return self._uuid
+
+    def name(self):
+        return self._name
+
+    def setName(self, name):
+        self._name = name
+        self._touch()
+
+    def type(self):
+        return self._type
+
+    def visible(self):
+        return self._visible
+
+    def setVisible(self, visible):
+        self._visible = visible
+        self._touch()
+
+    def opacity(self):
+        return self._opacity
+
+    def setOpacity(self, opacity):
+        self._opacity = opacity
+        self._touch()
+
+    def blendingMode(self):
+        return self._blending
+
+    def setBlendingMode(self, mode):
+        self._blending = mode
+        self._touch()
+
+    def childNodes(self):
+        return list(self._children)
+
+    def parentNode(self):
+        return self._parent
+
+    def addChildNode(self, child, above):
+        index = self._children.index(above) + 1 if above in self._children else len(self._children)
+        child._parent = self
+        self._children.insert(index, child)
+        self._touch()
+        return True
+
+    def removeChildNode(self, child):
+        if child in self._children:
+            self._children.remove(child)
+            child._parent = None
+            self._touch()
+            return True
+        return False
+
+    def setChildNodes(self, nodes):
+        for child in self._children:
+            child._parent = None
+        self._children = []
+        for child in nodes:
+            self.addChildNode(child, None)
+
+    def remove(self):
+        return self._parent.removeChildNode(self) if self._parent else False
+
+    # pixels -------------------------------------------------------------
+    def bounds(self):
+        bounds = QRect(self._bounds)
+        for child in self._children:
+            bounds = bounds.united(child.bounds())
+        return bounds
+
+    def pixelData(self, x, y, w, h):
+        out = QImage(w, h, QImage.Format_ARGB32)
+        out.fill(0)
+        if self._image is not None:
+            painter = QPainter(out)
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.drawImage(self._bounds.x() - x, self._bounds.y() - y, self._image)
+            painter.end()
+        return QByteArray(out.bits().asstring(out.byteCount()))
+
+    def projectionPixelData(self, x, y, w, h):
+        if self._type != "grouplayer":
+            return self.pixelData(x, y, w, h)
+        out = QImage(w, h, QImage.Format_ARGB32_Premultiplied)
+        out.fill(0)
+        painter = QPainter(out)
+        for child in self._children:
+            if child.visible():
+                painter.setOpacity(child.opacity() / 255.0)
+                data = bytes(child.projectionPixelData(x, y, w, h))
+                painter.drawImage(0, 0, QImage(data, w, h, QImage.Format_ARGB32))
+        painter.end()
+        out = out.convertToFormat(QImage.Format_ARGB32)
+        return QByteArray(out.bits().asstring(out.byteCount()))
+
+    def setPixelData(self, data, x, y, w, h):
+        rect = QRect(x, y, w, h)
+        if not self._bounds.contains(rect):
+            grown = self._bounds.united(rect)
+            image = QImage(grown.width(), grown.height(), QImage.Format_ARGB32)
+            image.fill(0)
+            if self._image is not None:
+                painter = QPainter(image)
+                painter.setCompositionMode(QPainter.CompositionMode_Source)
+                painter.drawImage(self._bounds.x() - grown.x(), self._bounds.y() - grown.y(), self._image)
+                painter.end()
+            self._bounds, self._image = grown, image
+        pixels = QImage(bytes(data), w, h, w * 4, QImage.Format_ARGB32)
+        painter = QPainter(self._image)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        painter.drawImage(x - self._bounds.x(), y - self._bounds.y(), pixels)
+        painter.end()
+        self._touch()
+        return True
+
+    def thumbnail(self, w, h):
+        document = self._document()
+        full = QImage(self.pixelData(0, 0, document.width(), document.height()),
+                      document.width(), document.height(), QImage.Format_ARGB32)
+        return full.scaled(w, h)
+
+    def clone(self):
+        node = Node(self._name, self._type)
+        node._visible, node._opacity, node._blending = self._visible, self._opacity, self._blending
+        node._bounds = QRect(self._bounds)
+        node._image = self._image.copy() if self._image is not None else None
+        for child in self._children:
+            node.addChildNode(child.clone(), None)
+        return node
+
+    def _touch(self):
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        owner = getattr(node, "_owner", None)
+        if owner is not None:
+            owner._modified = True
+
+    def _document(self):
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        return node._owner
+
+    def paint(self, rect, color):
+        """Test helper: fill `rect` with `color` (ARGB int)"""
+        image = QImage(rect.width(), rect.height(), QImage.Format_ARGB32)
+        image.fill(color)
+        self.setPixelData(image.bits().asstring(image.byteCount()), rect.x(), rect.y(),
+                          rect.width(), rect.height())
+
+
+class Document:
+    def __init__(self, width, height, file_name=""):
+        self._width, self._height = width, height
+        self._file_name = file_name
+        self._root = Node("root", "grouplayer")
+        self._root._owner = self
+        self._active = None
+        self._modified = False
+        self._x_res = 72
+        self._profile = "sRGB-elle-V2-srgbtrc.icc"
+        self.projection_refreshes = 0
+        self.saves = 0
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def colorModel(self):
+        return "RGBA"
+
+    def colorDepth(self):
+        return "U8"
+
+    def colorProfile(self):
+        return self._profile
+
+    def setColorSpace(self, model, depth, profile):
+        self._profile = profile
+        self._modified = True
+        return True
+
+    def xRes(self):
+        return self._x_res
+
+    def setResolution(self, value):
+        self._x_res = value
+        self._modified = True
+
+    def resizeImage(self, x, y, w, h):
+        self._width, self._height = w, h
+        self._modified = True
+
+    def fileName(self):
+        return self._file_name
+
+    def setFileName(self, name):
+        self._file_name = name
+
+    def modified(self):
+        return self._modified
+
+    def setModified(self, modified):
+        self._modified = modified
+
+    def save(self):
+        """Write the document like Krita: to a new file renamed over the old one"""
+        image_name = os.path.splitext(os.path.basename(self._file_name))[0]
+        members = []
+
+        def element(node, container):
+            for child in reversed(node.childNodes()):
+                filename = f"layer{len(members) + 2}"
+                attributes = {"name": child.name(), "filename": filename, "uuid": child.uniqueId().toString(),
+                              "nodetype": child.type(), "visible": str(int(child.visible())),
+                              "opacity": str(child.opacity()), "compositeop": child.blendingMode(),
+                              "x": "0", "y": "0"}
+                layer = ET.SubElement(container, "layer", attributes)
+                members.append((filename, child))
+                if child.type() == "grouplayer":
+                    element(child, ET.SubElement(layer, "layers"))
+
+        doc = ET.Element("DOC")
+        image = ET.SubElement(doc, "IMAGE", {"name": image_name, "width": str(self._width),
+                                             "height": str(self._height), "x-res": str(self._x_res),
+                                             "profile": self._profile})
+        element(self._root, ET.SubElement(image, "layers"))
+        tmp = self._file_name + ".saving"
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+            zf.writestr(zipfile.ZipInfo("mimetype"), "application/x-krita", zipfile.ZIP_STORED)
+            zf.writestr(zipfile.ZipInfo("maindoc.xml"), ET.tostring(doc), zipfile.ZIP_DEFLATED)
+            zf.writestr(zipfile.ZipInfo("documentinfo.xml"), f"<document-info><date>{time.time()}</date>"
+                                                             f"</document-info>", zipfile.ZIP_DEFLATED)
+            for filename, node in members:
+                if node._image is None:
+                    continue
+                b = node._bounds
+                header = f"{b.x()},{b.y()},{b.width()},{b.height()}\n".encode("ascii")
+                zf.writestr(zipfile.ZipInfo(f"{image_name}/layers/{filename}"),
+                            header + node._image.bits().asstring(node._image.byteCount()), zipfile.ZIP_DEFLATED)
+        os.replace(tmp, self._file_name)
+        self._modified = False
+        self.saves += 1
+        Krita.instance().notifier().imageSaved.emit(self._file_name)
+        return True
+
+    @classmethod
+    def _load(cls, path):
+        with zipfile.ZipFile(path) as zf:
+            image = ET.fromstring(zf.read("maindoc.xml")).find("IMAGE")
+            document = cls(int(image.get("width")), int(image.get("height")), path)
+            document._x_res = int(image.get("x-res"))
+            document._profile = image.get("profile")
+            names = set(zf.namelist())
+
+            def load(container, parent):
+                for layer in reversed(container.findall("layer")):
+                    node = Node(layer.get("name"), layer.get("nodetype"))
+                    node._uuid = QUuid(layer.get("uuid"))
+                    node._visible = layer.get("visible") == "1"
+                    node._opacity = int(layer.get("opacity"))
+                    node._blending = layer.get("compositeop")
+                    member = f"{image.get('name')}/layers/{layer.get('filename')}"
+                    if member in names:
+                        header, pixels = zf.read(member).split(b"\n", 1)
+                        x, y, w, h = map(int, header.split(b","))
+                        node._bounds = QRect(x, y, w, h)
+                        node._image = QImage(pixels, w, h, w * 4, QImage.Format_ARGB32).copy()
+                    parent.addChildNode(node, None)
+                    if layer.find("layers") is not None:
+                        load(layer.find("layers"), node)
+            load(image.find("layers"), document._root)
+        document._modified = False
+        return document
+
+    def close(self):
+        krita = Krita.instance()
+        if self in krita.documents:
+            krita.documents.remove(self)
+        return True
+
+    def rootNode(self):
+        return self._root
+
+    def createNode(self, name, node_type):
+        return Node(name, node_type)
+
+    def createGroupLayer(self, name):
+        return Node(name, "grouplayer")
+
+    def setActiveNode(self, node):
+        self._active = node
+
+    def activeNode(self):
+        return self._active
+
+    def refreshProjection(self):
+        self.projection_refreshes += 1
+
+    def waitForDone(self):
+        pass
+
+    def projection(self, x, y, w, h):
+        canvas = QImage(w, h, QImage.Format_ARGB32_Premultiplied)
+        canvas.fill(0)
+        painter = QPainter(canvas)
+
+        def draw(node):
+            for child in node.childNodes():
+                if not child.visible():
+                    continue
+                if child.type() == "grouplayer":
+                    draw(child)
+                elif child._image is not None:
+                    painter.setOpacity(child.opacity() / 255.0)
+                    painter.drawImage(child._bounds.x() - x, child._bounds.y() - y, child._image)
+        draw(self._root)
+        painter.end()
+        return canvas.convertToFormat(QImage.Format_ARGB32)
+
+    def thumbnail(self, w, h):
+        return self.projection(0, 0, self._width, self._height).scaled(w, h)
+
+
+class Notifier(QObject):
+    imageSaved = pyqtSignal(str)
+
+
+class Krita:
+    _instance = None
+
+    def __init__(self):
+        self._notifier = Notifier()
+        self.documents = []
+        self._active = None
+        self.extensions = []
+        self.docker_factories = []
+        self._app_data = tempfile.mkdtemp(prefix="fake_krita_")
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = Krita()
+        return cls._instance
+
+    def activeDocument(self):
+        return self._active
+
+    def activeWindow(self):
+        return None
+
+    def notifier(self):
+        return self._notifier
+
+    def openDocument(self, path):
+        try:
+            document = Document._load(path)
+        except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError):
+            return None
+        self.documents.append(document)
+        return document
+
+    def setActiveDocument(self, document):
+        self._active = document
+
+    def getAppDataLocation(self):
+        return self._app_data
+
+    def addExtension(self, extension):
+        self.extensions.append(extension)
+
+    def addDockWidgetFactory(self, factory):
+        self.docker_factories.append(factory)
+
+    def dockers(self):
+        return []
+
+
+class Extension:
+    def __init__(self, parent=None):
+        self.parent = parent
+
+
+class DockWidget(QDockWidget):
+    def canvasChanged(self, canvas):
+        pass
+
+
+class DockWidgetFactoryBase:
+    DockRight = 1
+    DockLeft = 2
+
+
+class DockWidgetFactory:
+    def __init__(self, name, position, cls):
+        self.name, self.position, self.cls = name, position, cls
+
+
+def synthetic_document(width, height, layers, fill=0.3, seed=1):
+    """A width x height document with `layers` paint layers of random rectangles.
+
+    Each layer covers about `fill` of the canvas; the layers are made the
+    active document.
+    """
+    rng = random.Random(seed)
+    document = Document(width, height)
+    side_w, side_h = int(width * fill ** 0.5), int(height * fill ** 0.5)
+    for index in range(layers):
+        node = document.createNode(f"Layer {index + 1}", "paintlayer")
+        rect = QRect(rng.randrange(0, width - side_w + 1), rng.randrange(0, height - side_h + 1),
+                     side_w, side_h)
+        node.paint(rect, QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)).rgba())
+        document.rootNode().addChildNode(node, None)
+    Krita.instance().setActiveDocument(document)
+    return document
+
+
+def install():
+    """Register this module as `krita` (idempotent)"""
+    module = sys.modules[__name__]
+    module.__all__ = ["Krita", "Extension", "DockWidget", "DockWidgetFactory", "DockWidgetFactoryBase",
+                      "Node", "Document"]
+    sys.modules.setdefault("krita", module)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    Krita.instance()    # its app data dir is a temp dir; created before anything is measured
+    return module